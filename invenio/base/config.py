@@ -446,6 +446,8 @@ CFG_BIBUPLOAD_SERIALIZE_RECORD_STRUCTURE = 1
 CFG_BIBUPLOAD_STRONG_TAGS = ['964', ]
 CFG_BIBUPLOAD_INTERNAL_DOI_PATTERN = "[^\w\W]"
 CFG_BIBUPLOAD_MATCH_DELETED_RECORDS = 1
+CFG_BIBWORKFLOW_DATA_COMPRESSION_THRESHOLD = 4096
+CFG_BIBWORKFLOW_PARALLEL_WORKERS = 0
 CFG_BIBWORKFLOW_WORKER = "worker_celery"
 CFG_BROKER_URL = "amqp://guest@localhost:5672//"
 CFG_CELERY_RESULT_BACKEND = "amqp"
@@ -454,6 +456,7 @@ CFG_ORGANIZATION_IDENTIFIER = ""
 CFG_CROSSREF_EMAIL = ""
 CFG_CROSSREF_PASSWORD = ""
 CFG_CROSSREF_USERNAME = ""
+CFG_DATACACHER_VERIFY_INTERVAL = 60
 CFG_DEVEL_SITE = 0
 CFG_DEVEL_TEST_DATABASE_ENGINES = {}
 CFG_DEVEL_TOOLS = []
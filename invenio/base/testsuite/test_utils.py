@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Test invenio.base.utils."""
+
+from invenio.base.wrappers import lazy_import
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+utils = lazy_import("invenio.base.utils")
+
+
+class TestTryToEval(InvenioTestCase):
+
+    """Test the evaluation of python expressions."""
+
+    def test_expressions(self):
+        """base - try_to_eval evaluates expressions like eval"""
+        self.assertEqual(utils.try_to_eval(''), None)
+        self.assertEqual(utils.try_to_eval(' \t1 + 1'), 2)
+        self.assertEqual(utils.try_to_eval(u'[x for x in range(3)]'),
+                         [0, 1, 2])
+        self.assertEqual(utils.try_to_eval('value * 2', value=3), 6)
+        self.assertEqual(utils.try_to_eval('value * 2', {'value': 4}), 8)
+        self.assertEqual(utils.try_to_eval('os.path.join("a", "b")'), 'a/b')
+        self.assertRaises(SyntaxError, utils.try_to_eval, 'value *')
+
+    def test_compiled_once(self):
+        """base - try_to_eval compiles each expression once"""
+        code = utils.compile_expression('value + 1')
+        self.assertTrue(utils.compile_expression('value + 1') is code)
+        self.assertEqual(utils.try_to_eval('value + 1', value=1), 2)
+        self.assertEqual(utils.try_to_eval('value + 1', value=2), 3)
+
+
+TEST_SUITE = make_test_suite(TestTryToEval)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
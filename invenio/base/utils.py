@@ -23,6 +23,8 @@ Utilities that could potentially exist in separate packages should be placed in
 this file.
 """
 
+import six
+
 from flask import has_app_context, current_app
 from werkzeug.utils import import_string, find_modules
 from functools import partial
@@ -66,6 +68,32 @@ autodiscover_user_settings = partial(import_module_from_packages,
 autodiscover_managers = partial(import_module_from_packages, 'manage')
 
 
+#: maximum number of compiled expressions kept by try_to_eval.
+TRY_TO_EVAL_CACHE_SIZE = 10000
+
+_try_to_eval_cache = {}
+
+
+def compile_expression(string):
+    """Return the code object of the python expression, compiled once.
+
+    The code objects are cached, the same expressions being evaluated over
+    and over, e.g. by the JSONAlchemy readers.  Like ``eval``, leading
+    spaces and tabs are ignored.
+    """
+    if not isinstance(string, six.string_types):
+        return string
+    try:
+        return _try_to_eval_cache[string]
+    except KeyError:
+        pass
+    code = compile(string.lstrip(' \t'), '<string>', 'eval')
+    if len(_try_to_eval_cache) >= TRY_TO_EVAL_CACHE_SIZE:
+        _try_to_eval_cache.clear()
+    _try_to_eval_cache[string] = code
+    return code
+
+
 def try_to_eval(string, context={}, **general_context):
     """Take care of evaluating the python expression.
 
@@ -86,7 +114,8 @@ def try_to_eval(string, context={}, **general_context):
     while True:
         try:
             # kwalitee: disable=eval
-            res = eval(string, globals().update(general_context), locals())
+            res = eval(compile_expression(string),
+                       globals().update(general_context), locals())
         except NameError as err:
             #Try first to import using werkzeug import_string
             try:
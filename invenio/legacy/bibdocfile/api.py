@@ -77,6 +77,7 @@ except ImportError:
 from flask import current_app
 from datetime import datetime
 from mimetypes import MimeTypes
+from multiprocessing.pool import ThreadPool
 from thread import get_ident
 from six import iteritems
 from weakref import ref
@@ -168,6 +169,16 @@ CFG_BIBDOCFILE_MD5_THRESHOLD = 256 * 1024
 #: chunks loaded by the Python MD5 algorithm.
 CFG_BIBDOCFILE_MD5_BUFFER = 1024 * 1024
 
+#: number of threads verifying checksums concurrently.
+CFG_BIBDOCFILE_MD5_WORKERS = 4
+
+#: name of the file keeping, in each folder, the size and modification time
+#: of the files whose checksum has last been verified.
+CFG_BIBDOCFILE_MD5_CHECK_FILENAME = '.md5check'
+
+#: number of identifiers per query when loading many records at once.
+CFG_BIBDOCFILE_BULK_LOAD_CHUNK_SIZE = 1000
+
 #: whether to normalize e.g. ".JPEG" and ".jpg" into .jpeg.
 CFG_BIBDOCFILE_STRONG_FORMAT_NORMALIZATION = False
 
@@ -714,7 +725,7 @@ class BibRecDocs(object):
         self.human_readable = human_readable
         self.deleted_too = deleted_too
         self.attachment_types = {} # dictionary docname->attachment type
-        self._bibdocs = []
+        self._bibdocs = {}
         self.dirty = True
 
     @property
@@ -1563,6 +1574,144 @@ class BibRecDocs(object):
         return " ".join(texts)
 
 
+def _run_sql_in_chunks(query, values):
+    """
+    Run a query with an C{IN (%s)} clause on all the given values, at most
+    L{CFG_BIBDOCFILE_BULK_LOAD_CHUNK_SIZE} values at once.
+
+    @return: the rows of all the queries.
+    @rtype: list
+    """
+    values = list(values)
+    rows = []
+    for i in range(0, len(values), CFG_BIBDOCFILE_BULK_LOAD_CHUNK_SIZE):
+        chunk = values[i:i + CFG_BIBDOCFILE_BULK_LOAD_CHUNK_SIZE]
+        rows.extend(run_sql(query % ','.join(['%s'] * len(chunk)), chunk))
+    return rows
+
+
+def get_bibrecdocs(recids, deleted_too=False, human_readable=False,
+                   scan_filesystem=True):
+    """
+    Load the documents attached to many records at once.
+
+    Documents, links, formats, versions, checksums and MoreInfo of all the
+    records are read with a few queries, instead of several queries per
+    record and per document as done by L{BibRecDocs}.
+
+    @param recids: the record identifiers.
+    @type recids: iterable of integers
+    @param deleted_too: see L{BibRecDocs}.
+    @type deleted_too: bool
+    @param human_readable: see L{BibRecDocs}.
+    @type human_readable: bool
+    @param scan_filesystem: whether to list the files of the documents from
+        their directories. If False, or if
+        C{CFG_BIBDOCFILE_ENABLE_BIBDOCFSINFO_CACHE} is enabled, the files
+        are listed from the I{bibdocfsinfo} table instead.
+    @type scan_filesystem: bool
+    @return: the L{BibRecDocs} of every record.
+    @rtype: dict of recid -> BibRecDocs
+    """
+    bibrecdocs = {}
+    for recid in recids:
+        bibrecdocs[int(recid)] = BibRecDocs(recid, deleted_too=deleted_too,
+                                            human_readable=human_readable)
+    if not bibrecdocs:
+        return bibrecdocs
+
+    query = """SELECT brbd.id_bibrec, brbd.id_bibdoc, brbd.docname, brbd.type
+               FROM bibrec_bibdoc AS brbd JOIN bibdoc AS bd
+               ON bd.id=brbd.id_bibdoc WHERE brbd.id_bibrec IN (%s)"""
+    if not deleted_too:
+        query += " AND bd.status<>'DELETED'"
+    attachments = _run_sql_in_chunks(query + " ORDER BY brbd.docname ASC",
+                                     bibrecdocs.keys())
+    docids = set(row[1] for row in attachments)
+
+    data = {}
+    for docid, status, cd, md, td, doctype, storagename in \
+            _run_sql_in_chunks("""SELECT id, status, creation_date,
+                                  modification_date, text_extraction_date,
+                                  doctype, docname FROM bibdoc
+                                  WHERE id IN (%s)""", docids):
+        data[docid] = {"id": docid,
+                       "basedir": _make_base_dir(docid),
+                       "status": status,
+                       "cd": cd,
+                       "md": md,
+                       "td": td,
+                       "doctype": doctype,
+                       "storagename": storagename,
+                       "bibrec_links": [],
+                       "bibrec_types": [],
+                       "extensions": set(),
+                       "more_info": {}}
+
+    for docid, recid, doctype, docname in \
+            _run_sql_in_chunks("""SELECT id_bibdoc, id_bibrec, type, docname
+                                  FROM bibrec_bibdoc
+                                  WHERE id_bibdoc IN (%s)""", docids):
+        container = data[docid]
+        if not container["bibrec_links"]:
+            container["bibrec_links"].append(
+                {"recid": recid, "doctype": doctype, "docname": docname})
+        container["bibrec_types"].append((recid, doctype, docname))
+
+    for docid, namespace, data_key, data_value in \
+            _run_sql_in_chunks("""SELECT id_bibdoc, namespace, data_key,
+                                  data_value FROM bibdocmoreinfo
+                                  WHERE id_bibdoc IN (%s) AND version IS NULL
+                                  AND format IS NULL AND id_rel IS NULL""",
+                               docids):
+        data[docid]["more_info"].setdefault(namespace, {})[data_key] = \
+            cPickle.loads(data_value)
+
+    fsinfo = None
+    if CFG_BIBDOCFILE_ENABLE_BIBDOCFSINFO_CACHE or not scan_filesystem:
+        fsinfo = dict((docid, []) for docid in docids)
+        for row in _run_sql_in_chunks("""SELECT id_bibdoc, version, format,
+                                         cd, md, checksum, filesize
+                                         FROM bibdocfsinfo
+                                         WHERE id_bibdoc IN (%s)""", docids):
+            fsinfo[row[0]].append(row[1:])
+            data[row[0]]["extensions"].add(row[2])
+    else:
+        for container in data.itervalues():
+            fprefix = container["storagename"] or "content"
+            try:
+                container["extensions"] = set(
+                    [fname[len(fprefix):].rsplit(";", 1)[0]
+                     for fname in os.listdir(container["basedir"])
+                     if fname.startswith(fprefix)])
+            except OSError:
+                current_app.logger.warning(
+                    "Could not retrieve available formats", exc_info=True)
+
+    for recid, docid, docname, attachment_type in attachments:
+        # every record gets its own instance, as with BibRecDocs
+        container = copy.deepcopy(data[docid])
+        plugin = BibDoc._get_plugin(container["doctype"],
+                                    container["extensions"])
+        if plugin:
+            bibdoc = plugin['create_instance'](
+                docid=docid, human_readable=human_readable,
+                initial_data=container)
+        else:
+            bibdoc = BibDoc(docid=docid, human_readable=human_readable,
+                            initial_data=container)
+        if fsinfo is not None:
+            bibdoc._docfiles = bibdoc._list_files_from_fsinfo(fsinfo[docid])
+        else:
+            bibdoc._docfiles = bibdoc._list_files_from_disk()
+        bibdoc.dirty = False
+        bibrecdocs[recid]._bibdocs[docname] = (bibdoc, attachment_type)
+
+    for recdocs in bibrecdocs.itervalues():
+        recdocs.dirty = False
+    return bibrecdocs
+
+
 class BibDoc(object):
     """
     This class represents one document (i.e. a set of files with different
@@ -1625,16 +1774,19 @@ class BibDoc(object):
         specifying recid, docname and doctype without specifying docid results in
         attaching newly created document to a record
         """
+        if initial_data is None:
+            initial_data = BibDoc._retrieve_data(docid)
+
         # docid is known, the document already exists
-        res2 = run_sql("SELECT id_bibrec, type, docname FROM bibrec_bibdoc WHERE id_bibdoc=%s", (docid,))
+        if "bibrec_types" in initial_data:
+            res2 = initial_data["bibrec_types"]
+        else:
+            res2 = run_sql("SELECT id_bibrec, type, docname FROM bibrec_bibdoc WHERE id_bibdoc=%s", (docid,))
         self.bibrec_types = [(r[0], r[1], r[2]) for r in res2 ] # just in case the result was behaving like tuples but was something else
         if not res2:
             # fake attachment
             self.bibrec_types = [(0, None, "fake_name_for_unattached_document")]
 
-        if initial_data is None:
-            initial_data = BibDoc._retrieve_data(docid)
-
         self._docfiles = []
         self.__md5s = None
         self._related_files = {}
@@ -1650,7 +1802,8 @@ class BibDoc(object):
         self.doctype = initial_data["doctype"]
         self.storagename = initial_data["storagename"] # the old docname -> now used as a storage name for old records
 
-        self.more_info = BibDocMoreInfo(self.id)
+        self.more_info = BibDocMoreInfo(self.id,
+            cache_data=initial_data.get("more_info"))
         self.dirty = True
         self.dirty_related_files = True
         self.last_action = 'init'
@@ -1779,11 +1932,7 @@ class BibDoc(object):
             extensions = data["extensions"]
 
         # Loading an appropriate plugin (by default a generic BibDoc)
-        used_plugin = None
-
-        for plugin in get_plugins():
-            if plugin['supports'](doctype, extensions):
-                used_plugin = plugin
+        used_plugin = BibDoc._get_plugin(doctype, extensions)
 
         if not a_type:
             a_type = doctype or 'Main'
@@ -1806,6 +1955,15 @@ class BibDoc(object):
                       human_readable=human_readable,
                       initial_data=data)
 
+    @staticmethod
+    def _get_plugin(doctype, extensions):
+        """Return the plugin handling the given document, if any."""
+        used_plugin = None
+        for plugin in get_plugins():
+            if plugin['supports'](doctype, extensions):
+                used_plugin = plugin
+        return used_plugin
+
     def attach_to_record(self, recid, a_type, docname):
         """ Attaches given document to a record given by its identifier.
             @param recid The identifier of the record
@@ -2665,6 +2823,50 @@ class BibDoc(object):
             ret.append("%s %s '%s', format: '%s', version: %i, size: %s, checksum: '%s'" % (row[6].strftime('%Y-%m-%d %H:%M:%S'), row[0], row[1], row[2], row[3], nice_size(row[4]), row[5]))
         return ret
 
+    def _list_files_from_fsinfo(self, rows):
+        """
+        Return the BibDocFile instances described by the given rows of the
+        I{bibdocfsinfo} table, without accessing the filesystem.
+
+        @param rows: (version, format, cd, md, checksum, filesize) tuples.
+        @type rows: list of tuples
+        @rtype: list of BibDocFile
+        """
+        docfiles = []
+        for version, docformat, cd, md, checksum, size in rows:
+            filepath = self.get_filepath(docformat, version)
+            docfiles.append(BibDocFile(
+                filepath, self.bibrec_types,
+                version, docformat,  self.id, self.status, checksum,
+                self.more_info, human_readable=self.human_readable, cd=cd, md=md, size=size, bibdoc=self))
+        return docfiles
+
+    def _list_files_from_disk(self):
+        """
+        Return the BibDocFile instances of the files found in the document
+        directory.
+
+        @rtype: list of BibDocFile
+        """
+        docfiles = []
+        if os.path.exists(self.basedir):
+            files = os.listdir(self.basedir)
+            files.sort()
+            for afile in files:
+                if not afile.startswith('.'):
+                    try:
+                        filepath = os.path.join(self.basedir, afile)
+                        dummy, dummy, docformat, fileversion = decompose_file_with_version(filepath)
+                        checksum = self.md5s.get_checksum(afile)
+                        docfiles.append(BibDocFile(filepath, self.bibrec_types,
+                                fileversion, docformat,
+                                self.id, self.status, checksum,
+                                self.more_info, human_readable=self.human_readable, bibdoc=self))
+                    except Exception as e:
+                        register_exception()
+                        raise InvenioBibDocFileError, e
+        return docfiles
+
     def _build_file_list(self, context=''):
         """
         Lists all files attached to the bibdoc. This function should be
@@ -2730,29 +2932,9 @@ class BibDoc(object):
         if CFG_BIBDOCFILE_ENABLE_BIBDOCFSINFO_CACHE and context == 'init':
             ## In normal init context we read from DB
             res = run_sql("SELECT version, format, cd, md, checksum, filesize FROM bibdocfsinfo WHERE id_bibdoc=%s", (self.id, ))
-            for version, docformat, cd, md, checksum, size in res:
-                filepath = self.get_filepath(docformat, version)
-                self._docfiles.append(BibDocFile(
-                    filepath, self.bibrec_types,
-                    version, docformat,  self.id, self.status, checksum,
-                    self.more_info, human_readable=self.human_readable, cd=cd, md=md, size=size, bibdoc=self))
+            self._docfiles = self._list_files_from_fsinfo(res)
         else:
-            if os.path.exists(self.basedir):
-                files = os.listdir(self.basedir)
-                files.sort()
-                for afile in files:
-                    if not afile.startswith('.'):
-                        try:
-                            filepath = os.path.join(self.basedir, afile)
-                            dummy, dummy, docformat, fileversion = decompose_file_with_version(filepath)
-                            checksum = self.md5s.get_checksum(afile)
-                            self._docfiles.append(BibDocFile(filepath, self.bibrec_types,
-                                    fileversion, docformat,
-                                    self.id, self.status, checksum,
-                                    self.more_info, human_readable=self.human_readable, bibdoc=self))
-                        except Exception as e:
-                            register_exception()
-                            raise InvenioBibDocFileError, e
+            self._docfiles = self._list_files_from_disk()
         if context in ('init', 'init_from_disk'):
             return
         else:
@@ -3553,12 +3735,9 @@ class Md5Folder(object):
     def store(self):
         """Store the current md5 dictionary into .md5"""
         try:
-            old_umask = os.umask(0o022)
-            md5file = open(os.path.join(self.folder, ".md5"), "w")
-            for key, value in self.md5s.items():
-                md5file.write('%s *%s\n' % (value, key))
-            md5file.close()
-            os.umask(old_umask)
+            _write_md5_file(os.path.join(self.folder, ".md5"),
+                            ['%s *%s\n' % (value, key)
+                             for key, value in self.md5s.items()])
         except Exception as e:
             register_exception(alert_admin=True)
             raise InvenioBibDocFileError("Encountered an exception while storing .md5 for folder '%s': '%s'" % (self.folder, e))
@@ -3640,6 +3819,142 @@ def calculate_md5(filename, force_internal=False):
     else:
         return calculate_md5_external(filename)
 
+def _write_md5_file(path, rows):
+    """Write the rows of a checksum file, readable by everybody.
+
+    The mode is set explicitly rather than through the umask, which is
+    shared by all the threads of the process."""
+    md5file = open(path, "w")
+    try:
+        md5file.writelines(rows)
+    finally:
+        md5file.close()
+    os.chmod(path, 0o644)
+
+def _load_md5_check(folder):
+    """Return the (size, mtime) of the files of the folder whose checksum
+    has last been verified."""
+    ret = {}
+    path = os.path.join(folder, CFG_BIBDOCFILE_MD5_CHECK_FILENAME)
+    if os.path.exists(path):
+        for row in open(path, "r"):
+            try:
+                size, mtime, filename = row.rstrip('\n').split(' ', 2)
+                ret[filename[1:]] = (int(size), int(mtime))
+            except ValueError:
+                continue
+    return ret
+
+def _store_md5_check(folder, verified):
+    """Store the (size, mtime) of the files whose checksum has been
+    verified."""
+    try:
+        _write_md5_file(os.path.join(folder, CFG_BIBDOCFILE_MD5_CHECK_FILENAME),
+                        ['%i %i *%s\n' % (size, mtime, filename)
+                         for filename, (size, mtime) in verified.items()])
+    except Exception as e:
+        register_exception(alert_admin=True)
+        raise InvenioBibDocFileError("Encountered an exception while storing %s for folder '%s': '%s'" % (CFG_BIBDOCFILE_MD5_CHECK_FILENAME, folder, e))
+
+def verify_md5_folder(folder, incremental=False):
+    """
+    Verify the checksums of the files of a folder against its I{.md5} file.
+
+    Files that are not yet in the I{.md5} file get their checksum added to
+    it.  The size and modification time of the correct files are recorded,
+    so that in incremental mode unchanged files are not read again.
+
+    @param folder: the folder of a document.
+    @type folder: string
+    @param incremental: whether to skip the files whose size and
+        modification time did not change since their last verification.
+    @type incremental: bool
+    @return: the failures, as (filename, expected checksum, computed
+        checksum) tuples. The computed checksum is None for missing files.
+    @rtype: list of tuples
+    """
+    md5folder = Md5Folder(folder)
+    verified = incremental and _load_md5_check(folder) or {}
+    failures = []
+    new_files = False
+    filenames = set(filename for filename in os.listdir(folder)
+                    if not filename.startswith('.'))
+    for filename in sorted(filenames | set(md5folder.md5s)):
+        expected = md5folder.md5s.get(filename)
+        if filename not in filenames:
+            failures.append((filename, expected, None))
+            continue
+        stat = os.stat(os.path.join(folder, filename))
+        size_mtime = (stat.st_size, int(stat.st_mtime))
+        if expected is not None and verified.get(filename) == size_mtime:
+            continue
+        computed = calculate_md5(os.path.join(folder, filename),
+                                 force_internal=True)
+        if expected is None:
+            md5folder.md5s[filename] = computed
+            new_files = True
+        elif computed != expected:
+            failures.append((filename, expected, computed))
+            verified.pop(filename, None)
+            continue
+        verified[filename] = size_mtime
+    if new_files:
+        md5folder.store()
+    for filename in set(verified) - filenames:
+        del verified[filename]
+    _store_md5_check(folder, verified)
+    return failures
+
+def _verify_md5_folder_worker(args):
+    """Verify a folder in a worker thread, catching its errors."""
+    folder, incremental = args
+    try:
+        return folder, verify_md5_folder(folder, incremental), None
+    except Exception as e:
+        return folder, [], e
+
+def verify_md5_folders(folders, workers=CFG_BIBDOCFILE_MD5_WORKERS,
+                       incremental=False, progress_path=None):
+    """
+    Verify the checksums of many folders with a pool of threads.
+
+    Hashing is done with large buffered reads, during which the threads
+    release the interpreter lock, so that the disks are kept busy.
+
+    @param folders: the folders of the documents.
+    @type folders: iterable of strings
+    @param workers: the number of threads.
+    @type workers: integer
+    @param incremental: see L{verify_md5_folder}.
+    @type incremental: bool
+    @param progress_path: a file where the verified folders are recorded.
+        The folders already listed in it are skipped, so that an
+        interrupted verification can be resumed.
+    @type progress_path: string
+    @return: a generator of (folder, failures, error) tuples, in completion
+        order. C{error} is the exception raised while verifying the folder,
+        if any.
+    """
+    done = set()
+    if progress_path and os.path.exists(progress_path):
+        done = set(row.rstrip('\n') for row in open(progress_path, "r"))
+    progress = progress_path and open(progress_path, "a")
+    pool = ThreadPool(max(1, workers))
+    try:
+        for folder, failures, error in pool.imap_unordered(
+                _verify_md5_folder_worker,
+                ((folder, incremental) for folder in folders
+                 if folder not in done)):
+            if progress and error is None:
+                progress.write(folder + '\n')
+                progress.flush()
+            yield folder, failures, error
+    finally:
+        pool.terminate()
+        pool.join()
+        if progress:
+            progress.close()
+
 
 def bibdocfile_url_to_bibrecdocs(url):
     """Given an URL in the form CFG_SITE_[SECURE_]URL/CFG_SITE_RECORD/xxx/files/... it returns
@@ -4028,7 +4343,8 @@ class MoreInfo(object):
        """
 
     def __init__(self, docid = None, version = None, docformat = None,
-                 relation = None, cache_only = False, cache_reads = True, initial_data = None):
+                 relation = None, cache_only = False, cache_reads = True,
+                 initial_data = None, cache_data = None):
         """
         @param cache_only Determines if MoreInfo object should be created in
                           memory only or reflected in the database
@@ -4047,6 +4363,11 @@ class MoreInfo(object):
                              instance from serialised value
         @type initial_data string
 
+        @param cache_data Content of the cache as already read from the
+                          database (e.g. by a bulk query). The cache is not
+                          populated from the database again.
+        @type cache_data dictionary
+
         """
         self.docid = docid
         self.version = version
@@ -4066,7 +4387,9 @@ class MoreInfo(object):
 
         self.cache_reads = cache_reads
 
-        if not self.cache_only:
+        if cache_data is not None:
+            self.cache.update(cache_data)
+        elif not self.cache_only:
             self.populate_from_database()
 
     @staticmethod
@@ -4361,10 +4684,12 @@ class BibDocMoreInfo(MoreInfo):
     @note: this class will be extended in the future to hold all the new auxiliary
     information about a document.
     """
-    def __init__(self, docid, cache_only = False, initial_data = None):
+    def __init__(self, docid, cache_only = False, initial_data = None,
+                 cache_data = None):
         if not (type(docid) in (long, int) and docid > 0):
             raise ValueError("docid is not a positive integer, but %s." % docid)
-        MoreInfo.__init__(self, docid, cache_only = cache_only, initial_data = initial_data)
+        MoreInfo.__init__(self, docid, cache_only = cache_only,
+                          initial_data = initial_data, cache_data = cache_data)
 
         if 'descriptions' not in self:
             self['descriptions'] = {}
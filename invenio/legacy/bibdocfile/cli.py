@@ -43,8 +43,9 @@ from invenio.config import CFG_SITE_URL, CFG_BIBDOCFILE_FILEDIR, \
 from invenio.legacy.bibdocfile.api import BibRecDocs, BibDoc, InvenioBibDocFileError, \
     nice_size, check_valid_url, clean_url, get_docname_from_url, \
     guess_format_from_url, KEEP_OLD_VALUE, decompose_bibdocfile_fullpath, \
-    bibdocfile_url_to_bibdoc, decompose_bibdocfile_url, \
-    CFG_BIBDOCFILE_AVAILABLE_FLAGS
+    bibdocfile_url_to_bibdoc, decompose_bibdocfile_url, get_bibrecdocs, \
+    verify_md5_folders, _make_base_dir, CFG_BIBDOCFILE_AVAILABLE_FLAGS, \
+    CFG_BIBDOCFILE_BULK_LOAD_CHUNK_SIZE, CFG_BIBDOCFILE_MD5_WORKERS
 
 from intbitset import intbitset
 from invenio.legacy.search_engine import perform_request_search
@@ -561,6 +562,9 @@ Examples:
 
     housekeeping_options = OptionGroup(parser, 'Actions for housekeeping')
     housekeeping_options.add_option("--check-md5", action='store_const', const='check-md5', dest='action', help='check md5 checksum validity of files')
+    housekeeping_options.add_option("--with-md5-workers", dest='md5_workers', type='int', default=CFG_BIBDOCFILE_MD5_WORKERS, help='number of files checked concurrently by --check-md5 (default %i)' % CFG_BIBDOCFILE_MD5_WORKERS, metavar='NUMBER')
+    housekeeping_options.add_option("--with-md5-incremental", dest='md5_incremental', action='store_true', default=False, help='when checking md5, skip the files whose size and modification time did not change since they were last checked')
+    housekeeping_options.add_option("--with-md5-progress", dest='md5_progress', help='when checking md5, record the checked documents in this file and skip the ones already recorded, to resume an interrupted check', metavar='PATH')
     housekeeping_options.add_option("--check-format", action='store_const', const='check-format', dest='action', help='check if any format-related inconsistences exists')
     housekeeping_options.add_option("--check-duplicate-docnames", action='store_const', const='check-duplicate-docnames', dest='action', help='check for duplicate docnames associated with the same record')
     housekeeping_options.add_option("--update-md5", action='store_const', const='update-md5', dest='action', help='update md5 checksum of files')
@@ -1002,8 +1006,20 @@ def cli_get_info(options):
         for docid in cli_docids_iterator(options):
             sys.stdout.write(str(BibDoc.create_instance(docid, human_readable=human_readable)))
     else:
+        def print_info(recids):
+            """Print the info of a batch of recids."""
+            bibrecdocs = get_bibrecdocs(recids, deleted_too=deleted_docs, human_readable=human_readable)
+            for recid in recids:
+                sys.stdout.write(str(bibrecdocs[recid]))
+
+        recids = []
         for recid in cli_recids_iterator(options):
-            sys.stdout.write(str(BibRecDocs(recid, deleted_too=deleted_docs, human_readable=human_readable)))
+            recids.append(int(recid))
+            if len(recids) >= CFG_BIBDOCFILE_BULK_LOAD_CHUNK_SIZE:
+                print_info(recids)
+                recids = []
+        if recids:
+            print_info(recids)
 
 def cli_purge(options):
     """Purge the matched docids."""
@@ -1085,15 +1101,23 @@ def cli_get_disk_usage(options):
 def cli_check_md5(options):
     """Check the md5 sums of a docid_set."""
     failures = 0
-    for docid in cli_docids_iterator(options):
-        bibdoc = BibDoc.create_instance(docid)
-        if bibdoc.md5s.check():
+    folders = (_make_base_dir(docid) for docid in cli_docids_iterator(options))
+    for folder, folder_failures, error in verify_md5_folders(folders,
+            workers=getattr(options, 'md5_workers', CFG_BIBDOCFILE_MD5_WORKERS),
+            incremental=getattr(options, 'md5_incremental', False),
+            progress_path=getattr(options, 'md5_progress', None)):
+        docid = int(os.path.basename(folder))
+        if error is not None:
+            failures += 1
+            print_info(docid, 'error while checking %s: %s' % (folder, error))
+        elif not folder_failures:
             print_info(docid, 'checksum OK')
-        else:
-            for afile in bibdoc.list_all_files():
-                if not afile.check():
-                    failures += 1
-                    print_info(docid, '%s failing checksum!' % afile.get_full_path())
+        for filename, dummy_expected, computed in folder_failures:
+            failures += 1
+            if computed is None:
+                print_info(docid, '%s missing!' % os.path.join(folder, filename))
+            else:
+                print_info(docid, '%s failing checksum!' % os.path.join(folder, filename))
     if failures:
         print(wrap_text_in_a_box('%i files failing' % failures , style='conclusion'))
     else:
@@ -370,6 +370,32 @@ def get_preformatted_record(recID, of, decompress=zlib.decompress):
         return None, None
 
 
+def get_preformatted_records(recIDs, of, decompress=zlib.decompress):
+    """Return the preformatted records with ids 'recIDs' and format 'of'.
+
+    :param recIDs: the ids of the records to fetch
+    :param of: the output format code
+    :param decompress: the method used to decompress the preformatted record in database
+    :return: dictionary of (formatted record, needs 2nd pass) tuples by
+        record id, without the records not preformatted in the format
+    """
+    recIDs = list(recIDs)
+    if not recIDs:
+        return {}
+    # Decide whether to use DB slave:
+    if of in ('xm', 'recstruct'):
+        run_on_slave = False # for master formats, use DB master
+    else:
+        run_on_slave = True # for other formats, we can use DB slave
+    query = """SELECT id_bibrec, value, needs_2nd_pass FROM bibfmt
+               WHERE id_bibrec IN (%s) AND format = %%s""" % \
+        ', '.join(['%s'] * len(recIDs))
+    params = recIDs + [of]
+    res = run_sql(query, params, run_on_slave=run_on_slave)
+    return dict((recID, (decompress(value), bool(needs_2nd_pass)))
+                for recID, value, needs_2nd_pass in res)
+
+
 def save_preformatted_record(recID, of, res, needs_2nd_pass=False,
                              low_priority=False, compress=zlib.compress):
     """Store preformated record in the database."""
@@ -32,7 +32,10 @@ import sys
 import time
 import fnmatch
 import inspect
+from collections import deque
 from datetime import datetime
+from itertools import izip, repeat
+from multiprocessing import Pool
 from six import iteritems
 
 from invenio.config import CFG_SOLR_URL
@@ -45,7 +48,9 @@ from invenio.legacy.bibindex.engine_config import CFG_MAX_MYSQL_THREADS, \
      CFG_BIBINDEX_UPDATE_MODE, \
      CFG_BIBINDEX_TOKENIZER_TYPE, \
      CFG_BIBINDEX_WASH_INDEX_TERMS, \
-     CFG_BIBINDEX_SPECIAL_TAGS
+     CFG_BIBINDEX_SPECIAL_TAGS, \
+     CFG_BIBINDEX_FLUSH_CHUNK_SIZE, \
+     CFG_BIBINDEX_FLUSH_MAX_BYTES
 from invenio.legacy.bibauthority.config import \
      CFG_BIBAUTHORITY_CONTROLLED_FIELDS_BIBLIOGRAPHIC
 from invenio.legacy.bibauthority.engine import get_index_strings_by_control_no,\
@@ -53,12 +58,14 @@ from invenio.legacy.bibauthority.engine import get_index_strings_by_control_no,\
 from invenio.legacy.search_engine import perform_request_search, \
      get_synonym_terms, \
      search_pattern
-from invenio.legacy.dbquery import run_sql, DatabaseError, serialize_via_marshal, \
+from invenio.legacy.dbquery import run_sql, run_sql_many, DatabaseError, \
+     IntegrityError, serialize_via_marshal, \
      deserialize_via_marshal, wash_table_column_name
 from invenio.legacy.bibindex.engine_washer import wash_index_term
 from invenio.legacy.bibsched.bibtask import task_init, write_message, get_datetime, \
     task_set_option, task_get_option, task_get_task_param, \
-    task_update_progress, task_sleep_now_if_required
+    task_update_progress, task_sleep_now_if_required, \
+    task_init_worker_process
 from intbitset import intbitset
 from invenio.ext.logging import register_exception
 from invenio.legacy.bibrank.adminlib import get_def_name
@@ -114,6 +121,7 @@ nb_char_in_line = 50  # for verbose pretty printing
 chunksize = 1000 # default size of chunks that the records will be treated by
 base_process_size = 4500 # process base size
 _last_word_table = None
+_collecting_word_table = None # word table of the worker processes
 
 
 _TOKENIZERS = load_tokenizers()
@@ -603,6 +611,51 @@ def chunk_generator(rng):
             current_low += chunksize
 
 
+def split_recIDs_in_chunks(recIDs, opt_flush):
+    """Split the recIDs range list into the (low, high) chunks of records
+    treated at once, of at most chunksize records and never crossing a
+    flush, which happens after every OPT_FLUSH records.
+    """
+    flush_count = 0
+    for arange in recIDs:
+        i_low = arange[0]
+        chunksize_count = 0
+        while i_low <= arange[1]:
+            i_high = min(i_low + opt_flush - flush_count - 1, arange[1])
+            i_high = min(i_low + chunksize - chunksize_count - 1, i_high)
+            yield i_low, i_high
+            flush_count = flush_count + i_high - i_low + 1
+            chunksize_count = chunksize_count + i_high - i_low + 1
+            if chunksize_count >= chunksize:
+                chunksize_count = 0
+            if flush_count >= opt_flush:
+                flush_count = 0
+            i_low = i_high + 1
+
+
+def _collect_recID_range_terms(recID1, recID2):
+    """Collect terms in a worker process of WordTable.collect_terms_in_pool()."""
+    return _collecting_word_table.collect_recID_range_terms(recID1, recID2)
+
+
+def _chunks_by_size(rows, max_size=CFG_BIBINDEX_FLUSH_MAX_BYTES):
+    """Split (term, hitlist) ROWS into lists not exceeding MAX_SIZE bytes,
+    so that multi-row statements stay within the packet size of the server.
+    """
+    chunk = []
+    chunk_size = 0
+    for row in rows:
+        row_size = len(row[0]) + len(row[1])
+        if chunk and chunk_size + row_size > max_size:
+            yield chunk
+            chunk = []
+            chunk_size = 0
+        chunk.append(row)
+        chunk_size += row_size
+    if chunk:
+        yield chunk
+
+
 class AbstractIndexTable(object):
     """
         This class represents an index table in database.
@@ -661,10 +714,14 @@ class AbstractIndexTable(object):
         nb_words_total = len(self.value)
         nb_words_report = int(nb_words_total / 10.0)
         nb_words_done = 0
-        for word in self.value.keys():
-            self.put_word_into_db(word)
-            nb_words_done += 1
-            if nb_words_report != 0 and ((nb_words_done % nb_words_report) == 0):
+        words = self.value.keys()
+        for i in xrange(0, nb_words_total, CFG_BIBINDEX_FLUSH_CHUNK_SIZE):
+            chunk = words[i:i + CFG_BIBINDEX_FLUSH_CHUNK_SIZE]
+            self.put_words_into_db(chunk)
+            nb_words_done += len(chunk)
+            if nb_words_report != 0 and \
+                   (nb_words_done // nb_words_report) > \
+                   ((nb_words_done - len(chunk)) // nb_words_report):
                 write_message('......processed %d/%d words' % \
                               (nb_words_done, nb_words_total))
                 percentage_display = get_percentage_completed(nb_words_done, nb_words_total)
@@ -739,6 +796,64 @@ class AbstractIndexTable(object):
         if not set: # never store empty words
             run_sql("DELETE FROM %s WHERE term=%%s" % wash_table_column_name(self.table_name), (word,)) # kwalitee: disable=sql
 
+    def put_words_into_db(self, words):
+        """Flush many words to the database at once.
+
+        This is the bulk version of put_word_into_db(): the old hitlists
+        of the words are loaded with one query, merged in memory, and
+        written back with multi-row statements.  The words that cannot be
+        handled this way (e.g. when the database finds a stored term equal
+        to a word only thanks to its collation) are flushed one by one.
+        """
+        table_name = wash_table_column_name(self.table_name)
+        old_hitlists = self.load_old_recIDs_many(words)
+        # were some stored terms matched although they differ from the
+        # words themselves?
+        inexact_match = bool(set(old_hitlists).difference(words))
+
+        words_to_update = []
+        words_to_insert = []
+        words_to_delete = []
+        words_one_by_one = []
+        for word in words:
+            hitlist = old_hitlists.get(word)
+            if hitlist is not None:
+                if self.merge_with_old_recIDs(word, hitlist):
+                    write_message("......... updating hitlist for ``%s''" % \
+                                  word, verbose=9)
+                    if hitlist:
+                        words_to_update.append((word, hitlist.fastdump()))
+                else:
+                    write_message("......... unchanged hitlist for ``%s''" % \
+                                  word, verbose=9)
+                if not hitlist: # never store empty words
+                    words_to_delete.append(word)
+            elif inexact_match:
+                words_one_by_one.append(word)
+            else:
+                write_message("......... inserting hitlist for ``%s''" % \
+                              word, verbose=9)
+                hitlist = intbitset(self.value[word].keys())
+                if hitlist: # never store empty words
+                    words_to_insert.append((word, hitlist.fastdump()))
+
+        for rows in _chunks_by_size(words_to_update):
+            run_sql_many("""INSERT INTO %s (term, hitlist) VALUES (%%s, %%s)
+                ON DUPLICATE KEY UPDATE hitlist=VALUES(hitlist)""" % table_name, rows) # kwalitee: disable=sql
+        for rows in _chunks_by_size(words_to_insert):
+            try:
+                run_sql_many("INSERT INTO %s (term, hitlist) VALUES (%%s, %%s)" % table_name, rows) # kwalitee: disable=sql
+            except IntegrityError:
+                # some words clash with each other or with a stored term
+                # for the unique key of the table: let put_word_into_db()
+                # take care of them, as it would have done in the first
+                # place (re-merging an inserted word is harmless).
+                words_one_by_one.extend([row[0] for row in rows])
+        if words_to_delete:
+            run_sql("DELETE FROM %s WHERE term IN (%s)" % (table_name, ','.join(['%s'] * len(words_to_delete))), words_to_delete) # kwalitee: disable=sql
+        for word in words_one_by_one:
+            self.put_word_into_db(word)
+
     def put(self, recID, word, sign):
         """Keeps track of changes done during indexing
            and stores these changes in memory for further use.
@@ -772,6 +887,19 @@ class AbstractIndexTable(object):
         else:
             return None
 
+    def load_old_recIDs_many(self, words):
+        """Load existing hitlists for many words with one query.
+
+        Return a dictionary of the stored terms matching WORDS, as found by
+        the database, and their hitlists.
+        """
+        if not words:
+            return {}
+        query = "SELECT term, hitlist FROM %s WHERE term IN (%s)" % \
+                (self.table_name, ','.join(['%s'] * len(words)))
+        return dict((term, intbitset(hitlist))
+                    for term, hitlist in run_sql(query, words))
+
     def merge_with_old_recIDs(self, word, set):
         """Merge the system numbers stored in memory
         (hash of recIDs with value +1 or -1 according
@@ -1358,10 +1486,14 @@ class WordTable(AbstractIndexTable):
             write_message("The word '%s' does not exist in the word file."\
                               % word)
 
-    def add_recIDs(self, recIDs, opt_flush):
+    def add_recIDs(self, recIDs, opt_flush, workers=1):
         """Fetches records which id in the recIDs range list and adds
         them to the wordTable.  The recIDs range list is of the form:
         [[i1_low,i1_high],[i2_low,i2_high], ..., [iN_low,iN_high]].
+
+        With more than one worker, the terms of the records are collected
+        by a pool of processes, while the database is still updated and
+        flushed by this process, chunk after chunk, in order.
         """
         global chunksize, _last_word_table
         flush_count = 0
@@ -1371,15 +1503,17 @@ class WordTable(AbstractIndexTable):
         for arange in recIDs:
             records_to_go = records_to_go + arange[1] - arange[0] + 1
 
+        chunks = list(split_recIDs_in_chunks(recIDs, opt_flush))
+        if workers > 1:
+            wlists = self.collect_terms_in_pool(chunks, workers)
+        else:
+            # the terms are collected by add_recID_range() itself
+            wlists = repeat(None)
+
         time_started = time.time() # will measure profile time
-        for arange in recIDs:
-            i_low = arange[0]
-            chunksize_count = 0
-            while i_low <= arange[1]:
+        try:
+            for (i_low, i_high), wlist in izip(chunks, wlists):
                 task_sleep_now_if_required()
-                # calculate chunk group of recIDs and treat it:
-                i_high = min(i_low + opt_flush - flush_count - 1, arange[1])
-                i_high = min(i_low + chunksize - chunksize_count - 1, i_high)
 
                 try:
                     self.chk_recID_range(i_low, i_high)
@@ -1395,14 +1529,11 @@ class WordTable(AbstractIndexTable):
                 percentage_display = get_percentage_completed(records_done, records_to_go)
                 task_update_progress("(%s:%s) adding recs %d-%d %s" % (self.table_name, self.index_name, i_low, i_high, percentage_display))
                 self.del_recID_range(i_low, i_high)
-                just_processed = self.add_recID_range(i_low, i_high)
+                just_processed = self.add_recID_range(i_low, i_high, wlist)
                 flush_count = flush_count + i_high - i_low + 1
-                chunksize_count = chunksize_count + i_high - i_low + 1
                 records_done = records_done + just_processed
                 write_message(CFG_BIBINDEX_ADDING_RECORDS_STARTED_STR % \
                         (self.table_name, i_low, i_high))
-                if chunksize_count >= chunksize:
-                    chunksize_count = 0
                 # flush if necessary:
                 if flush_count >= opt_flush:
                     self.put_into_db()
@@ -1412,8 +1543,10 @@ class WordTable(AbstractIndexTable):
                     write_message("%s backing up" % (self.table_name))
                     flush_count = 0
                     self.log_progress(time_started, records_done, records_to_go)
-                # iterate:
-                i_low = i_high + 1
+        finally:
+            if workers > 1:
+                # stop the worker processes in case of errors
+                wlists.close()
         if flush_count > 0:
             self.put_into_db()
             if self.index_name == 'fulltext' and CFG_SOLR_URL:
@@ -1421,10 +1554,64 @@ class WordTable(AbstractIndexTable):
             self.log_progress(time_started, records_done, records_to_go)
         self.notify_virtual_indexes(recIDs)
 
-    def add_recID_range(self, recID1, recID2):
-        """Add records from RECID1 to RECID2."""
-        wlist = {}
+    def collect_terms_in_pool(self, chunks, workers):
+        """Collect the terms of the records of the recID CHUNKS in a pool of
+        WORKERS processes, and yield them chunk after chunk, in order.
+
+        Only a few chunks are collected ahead of the caller, so that the
+        memory used does not grow with the number of records.
+        """
+        global _collecting_word_table
+        _collecting_word_table = self
+        pool = Pool(workers, initializer=task_init_worker_process)
+        pending = deque()
+        try:
+            chunks = iter(chunks)
+            for i_low, i_high in chunks:
+                pending.append(pool.apply_async(_collect_recID_range_terms,
+                                                (i_low, i_high)))
+                if len(pending) > 2 * workers:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            _collecting_word_table = None
+
+    def add_recID_range(self, recID1, recID2, wlist=None):
+        """Add records from RECID1 to RECID2.
+
+        WLIST, when given, holds the terms of these records as already
+        collected by collect_recID_range_terms().
+        """
         self.recIDs_in_mem.append([recID1, recID2])
+        if wlist is None:
+            wlist = self.collect_recID_range_terms(recID1, recID2)
+        if len(wlist) == 0: return 0
+        recIDs = wlist.keys()
+        # put words into reverse index table with FUTURE status:
+        run_sql_many("INSERT INTO %sR (id_bibrec,termlist,type) VALUES (%%s,%%s,'FUTURE')" % wash_table_column_name(self.table_name[:-1]), [(recID, serialize_via_marshal(wlist[recID])) for recID in recIDs]) # kwalitee: disable=sql
+        # ... and, for new records, enter the CURRENT status as empty
+        # (already existing records are skipped by IGNORE):
+        empty_termlist = serialize_via_marshal([])
+        run_sql_many("INSERT IGNORE INTO %sR (id_bibrec,termlist,type) VALUES (%%s,%%s,'CURRENT')" % wash_table_column_name(self.table_name[:-1]), [(recID, empty_termlist) for recID in recIDs]) # kwalitee: disable=sql
+
+        # put words into memory word list:
+        put = self.put
+        for recID in recIDs:
+            for w in wlist[recID]:
+                put(recID, w, 1)
+        return len(recIDs)
+
+    def collect_recID_range_terms(self, recID1, recID2):
+        """Collect the terms of the records from RECID1 to RECID2.
+
+        Return a dictionary of recID -> list of terms.  Only reads the
+        database, hence it can run in a worker process.
+        """
+        wlist = {}
         # special case of author indexes where we also add author
         # canonical IDs:
         if self.index_name in ('author', 'firstauthor', 'exactauthor', 'exactfirstauthor'):
@@ -1456,7 +1643,7 @@ class WordTable(AbstractIndexTable):
         # lookup index-time synonyms:
         synonym_kbrs = get_all_synonym_knowledge_bases()
         if self.index_name in synonym_kbrs:
-            if len(wlist) == 0: return 0
+            if len(wlist) == 0: return wlist
             recIDs = wlist.keys()
             for recID in recIDs:
                 for word in wlist[recID]:
@@ -1477,23 +1664,7 @@ class WordTable(AbstractIndexTable):
                 write_message("... record %d was declared deleted, removing its word list" % recID, verbose=9)
             write_message("... record %d, termlist: %s" % (recID, wlist[recID]), verbose=9)
 
-        if len(wlist) == 0: return 0
-        # put words into reverse index table with FUTURE status:
-        for recID in recIDs:
-            run_sql("INSERT INTO %sR (id_bibrec,termlist,type) VALUES (%%s,%%s,'FUTURE')" % wash_table_column_name(self.table_name[:-1]), (recID, serialize_via_marshal(wlist[recID]))) # kwalitee: disable=sql
-            # ... and, for new records, enter the CURRENT status as empty:
-            try:
-                run_sql("INSERT INTO %sR (id_bibrec,termlist,type) VALUES (%%s,%%s,'CURRENT')" % wash_table_column_name(self.table_name[:-1]), (recID, serialize_via_marshal([]))) # kwalitee: disable=sql
-            except DatabaseError:
-                # okay, it's an already existing record, no problem
-                pass
-
-        # put words into memory word list:
-        put = self.put
-        for recID in recIDs:
-            for w in wlist[recID]:
-                put(recID, w, 1)
-        return len(recIDs)
+        return wlist
 
     def find_nonmarc_records(self, recID1, recID2):
         """Divides recID range into two different tables,
@@ -1788,6 +1959,7 @@ def main():
   -w, --windex=w1[,w2]\tword/phrase indexes to consider (all)
   -M, --maxmem=XXX\tmaximum memory usage in kB (no limit)
   -f, --flush=NNN\t\tfull consistent table flush after NNN records (10000)
+  --workers=N\t\tcollect the words of the records with N processes (1)
   --force\t\tforce indexing of all records for provided indexes
   -Z, --remove-dependent-index=w  name of an index for removing from virtual index
   -l --all-virtual\t\t set of all virtual indexes; the same as: -w virtual_ind1, virtual_ind2, ...
@@ -1807,7 +1979,8 @@ def main():
                 "flush=",
                 "force",
                 "remove-dependent-index=",
-                "all-virtual"
+                "all-virtual",
+                "workers="
             ]),
             task_stop_helper_fnc=task_stop_table_close_fnc,
             task_submit_elaborate_specific_parameter_fnc=task_submit_elaborate_specific_parameter,
@@ -1862,6 +2035,8 @@ def task_submit_elaborate_specific_parameter(key, value, opts, args):
         task_set_option("flush", int(value))
     elif key in ("-o", "--force"):
         task_set_option("force", True)
+    elif key in ("--workers",):
+        task_set_option("workers", int(value))
     elif key in ("-Z", "--remove-dependent-index",):
         task_set_option("remove-dependent-index", value)
     elif key in ("-l", "--all-virtual",):
@@ -2215,7 +2390,8 @@ def task_run_core():
                     raise StandardError(error_message)
             elif task_get_option("cmd") == "add":
                 final_recIDs = beautify_range_list(create_range_list(recIDs_for_index[index_name]))
-                wordTable.add_recIDs(final_recIDs, task_get_option("flush"))
+                wordTable.add_recIDs(final_recIDs, task_get_option("flush"),
+                                     task_get_option("workers", 1))
                 task_sleep_now_if_required(can_stop_too=True)
             elif task_get_option("cmd") == "repair":
                 wordTable.repair(task_get_option("flush"))
@@ -2254,7 +2430,8 @@ def task_run_core():
                     raise StandardError(error_message)
             elif task_get_option("cmd") == "add":
                 final_recIDs = beautify_range_list(create_range_list(recIDs_for_index[index_name]))
-                wordTable.add_recIDs(final_recIDs, task_get_option("flush"))
+                wordTable.add_recIDs(final_recIDs, task_get_option("flush"),
+                                     task_get_option("workers", 1))
                 task_sleep_now_if_required(can_stop_too=True)
             elif task_get_option("cmd") == "repair":
                 wordTable.repair(task_get_option("flush"))
@@ -2293,7 +2470,8 @@ def task_run_core():
                     raise StandardError(error_message)
             elif task_get_option("cmd") == "add":
                 final_recIDs = beautify_range_list(create_range_list(recIDs_for_index[index_name]))
-                wordTable.add_recIDs(final_recIDs, task_get_option("flush"))
+                wordTable.add_recIDs(final_recIDs, task_get_option("flush"),
+                                     task_get_option("workers", 1))
                 if not task_get_option("id") and not task_get_option("collection"):
                     update_index_last_updated([index_name], task_get_task_param('task_starting_time'))
                 task_sleep_now_if_required(can_stop_too=True)
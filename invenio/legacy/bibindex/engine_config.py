@@ -69,3 +69,9 @@ CFG_BIBINDEX_SPECIAL_TAGS = {'8564_u': {'Words': 'BibIndexFulltextTokenizer',
                                         'Pairs': 'BibIndexEmptyTokenizer',
                                         'Phrases': 'BibIndexEmptyTokenizer'}
                             }
+
+# number of words flushed into an index table at once:
+CFG_BIBINDEX_FLUSH_CHUNK_SIZE = 1000
+# maximum size of the hitlists written by a single multi-row statement, to
+# stay below the max_allowed_packet setting of the database server:
+CFG_BIBINDEX_FLUSH_MAX_BYTES = 8 * 1024 * 1024
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Memory-mapped snapshot of the citation graph.
+
+After each run the citation indexer dumps rnkCITATIONDICT as two
+compressed sparse row structures, indexed by recid: the sorted recids
+every record refers to, and the sorted recids citing every record.  The
+search processes map these files read-only, so that their pages are
+shared by all the processes of the host.
+"""
+
+import os
+import time
+
+from intbitset import intbitset
+from numpy import arange, array, concatenate, cumsum, bincount, diff, \
+    int32, int64, lexsort, load, nonzero, repeat, save, zeros
+
+from invenio.config import CFG_CACHEDIR
+from invenio.legacy.dbquery import run_sql
+
+CFG_CITATION_GRAPH_DIR = os.path.join(CFG_CACHEDIR, 'citation_graph')
+
+# number of citing recids whose citations are read with one query
+CFG_CITATION_GRAPH_CHUNK_SIZE = 100000
+
+CITATION_GRAPH_ARRAYS = ('refs_indptr', 'refs_indices',
+                         'cites_indptr', 'cites_indices', 'cites_counts')
+
+
+class CitationGraph(object):
+
+    """Read-only view of a citation graph snapshot."""
+
+    def __init__(self, directory, generation):
+        """Map the arrays of the given snapshot generation."""
+        self.generation = generation
+        for name in CITATION_GRAPH_ARRAYS:
+            setattr(self, name, load(
+                os.path.join(directory, '%s.%s.npy' % (name, generation)),
+                mmap_mode='r'))
+
+    @staticmethod
+    def _neighbours(indptr, indices, recid):
+        """Return the array of neighbours of one recid."""
+        if 0 <= recid < len(indptr) - 1:
+            return indices[indptr[recid]:indptr[recid + 1]]
+        return indices[:0]
+
+    @staticmethod
+    def _all_neighbours(indptr, indices, recids):
+        """Return the array of neighbours of all the recids."""
+        recids = array(list(recids), int64)
+        recids = recids[(recids >= 0) & (recids < len(indptr) - 1)]
+        starts = indptr[recids]
+        lengths = indptr[recids + 1] - starts
+        offsets = cumsum(lengths) - lengths
+        positions = arange(lengths.sum()) - repeat(offsets - starts, lengths)
+        return indices[positions]
+
+    def refers_to(self, recid):
+        """Return the array of recids referenced by RECID."""
+        return self._neighbours(self.refs_indptr, self.refs_indices, recid)
+
+    def cited_by(self, recid):
+        """Return the array of recids citing RECID."""
+        return self._neighbours(self.cites_indptr, self.cites_indices, recid)
+
+    def refers_to_all(self, recids):
+        """Return the array of references of all RECIDS, with repetitions."""
+        return self._all_neighbours(self.refs_indptr, self.refs_indices,
+                                    recids)
+
+    def refers_to_hitset(self, recids):
+        """Return the recids referenced by any of RECIDS."""
+        return intbitset(self.refers_to_all(recids).tolist())
+
+    def cited_by_hitset(self, recids):
+        """Return the recids citing any of RECIDS."""
+        return intbitset(self._all_neighbours(
+            self.cites_indptr, self.cites_indices, recids).tolist())
+
+    def cited_between(self, first, last=None):
+        """Return the cited recids having between FIRST and LAST citers."""
+        mask = self.cites_counts >= max(first, 1)
+        if last is not None:
+            mask &= self.cites_counts <= last
+        return intbitset(nonzero(mask)[0].tolist())
+
+
+_citation_graph = None
+
+
+def get_citation_graph(directory=CFG_CITATION_GRAPH_DIR):
+    """Return the current citation graph snapshot.
+
+    The snapshot is mapped again when the indexer has written a newer
+    one.  Return None when there is no snapshot yet.
+    """
+    global _citation_graph
+    try:
+        with open(os.path.join(directory, 'current')) as current:
+            generation = current.read().strip()
+    except IOError:
+        return None
+    if _citation_graph is None or _citation_graph.generation != generation:
+        try:
+            _citation_graph = CitationGraph(directory, generation)
+        except IOError:
+            # the indexer is switching to a newer snapshot
+            return None
+    return _citation_graph
+
+
+def _build_csr(rows, cols, size):
+    """Return indptr and indices of the graph having an edge from every
+    row to the corresponding col."""
+    order = lexsort((cols, rows))
+    indptr = zeros(size + 1, int64)
+    indptr[1:] = cumsum(bincount(rows, minlength=size))
+    return indptr, cols[order]
+
+
+def get_citation_pairs():
+    """Return two arrays with the citer and citee of every citation."""
+    max_citer = run_sql("SELECT MAX(citer) FROM rnkCITATIONDICT")[0][0] or 0
+    chunks = [zeros((0, 2), int32)]
+    for start in range(0, max_citer + 1, CFG_CITATION_GRAPH_CHUNK_SIZE):
+        rows = run_sql("""SELECT citer, citee FROM rnkCITATIONDICT
+                          WHERE citer >= %s AND citer < %s""",
+                       (start, start + CFG_CITATION_GRAPH_CHUNK_SIZE))
+        if rows:
+            chunks.append(array(rows, int32))
+    pairs = concatenate(chunks)
+    return pairs[:, 0].copy(), pairs[:, 1].copy()
+
+
+def store_citation_graph(directory=CFG_CITATION_GRAPH_DIR):
+    """Write a new snapshot of rnkCITATIONDICT and make it current."""
+    citers, citees = get_citation_pairs()
+    size = 1
+    if len(citers):
+        size += int(max(citers.max(), citees.max()))
+    arrays = {}
+    arrays['refs_indptr'], arrays['refs_indices'] = \
+        _build_csr(citers, citees, size)
+    arrays['cites_indptr'], arrays['cites_indices'] = \
+        _build_csr(citees, citers, size)
+    arrays['cites_counts'] = diff(arrays['cites_indptr']).astype(int32)
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    generation = '%d-%d' % (time.time(), os.getpid())
+    for name in CITATION_GRAPH_ARRAYS:
+        save(os.path.join(directory, '%s.%s.npy' % (name, generation)),
+             arrays[name])
+    current = os.path.join(directory, 'current.%s' % generation)
+    with open(current, 'w') as current_file:
+        current_file.write(generation)
+    os.rename(current, os.path.join(directory, 'current'))
+
+    # processes still using older snapshots keep their mappings until
+    # they switch to this one
+    for filename in os.listdir(directory):
+        if filename.endswith('.npy') and \
+                filename.split('.')[1] != generation:
+            os.remove(os.path.join(directory, filename))
+    return generation
@@ -48,6 +48,7 @@ from invenio.legacy.bibsched.bibtask import write_message, task_get_option, \
 from invenio.legacy.bibindex.engine_utils import get_field_tags
 from invenio.legacy.docextract.record import get_record
 from invenio.legacy.dbquery import serialize_via_marshal
+from invenio.legacy.bibrank.citation_graph import store_citation_graph
 
 re_CFG_JOURNAL_PUBINFO_STANDARD_FORM_REGEXP_CHECK \
                    = re.compile(CFG_JOURNAL_PUBINFO_STANDARD_FORM_REGEXP_CHECK)
@@ -193,6 +194,7 @@ def process_and_store(recids, config, chunk_size):
     # Compute new weights dictionary
     if modified:
         weights = compute_weights()
+        store_citation_graph()
     else:
         weights = None
 
@@ -23,6 +23,7 @@ import re
 
 from invenio.legacy.dbquery import run_sql
 from intbitset import intbitset
+from invenio.legacy.bibrank.citation_graph import get_citation_graph
 from invenio.legacy.miscutil.data_cacher import DataCacher
 from invenio.utils.redis import get_redis
 from invenio.legacy.dbquery import deserialize_via_marshal
@@ -113,6 +114,9 @@ def get_citation_dict(dictname):
 
 def get_refers_to(recordid):
     """Return a list of records referenced by this record"""
+    graph = get_citation_graph()
+    if graph is not None:
+        return set(graph.refers_to(recordid).tolist())
     rows = run_sql("SELECT citee FROM rnkCITATIONDICT WHERE citer = %s",
                    [recordid])
     return set(r[0] for r in rows)
@@ -120,6 +124,9 @@ def get_refers_to(recordid):
 
 def get_cited_by(recordid):
     """Return a list of records that cite recordid"""
+    graph = get_citation_graph()
+    if graph is not None:
+        return set(graph.cited_by(recordid).tolist())
     rows = run_sql("SELECT citer FROM rnkCITATIONDICT WHERE citee = %s",
                    [recordid])
     return set(r[0] for r in rows)
@@ -127,6 +134,9 @@ def get_cited_by(recordid):
 
 def get_cited_by_count(recordid):
     """Return how many records cite given RECORDID."""
+    graph = get_citation_graph()
+    if graph is not None:
+        return len(graph.cited_by(recordid))
     rows = run_sql("SELECT 1 FROM rnkCITATIONDICT WHERE citee = %s",
                    [recordid])
     return len(rows)
@@ -139,17 +149,34 @@ def get_records_with_num_cites(numstr, allrecs=intbitset([]),
        Warning: numstr is string and may not be numeric! It can
        be 10,0->100 etc
     """
-    if exclude_selfcites:
-        cache_cited_by_dictionary_counts = get_citation_dict("selfcites_counts")
-        citations_keys = intbitset(get_citation_dict("selfcites_weights").keys())
-    else:
-        cache_cited_by_dictionary_counts = get_citation_dict("citations_counts")
-        citations_keys = get_citation_dict("citations_keys")
-
     matches = intbitset()
     #once again, check that the parameter is a string
     if type(numstr) != type("thisisastring"):
         return matches
+
+    graph = None
+    if not exclude_selfcites:
+        graph = get_citation_graph()
+    if graph is not None:
+        cited_between = graph.cited_between
+        citations_keys = cited_between(1)
+    else:
+        if exclude_selfcites:
+            cache_cited_by_dictionary_counts = \
+                get_citation_dict("selfcites_counts")
+            citations_keys = \
+                intbitset(get_citation_dict("selfcites_weights").keys())
+        else:
+            cache_cited_by_dictionary_counts = \
+                get_citation_dict("citations_counts")
+            citations_keys = get_citation_dict("citations_keys")
+
+        def cited_between(first, last=None):
+            return intbitset([recid for recid, cit_count
+                              in cache_cited_by_dictionary_counts
+                              if first <= cit_count and
+                              (last is None or cit_count <= last)])
+
     numstr = numstr.replace(" ", '')
     numstr = numstr.replace('"', '')
 
@@ -162,9 +189,7 @@ def get_records_with_num_cites(numstr, allrecs=intbitset([]),
             #we return recids that are not in keys
             return allrecs - citations_keys
         else:
-            return intbitset([recid for recid, cit_count
-                        in cache_cited_by_dictionary_counts
-                        if cit_count == num])
+            return cited_between(num, num)
 
     # Try to get 1->10 or such
     firstsec = re.findall("(\d+)->(\d+)", numstr)
@@ -175,18 +200,14 @@ def get_records_with_num_cites(numstr, allrecs=intbitset([]),
             # Start with those that have no cites..
     	    matches = allrecs - citations_keys
         if first <= sec:
-            matches += intbitset([recid for recid, cit_count
-                             in cache_cited_by_dictionary_counts
-                             if first <= cit_count <= sec])
+            matches += cited_between(first, sec)
         return matches
 
     # Try to get 10+
     firstsec = re.findall("(\d+)\+", numstr)
     if firstsec:
         first = int(firstsec[0])
-        matches = intbitset([recid for recid, cit_count
-                         in cache_cited_by_dictionary_counts \
-                         if cit_count > first])
+        matches = cited_between(first + 1)
 
     return matches
 
@@ -208,6 +229,11 @@ def get_cited_by_list(recids, record_limit=None):
     else:
         limited_recids = recids
 
+    graph = get_citation_graph()
+    if graph is not None:
+        return [(recid, set(graph.cited_by(recid).tolist()))
+                for recid in limited_recids]
+
     in_sql = ','.join('%s' for dummy in limited_recids)
     rows = run_sql("""SELECT citer, citee FROM rnkCITATIONDICT
                        WHERE citee IN (%s)""" % in_sql, limited_recids)
@@ -236,6 +262,11 @@ def get_refers_to_list(recids, record_limit=None):
     else:
         limited_recids = recids
 
+    graph = get_citation_graph()
+    if graph is not None:
+        return [(recid, set(graph.refers_to(recid).tolist()))
+                for recid in limited_recids]
+
     in_sql = ','.join('%s' for dummy in limited_recids)
     rows = run_sql("""SELECT citee, citer FROM rnkCITATIONDICT
                        WHERE citer IN (%s)""" % in_sql, limited_recids)
@@ -271,6 +302,9 @@ def get_refersto_hitset(ahitset, record_limit=None):
             else:
                 limited_ahitset = ahitset
 
+            graph = get_citation_graph()
+            if graph is not None:
+                return graph.cited_by_hitset(limited_ahitset)
             in_sql = ','.join('%s' for dummy in limited_ahitset)
             rows = run_sql("""SELECT citer FROM rnkCITATIONDICT
                               WHERE citee IN (%s)""" % in_sql, limited_ahitset)
@@ -322,6 +356,9 @@ def get_citedby_hitset(ahitset, record_limit=None):
             else:
                 limited_ahitset = ahitset
 
+            graph = get_citation_graph()
+            if graph is not None:
+                return graph.refers_to_hitset(limited_ahitset)
             in_sql = ','.join('%s' for dummy in limited_ahitset)
             rows = run_sql("""SELECT citee FROM rnkCITATIONDICT
                               WHERE citer IN (%s)""" % in_sql, limited_ahitset)
@@ -357,12 +394,17 @@ def calculate_co_cited_with_list(record_id, sort_order="d"):
     result = []
     result_intermediate = {}
 
-    for cit_id in get_cited_by(record_id):
-        for ref_id in get_refers_to(cit_id):
-            if ref_id not in result_intermediate:
-                result_intermediate[ref_id] = 1
-            else:
-                result_intermediate[ref_id] += 1
+    graph = get_citation_graph()
+    if graph is not None:
+        co_cited = graph.refers_to_all(graph.cited_by(record_id)).tolist()
+    else:
+        co_cited = (ref_id for cit_id in get_cited_by(record_id)
+                    for ref_id in get_refers_to(cit_id))
+    for ref_id in co_cited:
+        if ref_id not in result_intermediate:
+            result_intermediate[ref_id] = 1
+        else:
+            result_intermediate[ref_id] += 1
     for key, value in iteritems(result_intermediate):
         if key != record_id:
             result.append([key, value])
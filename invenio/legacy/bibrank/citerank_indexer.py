@@ -33,7 +33,9 @@ import time
 import re
 import sys
 try:
-    from numpy import array, ones, zeros, int32, float32, sqrt, dot
+    from numpy import add, arange, argsort, array, asarray, bincount, \
+        concatenate, cumsum, diff, dot, float64, fromiter, int32, \
+        nonzero, ones, repeat, sqrt, where, zeros
     import_numpy = 1
 except ImportError:
     import_numpy = 0
@@ -43,7 +45,8 @@ if sys.hexversion < 0x2040000:
     from sets import Set as set
     # pylint: enable=W0622
 
-from invenio.legacy.dbquery import run_sql, serialize_via_marshal
+from invenio.legacy.dbquery import run_sql, serialize_via_marshal, \
+    deserialize_via_marshal
 from invenio.legacy.bibsched.bibtask import write_message
 from invenio.modules.ranker.registry import configuration
 
@@ -336,19 +339,48 @@ def get_dates_from_db(dict_of_ids, publication_year_tag, creation_date_tag):
     return dates
 
 
+def get_citation_coordinates(cit, dict_of_ids):
+    """returns two arrays containing, for every citation, the index of
+    the cited paper (row) and the index of the citing paper (column)"""
+    nr_of_citations = sum(len(cit[item]) for item in cit)
+    rows = fromiter((dict_of_ids[item] for item in cit
+                     for dummy in cit[item]), int32, nr_of_citations)
+    cols = fromiter((dict_of_ids[value] for item in cit
+                     for value in cit[item]), int32, nr_of_citations)
+    return rows, cols
+
+
+def construct_csr_matrix(rows, cols, values, len_):
+    """returns the compressed sparse row representation (indptr, indices,
+    data) of the len_ x len_ matrix having values[k] at (rows[k], cols[k])"""
+    order = argsort(rows, kind='mergesort')
+    indptr = zeros(len_ + 1, rows.dtype)
+    indptr[1:] = cumsum(bincount(rows, minlength=len_))
+    return indptr, cols[order], values[order]
+
+
+def csr_dot(sparse, vector):
+    """returns the product of the compressed sparse row matrix with
+    the vector"""
+    indptr, indices, data = sparse
+    result = zeros(len(indptr) - 1, float64)
+    if len(data):
+        starts = indptr[:-1]
+        non_empty = starts < indptr[1:]
+        result[non_empty] = add.reduceat(data * vector[indices],
+                                         starts[non_empty])
+    return result
+
+
 def construct_sparse_matrix(cit, ref, dict_of_ids, len_, damping_factor):
     """returns several structures needed in the calculation
     of the PAGERANK method using this structures, we don't need
     to keep the full matrix in the memory"""
-    sparse = {}
-    for item in cit:
-        for value in cit[item]:
-            sparse[(dict_of_ids[item], dict_of_ids[value])] = \
-                    damping_factor * 1.0/ref[dict_of_ids[value]]
-    semi_sparse = []
-    for j in range(len_):
-        if ref[j] == 0:
-            semi_sparse.append(j)
+    ref = asarray(ref)
+    rows, cols = get_citation_coordinates(cit, dict_of_ids)
+    sparse = construct_csr_matrix(rows, cols,
+                                  damping_factor * 1.0 / ref[cols], len_)
+    semi_sparse = nonzero(ref == 0)[0]
     semi_sparse_coeficient = damping_factor/len_
     #zero_coeficient = (1-damping_factor)/len_
     write_message("Sparse information calculated", verbose=3)
@@ -358,39 +390,26 @@ def construct_sparse_matrix(cit, ref, dict_of_ids, len_, damping_factor):
 def construct_sparse_matrix_ext(cit, ref, ext_links, dict_of_ids, alpha, beta):
     """if x doesn't cite anyone: cites everyone : 1/len_ -- should be used!
     returns several structures needed in the calculation
-    of the PAGERANK_EXT method"""
+    of the PAGERANK_EXT method; the external links are row and column 0"""
     len_ = len(dict_of_ids)
-    sparse = {}
-    semi_sparse = {}
-    sparse[0, 0] = 1.0 - alpha
-    for j in range(len_):
-        sparse[j+1, 0] = alpha/(len_)
-        if j not in ext_links:
-            sparse[0, j+1] = beta/(len_ + beta)
-        else:
-            if ext_links[j] == 0:
-                sparse[0, j+1] = beta/(len_ + beta)
-            else:
-                aux = beta * ext_links[j]
-                if ref[j] == 0:
-                    sparse[0, j+1] = aux/(aux + len_)
-                else:
-                    sparse[0, j+1] = aux/(aux + ref[j])
-        if ref[j] == 0:
-            semi_sparse[j+1] = (1.0 - sparse[0, j + 1])/len_
-    for item in cit:
-        for value in cit[item]:
-            sparse[(dict_of_ids[item] + 1, dict_of_ids[value] + 1)] = \
-               (1.0 - sparse[0, dict_of_ids[value] + 1])/ref[dict_of_ids[value]]
-    #for i in range(len_ + 1):
-    #    a = ""
-    #    for j in range (len_ + 1):
-    #        if (i,j) in sparse:
-    #            a += str(sparse[(i,j)]) + "\t"
-    #        else:
-    #            a += "0\t"
-    #    print a
-    #print semi_sparse
+    ref = asarray(ref)
+    ext = zeros(len_, float64)
+    for j in ext_links:
+        ext[j] = ext_links[j]
+    aux = beta * ext
+    # weight of the link from each paper to the external node
+    ext_weights = where(ext == 0, beta / (len_ + beta),
+                        aux / (aux + where(ref == 0, len_, ref)))
+    dangling = nonzero(ref == 0)[0]
+    semi_sparse = (dangling + 1, (1.0 - ext_weights[dangling]) / len_)
+    rows, cols = get_citation_coordinates(cit, dict_of_ids)
+    nodes = arange(1, len_ + 1)
+    sparse = construct_csr_matrix(
+        concatenate(([0], nodes, zeros(len_, int32), rows + 1)),
+        concatenate(([0], zeros(len_, int32), nodes, cols + 1)),
+        concatenate(([1.0 - alpha], ones(len_) * alpha / len_, ext_weights,
+                     (1.0 - ext_weights[cols]) / ref[cols])),
+        len_ + 1)
     write_message("Sparse information calculated", verbose=3)
     return sparse, semi_sparse
 
@@ -401,15 +420,12 @@ def construct_sparse_matrix_time(cit, ref, dict_of_ids, \
     method using this structures,
     we don't need to keep the full matrix in the memory"""
     len_ = len(dict_of_ids)
-    sparse = {}
-    for item in cit:
-        for value in cit[item]:
-            sparse[(dict_of_ids[item], dict_of_ids[value])] = damping_factor * \
-                    date_coef[dict_of_ids[value]]/ref[dict_of_ids[value]]
-    semi_sparse = []
-    for j in range(len_):
-        if ref[j] == 0:
-            semi_sparse.append(j)
+    ref = asarray(ref)
+    date_coef = asarray([date_coef[j] for j in range(len_)])
+    rows, cols = get_citation_coordinates(cit, dict_of_ids)
+    sparse = construct_csr_matrix(
+        rows, cols, damping_factor * date_coef[cols] / ref[cols], len_)
+    semi_sparse = nonzero(ref == 0)[0]
     semi_sparse_coeficient = damping_factor/len_
     #zero_coeficient = (1-damping_factor)/len_
     write_message("Sparse information calculated", verbose=3)
@@ -418,42 +434,46 @@ def construct_sparse_matrix_time(cit, ref, dict_of_ids, \
 
 def statistics_on_sparse(sparse):
     """returns the number of papers that cite themselves"""
-    count_diag = 0
-    for (i, j) in sparse.keys():
-        if i == j:
-            count_diag += 1
+    indptr, indices = sparse[:2]
+    rows = repeat(arange(len(indptr) - 1), diff(indptr))
+    count_diag = int((indices == rows).sum())
     write_message("The number of papers that cite themselves: %s" % \
         str(count_diag), verbose=3)
     return count_diag
 
 
+def initial_weights(len_, weights=None):
+    """returns the starting vector of the power iteration: either ones
+    or the given weights (e.g. from a previous run), scaled to the same
+    total weight"""
+    if weights is None:
+        return ones((len_), float64)
+    weights = asarray(weights, float64)
+    return weights * (len_ / weights.sum())
+
+
 def pagerank(conv_threshold, check_point, len_, sparse, \
-            semi_sparse, semi_sparse_coef):
+            semi_sparse, semi_sparse_coef, weights=None):
     """the core function of the PAGERANK method
     returns an array with the ranks coresponding to each recid"""
-    weights_old = ones((len_), float32) # initial weights
-    weights_new = array((), float32)
+    weights_old = initial_weights(len_, weights)
     converged = False
     nr_of_check_points = 0
     difference = len_
     while not converged:
         nr_of_check_points += 1
         for step in (range(check_point)):
-            weights_new = zeros((len_), float32)
-            for (i, j) in sparse.keys():
-                weights_new[i] += sparse[(i, j)]*weights_old[j]
-            semi_total = 0.0
-            for j in semi_sparse:
-                semi_total += weights_old[j]
-            weights_new = weights_new + semi_sparse_coef * semi_total + \
-                            (1.0/len_ - semi_sparse_coef) * sum(weights_old)
+            semi_total = weights_old[semi_sparse].sum()
+            weights_new = csr_dot(sparse, weights_old) + \
+                semi_sparse_coef * semi_total + \
+                (1.0/len_ - semi_sparse_coef) * weights_old.sum()
             if step == check_point - 1:
                 diff = weights_new - weights_old
                 difference = sqrt(dot(diff, diff))/len_
                 write_message("Finished step: %s, %s " \
                         %(str(check_point*(nr_of_check_points-1) + step), \
                             str(difference)), verbose=5)
-            weights_old = weights_new.copy()
+            weights_old = weights_new
             converged = (difference < conv_threshold)
     write_message("PageRank calculated for all recids finnished in %s steps. \
 The threshold was %s" % (str(nr_of_check_points), str(difference)),\
@@ -461,32 +481,28 @@ The threshold was %s" % (str(nr_of_check_points), str(difference)),\
     return weights_old
 
 
-def pagerank_ext(conv_threshold, check_point, len_, sparse, semi_sparse):
+def pagerank_ext(conv_threshold, check_point, len_, sparse, semi_sparse,
+                 weights=None):
     """the core function of the PAGERANK_EXT method
     returns an array with the ranks coresponding to each recid"""
-    weights_old = array((), float32)
-    weights_old = ones((len_), float32)
-    weights_new = array((), float32)
+    weights_old = initial_weights(len_, weights)
+    semi_sparse_ids, semi_sparse_coef = semi_sparse
     converged = False
     nr_of_check_points = 0
     difference = len_
     while not converged:
         nr_of_check_points += 1
         for step in (range(check_point)):
-            weights_new = zeros((len_), float32)
-            for (i, j) in sparse.keys():
-                weights_new[i] += sparse[(i, j)]*weights_old[j]
-            total_sum = 0.0
-            for j in semi_sparse:
-                total_sum += semi_sparse[j]*weights_old[j]
-            weights_new[1:len_] = weights_new[1:len_] + total_sum
+            weights_new = csr_dot(sparse, weights_old)
+            total_sum = dot(semi_sparse_coef, weights_old[semi_sparse_ids])
+            weights_new[1:len_] += total_sum
             if step == check_point - 1:
                 diff = weights_new - weights_old
                 difference = sqrt(dot(diff, diff))/len_
                 write_message("Finished step: %s, %s " \
                     % (str(check_point*(nr_of_check_points-1) + step), \
                         str(difference)), verbose=5)
-            weights_old = weights_new.copy()
+            weights_old = weights_new
             converged = (difference < conv_threshold)
     write_message("PageRank calculated for all recids finnished in %s steps. \
 The threshold was %s" % (str(nr_of_check_points), \
@@ -499,35 +515,27 @@ def pagerank_time(conv_threshold, check_point, len_, \
         sparse, semi_sparse, semi_sparse_coeficient, date_coef):
     """the core function of the PAGERANK_TIME method: pageRank + time decay
     returns an array with the ranks coresponding to each recid"""
-    weights_old = array((), float32)
-    weights_old = ones((len_), float32) # initial weights
-    weights_new = array((), float32)
+    weights_old = initial_weights(len_)
+    date_coef = asarray([date_coef[j] for j in range(len_)])
+    semi_sparse_date_coef = date_coef[semi_sparse]
     converged = False
     nr_of_check_points = 0
     difference = len_
     while not converged:
         nr_of_check_points += 1
         for step in (range(check_point)):
-            weights_new = zeros((len_), float32)
-            for (i, j) in sparse.keys():
-                weights_new[i] += sparse[(i, j)]*weights_old[j]
-            semi_total = 0.0
-            for j in semi_sparse:
-                semi_total += weights_old[j]*date_coef[j]
-            zero_total = 0.0
-            for i in range(len_):
-                zero_total += weights_old[i]*date_coef[i]
-            #dates = array(date_coef.keys())
-            #zero_total = dot(weights_old, dates)
-            weights_new = weights_new + semi_sparse_coeficient * semi_total + \
-                    (1.0/len_ - semi_sparse_coeficient) * zero_total
+            semi_total = dot(weights_old[semi_sparse], semi_sparse_date_coef)
+            zero_total = dot(weights_old, date_coef)
+            weights_new = csr_dot(sparse, weights_old) + \
+                semi_sparse_coeficient * semi_total + \
+                (1.0/len_ - semi_sparse_coeficient) * zero_total
             if step == check_point - 1:
                 diff = weights_new - weights_old
                 difference = sqrt(dot(diff, diff))/len_
                 write_message("Finished step: %s, %s " \
                     % (str(check_point*(nr_of_check_points-1) + step), \
                     str(difference)), verbose=5)
-            weights_old = weights_new.copy()
+            weights_old = weights_new
             converged = (difference < conv_threshold)
     write_message("PageRank calculated for all recids finnished in %s steps.\
 The threshold was %s" % (str(nr_of_check_points), \
@@ -621,27 +629,53 @@ def into_db(dict_of_ranks, rank_method_code):
     write_message("Finished writing the ranks into rnkMETHOD table", verbose=5)
 
 
+def get_previous_weights(rank_method_code, dict_of_ids):
+    """returns an array with the ranks stored by the previous run of the
+    rank method, to be used as starting point of the power iteration,
+    or None if there are none; new papers get the average rank"""
+    res = run_sql("SELECT relevance_data FROM rnkMETHODDATA, rnkMETHOD \
+        WHERE rnkMETHOD.id=id_rnkMETHOD AND rnkMETHOD.name=%s", \
+        (rank_method_code, ))
+    if not res:
+        return None
+    previous = deserialize_via_marshal(res[0][0])
+    known = [previous[recid] for recid in dict_of_ids
+             if previous.get(recid, 0) > 0]
+    if not known:
+        return None
+    weights = ones(len(dict_of_ids), float64) * (sum(known) / len(known))
+    for recid, index in dict_of_ids.iteritems():
+        if previous.get(recid, 0) > 0:
+            weights[index] = previous[recid]
+    write_message("Starting from the ranks of the previous run", verbose=5)
+    return weights
+
+
 def run_pagerank(cit, dict_of_ids, len_, ref, damping_factor, \
-            conv_threshold, check_point, dates):
+            conv_threshold, check_point, dates, weights=None):
     """returns the final form of the ranks when using pagerank method"""
     write_message("Running the PageRank method", verbose=5)
     sparse, semi_sparse, semi_sparse_coeficient = \
         construct_sparse_matrix(cit, ref, dict_of_ids, len_, damping_factor)
     weights = pagerank(conv_threshold, check_point, len_, \
-                    sparse, semi_sparse, semi_sparse_coeficient)
+                    sparse, semi_sparse, semi_sparse_coeficient, weights)
     dict_of_ranks = get_ranks(weights, dict_of_ids, 1, dates, 2)
     return dict_of_ranks
 
 
 def run_pagerank_ext(cit, dict_of_ids, ref, ext_links, \
-                        conv_threshold, check_point, alpha, beta, dates):
+                        conv_threshold, check_point, alpha, beta, dates, \
+                        weights=None):
     """returns the final form of the ranks when using pagerank_ext method"""
     write_message("Running the PageRank with external links method", verbose=5)
     len_ = len(dict_of_ids)
     sparse, semi_sparse = construct_sparse_matrix_ext(cit, ref, \
         ext_links, dict_of_ids, alpha, beta)
+    if weights is not None:
+        # the external node starts with the average rank
+        weights = concatenate(([weights.mean()], weights))
     weights = pagerank_ext(conv_threshold, check_point, \
-        len_ + 1, sparse, semi_sparse)
+        len_ + 1, sparse, semi_sparse, weights)
     dict_of_ranks = get_ranks(weights, dict_of_ids, 1, dates, 2)
     return dict_of_ranks
 
@@ -800,6 +834,13 @@ str(conv_threshold), str(check_point)), verbose=5)
             raise Exception
         if method == "pagerank_classic":
             ref = construct_ref_array(cit, dict_of_ids, len_)
+            weights = None
+            try:
+                if config.get(function, "warm_start") == "yes":
+                    weights = get_previous_weights(rank_method_code, \
+                                                   dict_of_ids)
+            except ConfigParser.NoOptionError as err:
+                write_message("%s" % err, verbose=2)
             use_ext_cit = ""
             try:
                 use_ext_cit = config.get(function, "use_external_citations")
@@ -839,10 +880,12 @@ sys.stderr)
                     write_message("Exception: %s" % err, sys.stderr)
                     raise Exception
                 dict_of_ranks = run_pagerank_ext(cit, dict_of_ids, ref, \
-                ext_links, conv_threshold, check_point, alpha, beta, dates)
+                ext_links, conv_threshold, check_point, alpha, beta, dates, \
+                weights)
             else:
                 dict_of_ranks = run_pagerank(cit, dict_of_ids, len_, ref, \
-                    damping_factor, conv_threshold, check_point, dates)
+                    damping_factor, conv_threshold, check_point, dates, \
+                    weights)
         elif method == "pagerank_time":
             try:
                 time_decay = float(config.get(function, "time_decay"))
@@ -170,6 +170,66 @@ def create_records(marcxml, verbose=CFG_BIBRECORD_DEFAULT_VERBOSE_LEVEL,
             for record_xml in record_xmls]
 
 
+def iter_records(source, verbose=CFG_BIBRECORD_DEFAULT_VERBOSE_LEVEL,
+                 correct=CFG_BIBRECORD_DEFAULT_CORRECT, parser='',
+                 keep_singletons=CFG_BIBRECORD_KEEP_SINGLETONS):
+    """
+    Iterate over the records of a MARCXML file without loading it at once.
+
+    The document is parsed incrementally and every ``<record>`` element is
+    handed over to :func:`create_record` as soon as it has been read, after
+    which it is released, so that memory usage does not depend on the size
+    of the input.  Unlike :func:`create_records`, the input must be a
+    well-formed XML document (e.g. records wrapped in a ``<collection>``),
+    which is never repaired, whatever the verbosity.
+
+    :param source: a file path or a file-like object opened for reading
+    :param parser: the parser used to build each record (see
+                   :func:`create_record`); the incremental reading is always
+                   done with lxml
+    :return: an iterator of tuples (record, status_code, list_of_errors), as
+             returned by :func:`create_record`
+    :raise InvenioBibRecordParserError: at the first syntax error of the
+        input, e.g. when it is truncated
+    """
+    for marcxml in iter_records_marcxml(source, verbose=verbose):
+        yield create_record(marcxml, verbose=verbose, correct=correct,
+                            parser=parser,
+                            keep_singletons=keep_singletons)
+
+
+def iter_records_marcxml(source, verbose=CFG_BIBRECORD_DEFAULT_VERBOSE_LEVEL):
+    """
+    Iterate over the MARCXML strings of the records of a MARCXML file.
+
+    This is the incremental reading step of :func:`iter_records`, for
+    callers wishing to build the records themselves, e.g. in other
+    processes.
+
+    :param source: a file path or a file-like object opened for reading
+    :return: an iterator of ``<record>`` XML strings, UTF-8 encoded
+    :raise InvenioBibRecordParserError: at the first syntax error of the
+        input.  The input is never repaired, whatever the verbosity, so
+        that no truncated record is returned.
+    """
+    context = etree.iterparse(source, events=('end', ), tag='{*}record',
+                              recover=False, huge_tree=True)
+    try:
+        for dummy_event, element in context:
+            marcxml = etree.tostring(element, encoding='UTF-8',
+                                     xml_declaration=False, with_tail=False)
+            # Release the parsed element and the references kept by its
+            # parent so that the tree does not grow with the input.
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            yield marcxml
+    except (etree.XMLSyntaxError, IOError) as ex1:
+        raise InvenioBibRecordParserError(str(ex1))
+    finally:
+        del context
+
+
 def create_record(marcxml, verbose=CFG_BIBRECORD_DEFAULT_VERBOSE_LEVEL,
                   correct=CFG_BIBRECORD_DEFAULT_CORRECT, parser='',
                   sort_fields_by_indicators=False,
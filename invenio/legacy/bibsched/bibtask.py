@@ -85,6 +85,8 @@ from invenio.legacy.bibsched.bibtask_config import (
     CFG_BIBTASK_DEFAULT_TASK_SETTINGS,
     CFG_BIBTASK_FIXEDTIMETASKS,
     CFG_BIBTASK_DEFAULT_GLOBAL_TASK_SETTINGS,
+    CFG_BIBTASK_PROGRESS_UPDATE_INTERVAL,
+    CFG_BIBTASK_STATUS_CHECK_INTERVAL,
     CFG_BIBSCHED_LOGDIR,
     CFG_BIBTASK_LOG_FORMAT
 )
@@ -92,7 +94,10 @@ from invenio.utils.date import parse_runtime_limit
 from invenio.utils.shell import escape_shell_arg
 from invenio.ext.email import send_email
 from invenio.legacy.bibsched.cli import bibsched_set_host, \
-                                        bibsched_get_host
+                                        bibsched_get_host, \
+                                        bibsched_notify
+from invenio.legacy.bibsched.record_locks import declare_bibupload_locks, \
+                                                 release_bibupload_locks
 
 
 # Global _TASK_PARAMS dictionary.
@@ -101,6 +106,13 @@ _TASK_PARAMS = dict(CFG_BIBTASK_DEFAULT_GLOBAL_TASK_SETTINGS)
 # Global _OPTIONS dictionary.
 _OPTIONS = {}
 
+# Progress not yet written to the task queue, and time of the last write.
+_TASK_PROGRESS = {'pending': None, 'written': 0}
+
+# Whether a status change was signalled by BibSched, and time of the last
+# read of the status from the task queue.
+_TASK_STATUS_CHECK = {'signalled': False, 'read': 0}
+
 # Which tasks don't need to ask the user for authorization?
 CFG_VALID_PROCESSES_NO_AUTH_NEEDED = ("bibupload", )
 CFG_TASK_IS_NOT_A_DEAMON = ("bibupload", )
@@ -314,6 +326,8 @@ def task_low_level_submission(name, user, *argv):
             VALUES (%s,%s,%s,%s,%s,'WAITING',%s,%s,%s,%s)""",
             (name, host, user, runtime, sleeptime, verbose_argv,
              marshal.dumps(argv), priority, sequenceid))
+        _task_declare_record_locks(task_id, name, argv)
+        bibsched_notify()
 
     except Exception:
         register_exception(alert_admin=True)
@@ -784,18 +798,39 @@ def task_set_task_param(key, value):
         _TASK_PARAMS = {key : value}
 
 def task_update_progress(msg):
-    """Updates progress information in the BibSched task table."""
+    """Updates progress information in the BibSched task table.
+
+    The progress is written at most once every
+    CFG_BIBTASK_PROGRESS_UPDATE_INTERVAL seconds; the latest message
+    reported in between is written by the next call, or by
+    task_flush_progress."""
     write_message("Updating task progress to %s." % msg, verbose=9)
     if "task_id" in _TASK_PARAMS:
+        _TASK_PROGRESS['pending'] = msg[:255]
+        if time.time() - _TASK_PROGRESS['written'] >= \
+                CFG_BIBTASK_PROGRESS_UPDATE_INTERVAL:
+            return task_flush_progress()
+
+def task_flush_progress():
+    """Write the buffered progress information in the BibSched task table."""
+    msg = _TASK_PROGRESS['pending']
+    if msg is not None and "task_id" in _TASK_PARAMS:
+        _TASK_PROGRESS['pending'] = None
+        _TASK_PROGRESS['written'] = time.time()
         return run_sql("UPDATE schTASK SET progress=%s where id=%s",
-            (msg[:255], _TASK_PARAMS["task_id"]))
+            (msg, _TASK_PARAMS["task_id"]))
 
 def task_update_status(val):
     """Updates status information in the BibSched task table."""
     write_message("Updating task status to %s." % val, verbose=9)
     if "task_id" in _TASK_PARAMS:
-        return run_sql("UPDATE schTASK SET status=%s where id=%s",
+        task_flush_progress()
+        if val in ('ABOUT TO SLEEP', 'ABOUT TO STOP'):
+            _TASK_STATUS_CHECK['signalled'] = True
+        res = run_sql("UPDATE schTASK SET status=%s where id=%s",
             (val, _TASK_PARAMS["task_id"]))
+        bibsched_notify()
+        return res
 
 def task_read_status():
     """Read status information in the BibSched task table."""
@@ -862,11 +897,34 @@ def get_datetime(var, format_string="%Y-%m-%d %H:%M:%S", now=None):
     return date
 
 
+def _task_status_may_have_changed():
+    """Tell whether the status of the task has to be read again, i.e. when
+    a change was signalled or when it was not read for
+    CFG_BIBTASK_STATUS_CHECK_INTERVAL seconds."""
+    now = time.time()
+    if _TASK_STATUS_CHECK['signalled'] or \
+            now - _TASK_STATUS_CHECK['read'] >= CFG_BIBTASK_STATUS_CHECK_INTERVAL:
+        _TASK_STATUS_CHECK['signalled'] = False
+        _TASK_STATUS_CHECK['read'] = now
+        return True
+    return False
+
 def task_sleep_now_if_required(can_stop_too=False):
     """This function should be called during safe state of BibTask,
     e.g. after flushing caches or outside of run_sql calls.
+
+    The status of the task is only read from the BibSched task table when
+    BibSched signalled a change, or every CFG_BIBTASK_STATUS_CHECK_INTERVAL
+    seconds otherwise, so that it is cheap to call in tight loops.
     """
-    status = task_read_status()
+    if _TASK_PROGRESS['pending'] is not None and \
+            time.time() - _TASK_PROGRESS['written'] >= \
+            CFG_BIBTASK_PROGRESS_UPDATE_INTERVAL:
+        task_flush_progress()
+    if _task_status_may_have_changed():
+        status = task_read_status()
+    else:
+        status = None
     write_message('Entering task_sleep_now_if_required with status=%s' % status, verbose=9)
     if status == 'ABOUT TO SLEEP':
         write_message("sleeping...")
@@ -1013,12 +1071,25 @@ def _task_submit(argv, authorization_action, authorization_msg):
          _TASK_PARAMS["sleeptime"], verbose_argv[:255], marshal.dumps(argv),
          _TASK_PARAMS['priority'], _TASK_PARAMS['sequence-id'],
          _TASK_PARAMS['host']))
+    _task_declare_record_locks(_TASK_PARAMS['task_id'], task_name, argv)
+    bibsched_notify()
 
     ## update task number:
     write_message("Task #%d submitted." % _TASK_PARAMS['task_id'])
     return _TASK_PARAMS['task_id']
 
 
+def _task_declare_record_locks(task_id, task_name, argv):
+    """Declare the records touched by a bibupload task, so that BibSched
+    can run it together with the bibuploads touching other records.
+    Without declaration, the task simply runs alone."""
+    if task_name == 'bibupload':
+        try:
+            declare_bibupload_locks(task_id, argv)
+        except Exception:
+            register_exception(alert_admin=True)
+
+
 def task_get_options(task_id, task_name):
     """Returns options for the task 'id' read from the BibSched task
     queue table."""
@@ -1113,6 +1184,10 @@ def _task_run(task_run_fnc):
     Return True in case of success and False in case of failure."""
 
     from invenio.legacy.bibsched.bibtasklet import _TASKLETS
+    ## The status changes are signalled as soon as the pid file exists
+    signal.signal(signal.SIGUSR1, cb_task_sig_status)
+    ## ... without interrupting the blocking system calls of the task
+    signal.siginterrupt(signal.SIGUSR1, False)
     ## We prepare the pid file inside /prefix/var/run/taskname_id.pid
     check_running_process_user()
     try:
@@ -1228,6 +1303,9 @@ def _task_run(task_run_fnc):
             write_message("Task #%d finished. [%s]" % (_TASK_PARAMS['task_id'], task_status))
         ## Removing the pid
         os.remove(pidfile_name)
+        if _TASK_PARAMS['task_name'] == 'bibupload':
+            release_bibupload_locks(_TASK_PARAMS['task_id'])
+        bibsched_notify()
 
     #Lets call the post-process tasklets
     if task_get_task_param("post-process"):
@@ -1288,6 +1366,18 @@ def _usage(exitcode=1, msg="", help_specific_usage="", description=""):
         sys.stderr.write(description)
     sys.exit(exitcode)
 
+def task_init_worker_process():
+    """Restore the default signal handlers in a worker process of the task.
+
+    To be used as initializer of the multiprocessing pools of a task, so that
+    the signals sent by BibSched are only handled by the task process itself.
+    """
+    for signum in (signal.SIGUSR2, signal.SIGTSTP, signal.SIGTERM,
+                   signal.SIGQUIT, signal.SIGABRT):
+        signal.signal(signum, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
 def cb_task_sig_sleep(sig, frame):
     """Signal handler for the 'sleep' signal sent by BibSched."""
     signal.signal(signal.SIGTSTP, signal.SIG_IGN)
@@ -1326,6 +1416,13 @@ def cb_task_sig_debug(sig, frame):
     from rfoo.utils import rconsole
     rconsole.spawn_server()
 
+def cb_task_sig_status(sig, frame): # pylint: disable=W0613
+    """Signal handler for the status changes notified by BibSched.
+
+    The new status is read at the next call of task_sleep_now_if_required,
+    where it is safe to act upon it."""
+    _TASK_STATUS_CHECK['signalled'] = True
+
 def cb_task_sig_dumb(sig, frame):
     """Dumb signal handler."""
     pass
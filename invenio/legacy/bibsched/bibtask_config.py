@@ -50,6 +50,14 @@ CFG_BIBTASK_FIXEDTIMETASKS = ("oaiharvest", )
 # Task that should not be reinstatiated
 CFG_BIBTASK_NON_REPETITIVE_TASK = ('bibupload', )
 
+# Minimum interval (in seconds) between two writes of the progress of a task
+# to the task queue; the progress reported in between is buffered
+CFG_BIBTASK_PROGRESS_UPDATE_INTERVAL = 0.5
+
+# Maximum interval (in seconds) between two reads of the status of a task
+# from the task queue, for the status changes that were not signalled
+CFG_BIBTASK_STATUS_CHECK_INTERVAL = 10
+
 # Default options for any bibtasks
 # This is then overridden by each specific BibTask in
 # CFG_BIBTASK_DEFAULT_TASK_SETTINGS
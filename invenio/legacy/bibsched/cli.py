@@ -29,6 +29,8 @@ import re
 import datetime
 import marshal
 import getopt
+import select
+import socket
 from itertools import chain
 from socket import gethostname
 from subprocess import Popen
@@ -57,6 +59,8 @@ from invenio.config import \
     CFG_VERSION, \
     CFG_BIBSCHED_NEVER_STOPS
 from invenio.legacy.dbquery import run_sql, real_escape_string
+from invenio.legacy.bibsched.record_locks import are_locks_disjoint, \
+    get_bibupload_locks, get_runnable_bibuploads, release_bibupload_locks
 from invenio.ext.logging import register_exception
 from invenio.utils.shell import run_shell_command
 
@@ -72,6 +76,9 @@ ACTIVE_STATUS = ('SCHEDULED', 'ABOUT TO SLEEP', 'ABOUT TO STOP',
 
 SHIFT_RE = re.compile(r"([-\+]{0,1})([\d]+)([dhms])")
 
+## Local socket on which bibsched is notified of the changes of the queue
+CFG_BIBSCHED_SOCKET = os.path.join(CFG_RUNDIR, 'bibsched.sock')
+
 
 def register_emergency(msg, recipients=None):
     """Launch an emergency. This means to send email messages to each
@@ -276,6 +283,7 @@ def gc_tasks(verbose=False, statuses=None, since=None, tasks=None): # pylint: di
                              runtime<%%s""" % status_query, (task, date))
             write_message('Archived %s %s tasks (created before %s) with %s'
                                             % (res, task, date, status_query))
+    release_bibupload_locks()
 
 
 def spawn_task(command, wait=False):
@@ -316,11 +324,33 @@ def bibsched_get_status(task_id):
 def bibsched_set_status(task_id, status, when_status_is=None):
     """Update the status of task_id."""
     if when_status_is is None:
-        return run_sql("UPDATE schTASK SET status=%s WHERE id=%s",
-                       (status, task_id))
+        res = run_sql("UPDATE schTASK SET status=%s WHERE id=%s",
+                      (status, task_id))
     else:
-        return run_sql("UPDATE schTASK SET status=%s WHERE id=%s AND status=%s",
-                       (status, task_id, when_status_is))
+        res = run_sql("UPDATE schTASK SET status=%s WHERE id=%s AND status=%s",
+                      (status, task_id, when_status_is))
+    if res and status in ('ABOUT TO SLEEP', 'ABOUT TO STOP'):
+        ## Let the task know it has to read its new status
+        bibsched_send_signal(task_id, signal.SIGUSR1)
+    bibsched_notify()
+    return res
+
+
+def bibsched_notify():
+    """Wake up the bibsched daemon of this host, if any, because the task
+    queue has changed.
+
+    The notification is best effort: when bibsched is not listening, it
+    will notice the change at its next refresh anyway.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.setblocking(0)
+        sock.sendto(str(os.getpid()), CFG_BIBSCHED_SOCKET)
+    except socket.error:
+        pass
+    finally:
+        sock.close()
 
 
 def bibsched_set_progress(task_id, progress):
@@ -426,6 +456,8 @@ class BibSched(object):
         self.helper_modules = CFG_BIBTASK_VALID_TASKS
         ## All the tasks in the queue that the node is allowed to manipulate
         self.node_relevant_bibupload_tasks = ()
+        ## The record locks of the declared bibupload tasks
+        self.bibupload_locks = {}
         self.node_relevant_waiting_tasks = ()
         self.node_sleeping_tasks = ()
         self.node_active_tasks = ()
@@ -436,6 +468,71 @@ class BibSched(object):
         self.mono_tasks_all_nodes = ()
 
         self.allowed_task_types = CFG_BIBSCHED_NODE_TASKS.get(self.hostname, CFG_BIBTASK_VALID_TASKS)
+        self.notifications = self.listen_for_notifications()
+
+    def listen_for_notifications(self):
+        """Bind the socket on which the tasks and the tools of this host
+        notify the changes of the queue.
+        @return: the socket, or None when it cannot be bound, in which case
+            bibsched only polls the queue.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            if os.path.exists(CFG_BIBSCHED_SOCKET):
+                os.remove(CFG_BIBSCHED_SOCKET)
+            sock.bind(CFG_BIBSCHED_SOCKET)
+        except (OSError, socket.error), err:
+            Log("Cannot listen on %s, falling back to polling: %s"
+                % (CFG_BIBSCHED_SOCKET, err))
+            sock.close()
+            return None
+        sock.setblocking(0)
+        return sock
+
+    def close_notifications(self):
+        """Stop listening for notifications."""
+        if self.notifications is not None:
+            self.notifications.close()
+            self.notifications = None
+            try:
+                os.remove(CFG_BIBSCHED_SOCKET)
+            except OSError:
+                pass
+
+    def wait_for_changes(self, timeout=CFG_BIBSCHED_REFRESHTIME):
+        """Sleep until another process notifies a change of the queue, or
+        at most TIMEOUT seconds.
+
+        The notifications sent by bibsched itself are discarded, as it
+        already knows about the changes it makes.
+        """
+        if self.notifications is None:
+            time.sleep(timeout)
+            return
+        deadline = time.time() + timeout
+        mypid = str(os.getpid())
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            try:
+                readable = select.select([self.notifications], [], [],
+                                         remaining)[0]
+            except select.error:
+                ## Interrupted by a signal
+                return
+            if not readable:
+                return
+            woken = False
+            try:
+                while True:
+                    if self.notifications.recv(64) != mypid:
+                        woken = True
+            except socket.error:
+                ## No more pending notifications
+                pass
+            if woken:
+                return
 
     def tie_task_to_host(self, task_id):
         """Sets the hostname of a task to the machine executing this script
@@ -478,6 +575,15 @@ class BibSched(object):
 
         return task1.proc != task2.proc
 
+    def are_concurrent_bibuploads(self, task1, task2):
+        """Return True when the two tasks are bibuploads touching disjoint
+        records, which can run concurrently even though bibupload is a
+        monotask"""
+        return task1.id != task2.id \
+            and task1.proc == task2.proc == 'bibupload' \
+            and are_locks_disjoint(self.bibupload_locks.get(task1.id),
+                                   self.bibupload_locks.get(task2.id))
+
     def is_task_non_concurrent(self, task1, task2):
         for non_concurrent_tasks in CFG_BIBSCHED_NON_CONCURRENT_TASKS:
             if (task1.proc.split(':')[0] in non_concurrent_tasks
@@ -513,7 +619,8 @@ class BibSched(object):
                 to_stop.append(t)
 
         if is_monotask(task.proc):
-            to_sleep = [t for t in task_set if t.status != 'SLEEPING']
+            to_sleep = [t for t in task_set if t.status != 'SLEEPING'
+                        and not self.are_concurrent_bibuploads(task, t)]
         else:
             for t in task_set:
                 if t.status != 'SLEEPING' and self.is_task_non_concurrent(task, t):
@@ -556,6 +663,8 @@ class BibSched(object):
             # check if we need to sleep ourselves for monotasks
             # to be able to run
             for t in self.mono_tasks_all_nodes:
+                if t.id == task.id or self.are_concurrent_bibuploads(task, t):
+                    continue
                 # 2 cases here
                 # If a monotask is running, we want to sleep
                 # If a monotask is waiting, we want to sleep if our priority
@@ -583,6 +692,8 @@ class BibSched(object):
                 return False
 
             lower, higher = self.split_active_tasks_by_priority(task)
+            higher = [t for t in higher
+                      if not self.are_concurrent_bibuploads(task, t)]
             Log('lower: %r' % lower, debug)
             Log('higher: %r' % higher, debug)
 
@@ -648,7 +759,8 @@ class BibSched(object):
 
             ## Check for monotasks wanting to run
             for t in self.mono_tasks_all_nodes:
-                if task.priority < t.priority:
+                if task.priority < t.priority \
+                   and not self.are_concurrent_bibuploads(task, t):
                     Log("Cannot run because there is a monotask with higher priority: %s %s" % (t.id, t.proc), debug)
                     return False
 
@@ -671,8 +783,10 @@ class BibSched(object):
 
             procname = task.proc.split(':')[0]
             if not tasks_to_stop and not tasks_to_sleep:
-                if is_monotask(task.proc) and self.active_tasks_all_nodes:
-                    Log("Cannot run because this is a monotask and there are other tasks running: %s" % (self.active_tasks_all_nodes, ), debug)
+                others = [t for t in self.active_tasks_all_nodes
+                          if not self.are_concurrent_bibuploads(task, t)]
+                if is_monotask(task.proc) and others:
+                    Log("Cannot run because this is a monotask and there are other tasks running: %s" % (others, ), debug)
                     return False
 
                 if task.proc not in CFG_BIBTASK_FIXEDTIMETASKS and len(self.node_active_tasks) >= CFG_BIBSCHED_MAX_NUMBER_CONCURRENT_TASKS:
@@ -717,18 +831,17 @@ class BibSched(object):
                         Log("Task #%d (%s) started" % (task.id, task.proc))
                         ### Relief the lock for the BibTask, it is safe now to do so
                         spawn_task(command, wait=is_monotask(task.proc))
-                        count = 10
+                        deadline = time.time() + 10 * CFG_BIBSCHED_REFRESHTIME
                         while run_sql("""SELECT status FROM schTASK
                                          WHERE id=%s AND status='SCHEDULED'""",
                                       (task.id, )):
-                            ## Polling to wait for the task to really start,
+                            ## Waiting for the task to really start,
                             ## in order to avoid race conditions.
-                            if count <= 0:
+                            if time.time() >= deadline:
                                 Log("Process %s (task_id: %s) was launched but seems not to be able to reach RUNNING status." % (task.proc, task.id))
                                 bibsched_set_status(task.id, "ERROR", "SCHEDULED")
                                 return True
-                            time.sleep(CFG_BIBSCHED_REFRESHTIME)
-                            count -= 1
+                            self.wait_for_changes()
                     return True
                 else:
                     raise StandardError("%s is not in the allowed modules" % procname)
@@ -751,9 +864,17 @@ class BibSched(object):
                         Log("Cannot run because we are waiting for #%s to sleep" % t.id, debug)
 
                 if changes:
-                    time.sleep(CFG_BIBSCHED_REFRESHTIME)
+                    self.wait_for_changes()
                 return changes
 
+    def handle_bibupload_tasks(self):
+        """Try to run the bibupload tasks allowed to run, in order.
+        Return True when task_status need to be refreshed"""
+        for task in self.node_relevant_bibupload_tasks:
+            if self.handle_task(task):
+                return True
+        return False
+
     def check_errors(self):
         errors = run_sql("""SELECT id,proc,status FROM schTASK
                             WHERE status = 'ERROR'
@@ -807,13 +928,26 @@ class BibSched(object):
 
         # The bibupload tasks are sorted by id,
         # which means by the order they were scheduled
-        self.node_relevant_bibupload_tasks = Task.from_resultset(run_sql(
+        bibupload_tasks = Task.from_resultset(run_sql(
             """SELECT id, proc, runtime, status, priority, host, sequenceid
-               FROM schTASK WHERE status IN ('WAITING', 'SLEEPING')
+               FROM schTASK WHERE status IN ('WAITING', 'RUNNING',
+                        'SLEEPING', 'ABOUT TO STOP', 'ABOUT TO SLEEP',
+                        'SCHEDULED', 'CONTINUING')
                AND proc = 'bibupload'
                AND runtime <= NOW()
-               ORDER BY FIELD(status, 'SLEEPING', 'WAITING'),
-                        id ASC LIMIT 1""", n=1))
+               ORDER BY id ASC"""))
+        self.bibupload_locks = get_bibupload_locks(
+            [t.id for t in bibupload_tasks], self.bibupload_locks)
+        ## Only the bibuploads not touching the records of the bibuploads
+        ## started or scheduled before them can run
+        runnable = get_runnable_bibuploads(
+            [(t.id, t.status != 'WAITING') for t in bibupload_tasks],
+            self.bibupload_locks)
+        self.node_relevant_bibupload_tasks = \
+            [t for t in bibupload_tasks
+             if t.id in runnable and t.status == 'SLEEPING'] + \
+            [t for t in bibupload_tasks
+             if t.id in runnable and t.status == 'WAITING']
         ## The other tasks are sorted by priority
         self.waiting_tasks_all_nodes = Task.from_resultset(run_sql(
             """SELECT id, proc, runtime, status, priority, host, sequenceid
@@ -914,19 +1048,24 @@ class BibSched(object):
                 break
         else:
             # If nothing has changed we can go on to run tasks.
+            bibuploads_handled = False
             for task in self.node_relevant_waiting_tasks:
-                if task.proc == 'bibupload' \
-                   and self.node_relevant_bibupload_tasks:
-                    ## We switch in bibupload serial mode!
-                    ## which means we execute the first next bibupload.
-                    if self.handle_task(self.node_relevant_bibupload_tasks[0]):
+                if task.proc == 'bibupload':
+                    ## We switch in bibupload ordered mode!
+                    ## which means we execute the next bibuploads that do
+                    ## not touch the records of the previous ones.
+                    ## They are all handled at once, the first time.
+                    if bibuploads_handled:
+                        continue
+                    bibuploads_handled = True
+                    if self.handle_bibupload_tasks():
                         ## Something has changed
                         break
                 elif self.handle_task(task):
                     ## Something has changed
                     break
             else:
-                time.sleep(CFG_BIBSCHED_REFRESHTIME)
+                self.wait_for_changes()
 
     def watch_loop(self):
         ## Cleaning up scheduled task not run because of bibsched being
@@ -954,7 +1093,7 @@ class BibSched(object):
                             ## Something has changed
                             break
                     else:
-                        time.sleep(CFG_BIBSCHED_REFRESHTIME)
+                        self.wait_for_changes()
         except Exception as err:
             register_exception(alert_admin=True)
             try:
@@ -1118,6 +1257,7 @@ def start(verbose=True, debug=False):
     try:
         sched.watch_loop()
     finally:
+        sched.close_notifications()
         try:
             os.remove(pidfile)
         except OSError:
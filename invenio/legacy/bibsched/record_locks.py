@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Record-level locks of the bibupload tasks.
+
+When a bibupload task is submitted, the records it is going to touch
+are declared in schTASKRECORD: every recid, external system number,
+external OAI id, OAI id and DOI found in its input, together with the
+recids these identifiers currently belong to.  BibSched runs at the same
+time the bibupload tasks having disjoint locks, while the tasks sharing
+a lock still run in the order they were submitted.  The tasks without
+any declaration, e.g. submitted before this table existed or with an
+unreadable input, keep on running alone.
+"""
+
+from invenio.config import \
+    CFG_OAI_ID_FIELD, \
+    CFG_BIBUPLOAD_EXTERNAL_OAIID_TAG, \
+    CFG_BIBUPLOAD_EXTERNAL_SYSNO_TAG
+from invenio.legacy.bibrecord import iter_records, record_get_field_values
+from invenio.legacy.bibrecord.bibrecord_config import \
+    InvenioBibRecordParserError
+from invenio.legacy.dbquery import run_sql, run_sql_many
+
+## The tags identifying the records matched by bibupload, besides 001
+CFG_BIBSCHED_RECORD_LOCKS_TAGS = (CFG_BIBUPLOAD_EXTERNAL_SYSNO_TAG,
+                                  CFG_BIBUPLOAD_EXTERNAL_OAIID_TAG,
+                                  CFG_OAI_ID_FIELD,
+                                  '0247_a')
+
+## Number of identifiers resolved with one query
+CFG_BIBSCHED_RECORD_LOCKS_CHUNK_SIZE = 1000
+
+## Lock written by every task once all its other locks are declared, so
+## that the tasks touching only new records or being declared can be told
+## apart.
+DECLARED_LOCK = ''
+
+
+def _recid_lock(recid):
+    """Return the lock of a record identified by its recid."""
+    try:
+        return 'recid:%d' % int(recid)
+    except ValueError:
+        return 'recid:%s' % recid
+
+
+def get_recids_from_identifiers(tag, values):
+    """Return the recids having one of the VALUES in TAG."""
+    bibxxx = 'bib%sx' % tag[0:2]
+    values = list(values)
+    recids = set()
+    for i in range(0, len(values), CFG_BIBSCHED_RECORD_LOCKS_CHUNK_SIZE):
+        chunk = values[i:i + CFG_BIBSCHED_RECORD_LOCKS_CHUNK_SIZE]
+        recids.update(row[0] for row in run_sql(
+            """SELECT bb.id_bibrec FROM bibrec_%(bibxxx)s AS bb,
+               %(bibxxx)s AS b WHERE b.tag=%%s AND b.value IN (%(values)s)
+               AND bb.id_bibxxx=b.id""" % {
+                'bibxxx': bibxxx,
+                'values': ', '.join(['%s'] * len(chunk))},
+            [tag] + chunk))
+    return recids
+
+
+def get_marcxml_locks(paths):
+    """Return the locks of the records of the MARCXML files PATHS.
+
+    @return: the set of locks, or None if one of the files cannot be read.
+    """
+    locks = set()
+    identifiers = dict((tag, set()) for tag in CFG_BIBSCHED_RECORD_LOCKS_TAGS)
+    for path in paths:
+        try:
+            for record, dummy_status, dummy_errors in iter_records(path, 1):
+                if record is None:
+                    return None
+                for recid in record_get_field_values(record, '001'):
+                    locks.add(_recid_lock(recid.strip()))
+                for tag, values in identifiers.iteritems():
+                    values.update(value.strip() for value in
+                                  record_get_field_values(record, tag[0:3],
+                                                          tag[3], tag[4],
+                                                          tag[5]))
+        except InvenioBibRecordParserError:
+            return None
+    for tag, values in identifiers.iteritems():
+        values.discard('')
+        if values:
+            locks.update('%s:%s' % (tag, value) for value in values)
+            locks.update(_recid_lock(recid) for recid in
+                         get_recids_from_identifiers(tag, values))
+    return locks
+
+
+def declare_bibupload_locks(task_id, argv):
+    """Declare the locks of the bibupload task TASK_ID, from its ARGV.
+
+    Like in bibupload, the input files are recognized because their
+    paths are absolute.
+    """
+    paths = [arg for arg in argv[1:] if arg.startswith('/')]
+    if not paths:
+        return
+    locks = get_marcxml_locks(paths)
+    if locks is None:
+        return
+    run_sql_many("""INSERT IGNORE INTO schTASKRECORD (id_schTASK, record)
+                    VALUES (%s, %s)""",
+                 [(task_id, lock[:255]) for lock in locks])
+    run_sql("""INSERT IGNORE INTO schTASKRECORD (id_schTASK, record)
+               VALUES (%s, %s)""", (task_id, DECLARED_LOCK))
+
+
+def release_bibupload_locks(task_id=None):
+    """Remove the locks of the task TASK_ID, or of all the tasks that
+    are no longer in the queue."""
+    if task_id is None:
+        run_sql("""DELETE schTASKRECORD FROM schTASKRECORD
+                   LEFT JOIN schTASK ON schTASKRECORD.id_schTASK=schTASK.id
+                   WHERE schTASK.id IS NULL""")
+    else:
+        run_sql("DELETE FROM schTASKRECORD WHERE id_schTASK=%s", (task_id, ))
+
+
+def get_bibupload_locks(task_ids, known_locks=None):
+    """Return the dictionary of the locks of the declared TASK_IDS.
+
+    As the declarations do not change, the locks already in KNOWN_LOCKS
+    are not read again.
+    """
+    known_locks = known_locks or {}
+    locks = dict((task_id, known_locks[task_id]) for task_id in task_ids
+                 if task_id in known_locks)
+    missing = [task_id for task_id in task_ids if task_id not in locks]
+    if missing:
+        for task_id, lock in run_sql(
+                """SELECT id_schTASK, record FROM schTASKRECORD
+                   WHERE id_schTASK IN (%s)"""
+                % ', '.join(['%s'] * len(missing)), missing):
+            locks.setdefault(task_id, set()).add(lock)
+        for task_id in missing:
+            if task_id not in locks:
+                continue
+            if DECLARED_LOCK in locks[task_id]:
+                locks[task_id].discard(DECLARED_LOCK)
+                locks[task_id] = frozenset(locks[task_id])
+            else:
+                ## The declaration is still being written
+                del locks[task_id]
+    return locks
+
+
+def are_locks_disjoint(locks1, locks2):
+    """Return True when two tasks having LOCKS1 and LOCKS2 can run at
+    the same time, i.e. when both are declared and disjoint."""
+    return locks1 is not None and locks2 is not None \
+        and locks1.isdisjoint(locks2)
+
+
+def get_runnable_bibuploads(tasks, locks):
+    """Return the set of the bibupload tasks allowed to run.
+
+    @param tasks: the list of (task_id, started) of the bibupload tasks,
+        in the order they were submitted, where STARTED tells whether
+        the task is already running or sleeping.
+    @param locks: the dictionary of the locks of the declared tasks.
+    @return: the set of task ids of the started tasks, which can always
+        be woken up, and of the waiting tasks not sharing any lock with
+        a started task or with a waiting task submitted before.
+    """
+    runnable = set()
+    locked = set()
+    exclusive = False
+    for task_id, started in tasks:
+        if started:
+            runnable.add(task_id)
+            if task_id in locks:
+                locked.update(locks[task_id])
+            else:
+                exclusive = True
+    first = not runnable
+    for task_id, started in tasks:
+        if started:
+            continue
+        if task_id in locks:
+            if not exclusive and locked.isdisjoint(locks[task_id]):
+                runnable.add(task_id)
+            locked.update(locks[task_id])
+        else:
+            if first:
+                runnable.add(task_id)
+            exclusive = True
+        if exclusive:
+            break
+        first = False
+    return runnable
@@ -62,6 +62,7 @@ from invenio.base.globals import cfg
 from invenio.config import CFG_ETCDIR
 from invenio.legacy.bibsort.engine import run_bibsort_update, \
                             run_bibsort_rebalance
+from invenio.legacy.miscutil.data_cacher import publish_data_change
 from invenio.legacy.bibsched.bibtask import task_init, write_message, \
     task_set_option, task_get_option
 
@@ -370,6 +371,10 @@ def task_run_core():
         write_message("This action is not possible. \
         See the --help for available actions.", sys.stderr)
 
+    if executed_correctly and cmd in ('sort', 'rebalance'):
+        # let the caches of sorted data know that they are outdated
+        publish_data_change('bsrMETHODDATA')
+
     write_message('bibsort exiting..')
     return executed_correctly
 
@@ -31,6 +31,7 @@ from invenio.legacy.bibsort.washer import BibSortWasher, InvenioBibSortWasherNot
 from invenio.legacy.dbquery import deserialize_via_marshal, serialize_via_marshal, run_sql, Error
 from invenio.legacy.search_engine import get_field_tags, search_pattern
 from invenio.utils.date import datetime, strftime
+from invenio.modules.sorter.ranks import store_sort_ranks, delete_sort_ranks
 
 import invenio.legacy.template
 websearch_templates = invenio.legacy.template.load('websearch')
@@ -294,6 +295,7 @@ def run_sorting_method(recids, method_name, method_id, definition, washer):
                                           sorted_data_list[-1])
         if not executed:
             return False
+    store_sort_ranks(method_name, sorted_data_dict)
     return True
 
 
@@ -651,6 +653,7 @@ def update_bibsort_tables(recids, method, update_timestamp = True):
             write_message("[%s] The bucket data for method %s has not been updated" \
                           %(method, err), sys.stderr)
             return False
+        store_sort_ranks(method, data_dict_ordered)
     return True
 
 
@@ -852,6 +855,7 @@ def run_bibsort_update(recids=None, method_list=None):
         task_update_progress("Deleting data for method %s" %method)
         write_message('Starting deleting the data for RNK method %s' %method, verbose=5)
         executed_ok = delete_bibsort_data_for_method(bibsort_methods[method]['id'])
+        delete_sort_ranks(method)
         if not executed_ok:
             write_message('Method %s could not be deleted correctly, aborting..' \
                           %method, sys.stderr)
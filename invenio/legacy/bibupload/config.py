@@ -34,3 +34,9 @@ CFG_BIBUPLOAD_DELETE_VALUE = "__DELETE_FIELDS__"
 
 CFG_BIBUPLOAD_OPT_MODES = ['insert', 'replace', 'replace_or_insert', 'reference',
         'correct', 'append', 'holdingpen', 'delete']
+
+# number of (tag, value) pairs looked up in a bibxxx table per query
+CFG_BIBUPLOAD_BIBXXX_QUERY_CHUNK_SIZE = 500
+
+# number of records sent at once to a worker by bibupload --workers
+CFG_BIBUPLOAD_WORKERS_CHUNK_SIZE = 50
@@ -36,6 +36,9 @@ from zlib import compress
 import socket
 import marshal
 import copy
+from collections import deque
+from itertools import chain, islice
+from multiprocessing import Pool
 import tempfile
 import urlparse
 import urllib2
@@ -63,9 +66,14 @@ from invenio.legacy.bibupload.config import CFG_BIBUPLOAD_CONTROLFIELD_TAGS, \
     CFG_BIBUPLOAD_SPECIAL_TAGS, \
     CFG_BIBUPLOAD_DELETE_CODE, \
     CFG_BIBUPLOAD_DELETE_VALUE, \
-    CFG_BIBUPLOAD_OPT_MODES
-from invenio.legacy.dbquery import run_sql
-from invenio.legacy.bibrecord import create_records, \
+    CFG_BIBUPLOAD_OPT_MODES, \
+    CFG_BIBUPLOAD_BIBXXX_QUERY_CHUNK_SIZE, \
+    CFG_BIBUPLOAD_WORKERS_CHUNK_SIZE
+from invenio.legacy.dbquery import run_sql, run_sql_many
+from invenio.legacy.bibrecord import create_record, \
+                              create_records, \
+                              iter_records, \
+                              iter_records_marcxml, \
                               record_add_field, \
                               record_delete_field, \
                               record_xml_output, \
@@ -84,6 +92,8 @@ from invenio.legacy.bibrecord import create_records, \
                               record_has_field, \
                               records_identical, \
                               record_drop_duplicate_fields
+from invenio.legacy.bibrecord.bibrecord_config import \
+    InvenioBibRecordParserError
 from invenio.legacy.search_engine import get_record, record_exists, search_pattern
 from invenio.utils.date import convert_datestruct_to_datetext
 from invenio.ext.logging import register_exception
@@ -94,12 +104,13 @@ from invenio.config import CFG_BIBDOCFILE_FILEDIR
 from invenio.legacy.bibsched.bibtask import task_init, write_message, \
     task_set_option, task_get_option, task_get_task_param, \
     task_update_progress, task_sleep_now_if_required, fix_argv_paths, \
-    RecoverableError
+    task_init_worker_process, RecoverableError
 from invenio.legacy.bibdocfile.api import BibRecDocs, file_strip_ext, normalize_format, \
     get_docname_from_url, check_valid_url, download_url, \
     KEEP_OLD_VALUE, decompose_bibdocfile_url, InvenioBibDocFileError, \
     bibdocfile_url_p, CFG_BIBDOCFILE_AVAILABLE_FLAGS, guess_format_from_url, \
     BibRelation, MoreInfo
+from invenio.legacy.miscutil.data_cacher import publish_data_change
 
 from invenio.legacy.search_engine import search_pattern
 
@@ -830,11 +841,18 @@ def print_out_bibupload_statistics():
 
 def open_marc_file(path):
     """Open a file and return the data"""
+    marc_file = open_marc_stream(path)
     try:
-        # open the file containing the marc document
-        marc_file = open(path, 'r')
         marc = marc_file.read()
+    finally:
         marc_file.close()
+    return marc
+
+def open_marc_stream(path):
+    """Open a file and return it as a stream, without reading it"""
+    try:
+        # open the file containing the marc document
+        marc_file = open(path, 'rb')
     except IOError as erro:
         write_message("ERROR: %s" % erro, verbose=1, stream=sys.stderr)
         if erro.errno == 2:
@@ -844,23 +862,84 @@ def open_marc_file(path):
         else:
             e = StandardError('File not accessible: %s' % path)
         raise e
-    return marc
+    return marc_file
 
 def xml_marc_to_records(xml_marc):
     """create the records"""
     # Creation of the records from the xml Marc in argument
-    recs = create_records(xml_marc, 1, 1)
-    if recs == []:
+    return list(_check_parsed_records(create_records(xml_marc, 1, 1)))
+
+def iter_marc_stream_records(marc_stream, workers=1):
+    """Lazily create the records of a MARCXML stream, one at a time
+
+    With more than one worker, the records are parsed by a pool of
+    processes, while still being returned in the order of the stream.
+    Only the parsing is parallel, the caller handles the records one by one.
+
+    The whole stream is checked first, so that a malformed or truncated
+    file is rejected before any of its records is returned.
+    """
+    _check_marc_stream(marc_stream)
+    if workers > 1:
+        recs = _iter_records_in_pool(marc_stream, workers)
+    else:
+        recs = iter_records(marc_stream, 1, 1)
+    return _check_parsed_records(recs)
+
+def _check_marc_stream(marc_stream):
+    """Check that a MARCXML stream is well-formed, then rewind it"""
+    position = marc_stream.tell()
+    try:
+        for dummy in iter_records_marcxml(marc_stream, verbose=1):
+            pass
+    except InvenioBibRecordParserError as err:
+        msg = "ERROR: MARCXML file has wrong format: %s" % (err, )
+        write_message(msg, verbose=1, stream=sys.stderr)
+        raise RecoverableError(msg)
+    marc_stream.seek(position)
+
+def _iter_records_in_pool(marc_stream, workers):
+    """Build the records of a MARCXML stream in a pool of WORKERS processes"""
+    pool = Pool(workers, initializer=task_init_worker_process)
+    # chunks of records parsed ahead of the upload, at most 2 * workers
+    pending = deque()
+    try:
+        marcxmls = iter_records_marcxml(marc_stream, verbose=1)
+        while True:
+            chunk = list(islice(marcxmls, CFG_BIBUPLOAD_WORKERS_CHUNK_SIZE))
+            if not chunk:
+                break
+            pending.append(pool.apply_async(_create_records_in_worker,
+                                            (chunk, )))
+            if len(pending) > 2 * workers:
+                for rec in pending.popleft().get():
+                    yield rec
+        while pending:
+            for rec in pending.popleft().get():
+                yield rec
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _create_records_in_worker(marcxmls):
+    """Create the records from a list of MARCXML strings"""
+    return [create_record(marcxml, 1, 1) for marcxml in marcxmls]
+
+def _check_parsed_records(recs):
+    """Yield the parsed records, failing if the input could not be parsed"""
+    first = True
+    for rec in recs:
+        if rec[0] is None:
+            msg = "ERROR: MARCXML file has wrong format: %s" % (rec, )
+            write_message(msg, verbose=1, stream=sys.stderr)
+            raise RecoverableError(msg)
+        first = False
+        yield rec[0]
+    if first:
         msg = "ERROR: Cannot parse MARCXML file."
         write_message(msg, verbose=1, stream=sys.stderr)
         raise StandardError(msg)
-    elif recs[0][0] is None:
-        msg = "ERROR: MARCXML file has wrong format: %s" % recs
-        write_message(msg, verbose=1, stream=sys.stderr)
-        raise RecoverableError(msg)
-    else:
-        recs = map((lambda x:x[0]), recs)
-        return recs
 
 def find_record_format(rec_id, bibformat):
     """Look whether record REC_ID is formatted in FORMAT,
@@ -1361,6 +1440,86 @@ def insert_record_bibrec_bibxxx(table_name, id_bibxxx,
         return 1
     return res
 
+def insert_record_bibxxx_many(tag_values, pretend=False):
+    """Insert many (tag, value) pairs into the bibxxx tables at once.
+
+    This is the bulk version of insert_record_bibxxx(): the existing rows
+    are looked up with a few set-based queries per bibxxx table and the
+    missing ones are inserted together.
+
+    @param tag_values: list of (tag, value) pairs
+    @return: dictionary mapping every (tag, value) pair to the same
+        (table_name, id_bibxxx) tuple insert_record_bibxxx() would return
+    """
+    # group the distinct pairs by table, keeping their order so that new
+    # rows get their identifiers in the same order as one by one insertion
+    pairs_by_table = {}
+    seen = set()
+    for tag, value in tag_values:
+        if (tag, value) not in seen:
+            seen.add((tag, value))
+            table_name = 'bib' + tag[0:2] + 'x'
+            pairs_by_table.setdefault(table_name, []).append((tag, value))
+
+    ret = {}
+    for table_name, pairs in iteritems(pairs_by_table):
+        found = _get_bibxxx_ids(table_name, pairs)
+        missing = []
+        for tag, value in pairs:
+            key = (tag.lower(), value)
+            if key not in found:
+                # a pair may be repeated with a different case of the tag
+                found[key] = None
+                missing.append((tag, value))
+        if missing:
+            if pretend:
+                for tag, value in missing:
+                    found[(tag.lower(), value)] = 1
+            else:
+                query = """INSERT INTO %s """ % table_name
+                query += """ (tag, value) values (%s , %s)"""
+                run_sql_many(query, missing)
+                found.update(_get_bibxxx_ids(table_name, missing))
+        for tag, value in pairs:
+            ret[(tag, value)] = (table_name, found[(tag.lower(), value)])
+    return ret
+
+def _get_bibxxx_ids(table_name, pairs):
+    """Return the ids of the rows of TABLE_NAME matching the (tag, value) PAIRS.
+
+    The result is a dictionary keyed by (lowercased tag, value), since tags
+    are compared in a case insensitive way by the database, while values
+    are compared for binary equality in Python, as in insert_record_bibxxx().
+    """
+    found = {}
+    for i in range(0, len(pairs), CFG_BIBUPLOAD_BIBXXX_QUERY_CHUNK_SIZE):
+        chunk = pairs[i:i + CFG_BIBUPLOAD_BIBXXX_QUERY_CHUNK_SIZE]
+        wanted = set((tag.lower(), value) for tag, value in chunk)
+        tags = list(set(tag for tag, dummy in chunk))
+        values = list(set(value for dummy, value in chunk))
+        query = """SELECT id,tag,value FROM %s """ % table_name
+        query += """ WHERE tag IN (%s) AND value IN (%s)""" % (
+            ','.join(['%s'] * len(tags)), ','.join(['%s'] * len(values)))
+        for row_id, row_tag, row_value in run_sql(query, tags + values):
+            key = (row_tag.lower(), row_value)
+            if key in wanted and key not in found:
+                found[key] = row_id
+    return found
+
+def insert_record_bibrec_bibxxx_many(table_name, rows, pretend=False):
+    """Insert many (id_bibrec, id_bibxxx, field_number) rows into bibrec_bibxxx"""
+    # determine into which table one should insert the record
+    full_table_name = 'bibrec_'+ table_name
+
+    # insert the proper rows into the table
+    query = """INSERT INTO %s """ % full_table_name
+    query += """(id_bibrec,id_bibxxx, field_number) values (%s , %s, %s)"""
+    if not pretend:
+        res = run_sql_many(query, rows)
+    else:
+        return len(rows)
+    return res
+
 def synchronize_8564(rec_id, record, record_had_FFT, bibrecdocs, pretend=False):
     """
     Synchronize 8564_ tags and BibDocFile tables.
@@ -2418,6 +2577,8 @@ def update_database_with_metadata(record, rec_id, oai_rec_id="oai", affected_tag
     else:
         tmp_record = record
 
+    # (full_tag, value, field_number) entries to be written into bibxxx
+    bibxxx_entries = []
     for tag in tmp_record.keys():
         # check if tag is not a special one:
         if tag not in CFG_BIBUPLOAD_SPECIAL_TAGS:
@@ -2452,15 +2613,7 @@ def update_database_with_metadata(record, rec_id, oai_rec_id="oai", affected_tag
 
                     # update the tables
                     write_message("   insertion of the tag "+full_tag+" with the value "+value, verbose=9)
-                    # insert the tag and value into into bibxxx
-                    (table_name, bibxxx_row_id) = insert_record_bibxxx(full_tag, value, pretend=pretend)
-                    #print 'tname, bibrow', table_name, bibxxx_row_id;
-                    if table_name is None or bibxxx_row_id is None:
-                        write_message("   Failed: during insert_record_bibxxx", verbose=1, stream=sys.stderr)
-                    # connect bibxxx and bibrec with the table bibrec_bibxxx
-                    res = insert_record_bibrec_bibxxx(table_name, bibxxx_row_id, datafield_number, rec_id, pretend=pretend)
-                    if res is None:
-                        write_message("   Failed: during insert_record_bibrec_bibxxx", verbose=1, stream=sys.stderr)
+                    bibxxx_entries.append((full_tag, value, datafield_number))
                 else:
                     # get the tag and value from the content of each subfield
                     for subfield in set(subfield_list):
@@ -2471,19 +2624,29 @@ def update_database_with_metadata(record, rec_id, oai_rec_id="oai", affected_tag
                         full_tag = ''.join(tag_list)
                         # update the tables
                         write_message("   insertion of the tag "+full_tag+" with the value "+value, verbose=9)
-                        # insert the tag and value into into bibxxx
-                        (table_name, bibxxx_row_id) = insert_record_bibxxx(full_tag, value, pretend=pretend)
-                        if table_name is None or bibxxx_row_id is None:
-                            write_message("   Failed: during insert_record_bibxxx", verbose=1, stream=sys.stderr)
-                        # connect bibxxx and bibrec with the table bibrec_bibxxx
-                        res = insert_record_bibrec_bibxxx(table_name, bibxxx_row_id, datafield_number, rec_id, pretend=pretend)
-                        if res is None:
-                            write_message("   Failed: during insert_record_bibrec_bibxxx", verbose=1, stream=sys.stderr)
+                        bibxxx_entries.append((full_tag, value, datafield_number))
                         # remove the subtag from the list
                         tag_list.pop()
                 tag_list.pop()
                 tag_list.pop()
             tag_list.pop()
+
+    # insert the tags and values into bibxxx, all at once
+    bibxxx_ids = insert_record_bibxxx_many(
+        [(full_tag, value) for full_tag, value, dummy in bibxxx_entries],
+        pretend=pretend)
+    # connect bibxxx and bibrec with the tables bibrec_bibxxx
+    bibrec_bibxxx_rows = {}
+    for full_tag, value, datafield_number in bibxxx_entries:
+        (table_name, bibxxx_row_id) = bibxxx_ids[(full_tag, value)]
+        if bibxxx_row_id is None:
+            write_message("   Failed: during insert_record_bibxxx", verbose=1, stream=sys.stderr)
+        bibrec_bibxxx_rows.setdefault(table_name, []).append(
+            (rec_id, bibxxx_row_id, datafield_number))
+    for table_name, rows in iteritems(bibrec_bibxxx_rows):
+        res = insert_record_bibrec_bibxxx_many(table_name, rows, pretend=pretend)
+        if res is None:
+            write_message("   Failed: during insert_record_bibrec_bibxxx", verbose=1, stream=sys.stderr)
     write_message("   -Update the database with metadata: DONE", verbose=2)
 
     log_record_uploading(oai_rec_id, task_get_task_param('task_id', 0), rec_id, 'P', pretend=pretend)
@@ -2682,6 +2845,9 @@ Examples:
   -n, --notimechange\tdo not change record last modification date when updating
   -o, --holdingpen\tInsert record into holding pen instead of the normal database
   --pretend\t\tdo not really insert/append/correct/replace the input file
+  --workers=N\t\tparse the MARCXML of the input file with N processes; only the
+\t\t\tparsing is parallel, the records are still matched, compared
+\t\t\tand uploaded one at a time, in order
   --force\t\twhen --replace, use provided 001 tag values, even if the matching
 \t\t\trecord does not exist (thus allocating it on-the-fly)
   --callback-url\tSend via a POST request a JSON-serialized answer (see admin guide), in
@@ -2708,6 +2874,7 @@ Examples:
                    "nonce=",
                    "special-treatment=",
                    "stage=",
+                   "workers=",
                  ]),
             task_submit_elaborate_specific_parameter_fnc=task_submit_elaborate_specific_parameter,
             task_run_fnc=task_run_core,
@@ -2798,6 +2965,12 @@ def task_submit_elaborate_specific_parameter(key, value, opts, args): # pylint:
         else:
             print("""The specified value is not in the list of allowed special treatments codes: %s""" % CFG_BIBUPLOAD_ALLOWED_SPECIAL_TREATMENTS, file=sys.stderr)
             return False
+    elif key in ("--workers", ):
+        try:
+            task_set_option('workers', int(value))
+        except ValueError:
+            print("""The number of workers must be an integer: %s""" % value, file=sys.stderr)
+            return False
     elif key in ("-S", "--stage"):
         print("""WARNING: the --stage parameter is deprecated and ignored.""", file=sys.stderr)
     else:
@@ -2905,10 +3078,16 @@ def bibupload_records(records, opt_mode=None, opt_notimechange=0,
         ## NOTE: reference mode has been deprecated in favour of 'correct'
         opt_mode = 'correct'
 
+    # Records are consumed only once, so that they can be streamed from the
+    # input file: the ones needing the second phase are kept aside.
+    post_phase_records = []
+
     record = None
     for record in records:
         record_id = record_extract_oai_id(record)
         task_sleep_now_if_required(can_stop_too=True)
+        if record and ('BDR' in record or 'BDM' in record):
+            post_phase_records.append(record)
         if opt_mode == "holdingpen":
                     #inserting into the holding pen
             write_message("Inserting into holding pen", verbose=3)
@@ -2961,7 +3140,7 @@ def bibupload_records(records, opt_mode=None, opt_notimechange=0,
     write_message("Identifiers table after processing: %s  versions: %s" % (str(tmp_ids), str(tmp_vers)), verbose=2)
     write_message("Uploading BDR and BDM fields")
     if opt_mode != "holdingpen":
-        for record in records:
+        for record in post_phase_records:
             record_id = retrieve_rec_id(record, opt_mode, pretend=pretend, post_phase = True)
             bibupload_post_phase(record,
                                  rec_id = record_id,
@@ -2970,9 +3149,22 @@ def bibupload_records(records, opt_mode=None, opt_notimechange=0,
                                  tmp_ids = tmp_ids,
                                  tmp_vers = tmp_vers)
 
+    if not pretend:
+        # let the caches of record data know that they are outdated
+        publish_data_change('bibrec')
+        if opt_notimechange:
+            # the caches refreshed from the modification dates cannot see
+            # the updated records
+            publish_data_change('bibrec_notimechange')
 
     return results
 
+def _count_records_to_upload(records):
+    """Count the records while they are being streamed to the upload"""
+    for record in records:
+        stat['nb_records_to_upload'] += 1
+        yield record
+
 def task_run_core():
     """ Reimplement to add the body of the task."""
     write_message("Input file '%s', input mode '%s'." %
@@ -2982,24 +3174,27 @@ def task_run_core():
     if task_get_option('file_path') is not None:
         write_message("start preocessing", verbose=3)
         task_update_progress("Reading XML input")
-        recs = xml_marc_to_records(open_marc_file(task_get_option('file_path')))
-        stat['nb_records_to_upload'] = len(recs)
-        write_message("   -Open XML marc: DONE", verbose=2)
-        task_sleep_now_if_required(can_stop_too=True)
-        write_message("Entering records loop", verbose=3)
-        callback_url = task_get_option('callback_url')
-        results_for_callback = {'results': []}
-
-        if recs is not None:
-            # We proceed each record by record
+        marc_stream = open_marc_stream(task_get_option('file_path'))
+        try:
+            recs = iter_marc_stream_records(marc_stream,
+                                            task_get_option('workers', 1))
+            # Parse the first record straight away, so that a broken input
+            # file is reported before anything is uploaded.
+            recs = _count_records_to_upload(chain([next(recs)], recs))
+            write_message("   -Open XML marc: DONE", verbose=2)
+            task_sleep_now_if_required(can_stop_too=True)
+            write_message("Entering records loop", verbose=3)
+            callback_url = task_get_option('callback_url')
+            results_for_callback = {'results': []}
+
+            # We proceed each record by record, as they are read
             bibupload_records(records=recs, opt_mode=task_get_option('mode'),
                               opt_notimechange=task_get_option('notimechange'),
                               pretend=task_get_option('pretend'),
                               callback_url=callback_url,
                               results_for_callback=results_for_callback)
-        else:
-            write_message("   ERROR: bibupload failed: No record found",
-                        verbose=1, stream=sys.stderr)
+        finally:
+            marc_stream.close()
         callback_url = task_get_option("callback_url")
         if callback_url:
             nonce = task_get_option("nonce")
@@ -20,12 +20,19 @@
 """
 Tool for caching important infos, which are slow to rebuild, but that
 rarely change.
+
+Writers can publish their changes with L{publish_data_change}, so that the
+caches depending on the changed data are recreated without having to ask the
+database whether something has changed on every access.
 """
 
 import time
+import uuid
 
+from flask import g, has_app_context, has_request_context
 from werkzeug.utils import cached_property
 
+from invenio.config import CFG_DATACACHER_VERIFY_INTERVAL
 from invenio.legacy.dbquery import run_sql, get_table_update_time
 
 
@@ -34,6 +41,50 @@ class InvenioDataCacherError(Exception):
     """Error raised by data cacher."""
 
 
+def _generation_key(key):
+    """Return the key under which the generation of KEY is shared."""
+    return 'data_cacher::generation::%s' % (key, )
+
+
+def publish_data_change(*keys):
+    """
+    Tell the data cachers depending on KEYS that their data has changed.
+
+    The keys are usually the names of the changed tables.  Nothing is
+    published outside of an application context; the caches are then
+    recreated after their next timestamp verification.
+    """
+    if not has_app_context():
+        return
+    from invenio.ext.cache import cache
+    generation = uuid.uuid4().hex
+    cache.set_many(dict((_generation_key(key), generation) for key in keys))
+
+
+def get_data_generation(keys):
+    """
+    Return the current generation of the data identified by KEYS.
+
+    The generations are read from the shared cache at most once per request
+    and kept in memory for the rest of the request.
+
+    @return: a tuple of generations, or None if they cannot be read.
+    """
+    if not keys or not has_app_context():
+        return None
+    from invenio.ext.cache import cache
+    if not has_request_context():
+        return tuple(cache.get_many(*[_generation_key(key) for key in keys]))
+    generations = getattr(g, 'data_cacher_generations', None)
+    if generations is None:
+        generations = g.data_cacher_generations = {}
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        generations.update(zip(missing, cache.get_many(
+            *[_generation_key(key) for key in missing])))
+    return tuple(generations[key] for key in keys)
+
+
 class DataCacher(object):
     """
     DataCacher is an abstract cacher system, for caching informations
@@ -44,10 +95,16 @@ class DataCacher(object):
     use cases use a dict internal structure for .cache, but some use
     lists.
     """
-    def __init__(self, cache_filler, timestamp_verifier):
+    def __init__(self, cache_filler, timestamp_verifier, invalidation_keys=()):
         """ @param cache_filler: a function that fills the cache dictionary.
             @param timestamp_verifier: a function that returns a timestamp for
                    checking if something has changed after cache creation.
+            @param invalidation_keys: the keys under which the writers of the
+                   cached data publish their changes (see
+                   L{publish_data_change}).  When given, the timestamp
+                   verifier is only called every
+                   CFG_DATACACHER_VERIFY_INTERVAL seconds, to catch the
+                   changes that were not published.
         """
         self.timestamp = 0 # WARNING: may be exposed to clients
         self.cache = {} # WARNING: may be exposed to clients; lazy
@@ -58,6 +115,9 @@ class DataCacher(object):
         if not callable(timestamp_verifier):
             raise InvenioDataCacherError, "timestamp_verifier is not callable"
         self.timestamp_verifier = timestamp_verifier
+        self.invalidation_keys = tuple(invalidation_keys)
+        self.generation = None
+        self.verified_at = 0
         self.is_ok_p = True
         self.create_cache()
 
@@ -70,15 +130,40 @@ class DataCacher(object):
         Create and populate cache by calling cache filler.  Called on
         startup and used later during runtime as needed by clients.
         """
+        self.mark_up_to_date()
         self.cache = self.cache_filler()
         self.timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
 
+    def mark_up_to_date(self):
+        """
+        Remember the current generation of the cached data.  Called right
+        before the cache is (re)built, so that changes published meanwhile
+        are not missed.
+        """
+        self.generation = get_data_generation(self.invalidation_keys)
+        self.verified_at = time.time()
+
+    def outdated_p(self):
+        """
+        Return True if the cache has to be recreated: a change of its data
+        has been published, or the timestamp verifier function reports a
+        change.
+        """
+        generation = get_data_generation(self.invalidation_keys)
+        if generation is not None:
+            if generation != self.generation:
+                return True
+            if time.time() < self.verified_at + CFG_DATACACHER_VERIFY_INTERVAL:
+                return False
+            self.verified_at = time.time()
+        return self.timestamp_verifier() > self.timestamp
+
     def recreate_cache_if_needed(self):
         """
-        Recreate cache if needed, by verifying the cache timestamp
-        against the timestamp verifier function.
+        Recreate cache if needed, by verifying the published changes and
+        the cache timestamp against the timestamp verifier function.
         """
-        if self.timestamp_verifier() > self.timestamp:
+        if self.outdated_p():
             self.create_cache()
 
 class SQLDataCacher(DataCacher):
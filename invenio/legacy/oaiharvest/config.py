@@ -114,3 +114,18 @@ CFG_OAI_POSSIBLE_POSTMODES = [
             'value': "oai",
             'input': "text"}]
          ]]
+
+# CFG_OAI_HARVEST_MAX_CONNECTIONS -- maximum number of OAI requests
+# running at the same time, all repositories together.
+CFG_OAI_HARVEST_MAX_CONNECTIONS = 8
+
+# CFG_OAI_HARVEST_MAX_CONNECTIONS_PER_SERVER -- maximum number of OAI
+# requests running at the same time against a single server.
+CFG_OAI_HARVEST_MAX_CONNECTIONS_PER_SERVER = 2
+
+# CFG_OAI_HARVEST_RETRY_DELAY -- delay in seconds before the first retry
+# of a failed OAI request, doubled at every new attempt up to
+# CFG_OAI_HARVEST_RETRY_MAX_DELAY.  A Retry-After header sent by the
+# server takes precedence.
+CFG_OAI_HARVEST_RETRY_DELAY = 10
+CFG_OAI_HARVEST_RETRY_MAX_DELAY = 600
@@ -30,19 +30,26 @@ try:
     import sys
     import httplib
     import urllib
-    import getpass
     import socket
     import re
     import time
     import base64
     import tempfile
+    import threading
     import os
+    from contextlib import contextmanager
+    from six import reraise
 except ImportError as e:
     print("Error: %s" % e)
     sys.exit(1)
 
 try:
     from invenio.config import CFG_SITE_ADMIN_EMAIL, CFG_VERSION
+    from invenio.legacy.oaiharvest.config import \
+        CFG_OAI_HARVEST_MAX_CONNECTIONS, \
+        CFG_OAI_HARVEST_MAX_CONNECTIONS_PER_SERVER, \
+        CFG_OAI_HARVEST_RETRY_DELAY, \
+        CFG_OAI_HARVEST_RETRY_MAX_DELAY
 except ImportError as e:
     print("Error: %s" % e)
     sys.exit(1)
@@ -78,6 +85,94 @@ def http_request_parameters(http_param_dict, method="POST"):
 
     return urllib.urlencode(http_param_dict)
 
+class HarvestJob(threading.Thread):
+    """Run a function in the background, e.g. the harvesting of the next
+    resumption page or of another set or repository."""
+
+    def __init__(self, function, *args, **kwargs):
+        """Start running FUNCTION(*ARGS, **KWARGS)."""
+        super(HarvestJob, self).__init__()
+        self.daemon = True
+        self._function = function
+        self._arguments = (args, kwargs)
+        self._result = None
+        self._exc_info = None
+        self.start()
+
+    def run(self):
+        try:
+            self._result = self._function(*self._arguments[0],
+                                          **self._arguments[1])
+        except BaseException:
+            # also SystemExit and KeyboardInterrupt, re-raised by result()
+            self._exc_info = sys.exc_info()
+
+    def result(self):
+        """Wait for the function to return and return its result, or
+        raise its exception."""
+        self.join()
+        if self._exc_info is not None:
+            reraise(*self._exc_info)
+        return self._result
+
+_connection_slots = threading.BoundedSemaphore(CFG_OAI_HARVEST_MAX_CONNECTIONS)
+_server_connection_slots = {}
+_server_connection_slots_lock = threading.Lock()
+
+@contextmanager
+def connection_slot(server):
+    """Wait until a request can be sent to 'server' without exceeding
+    CFG_OAI_HARVEST_MAX_CONNECTIONS_PER_SERVER requests to this server
+    and CFG_OAI_HARVEST_MAX_CONNECTIONS requests overall."""
+    with _server_connection_slots_lock:
+        server_slots = _server_connection_slots.setdefault(
+            server,
+            threading.BoundedSemaphore(CFG_OAI_HARVEST_MAX_CONNECTIONS_PER_SERVER))
+    with server_slots:
+        with _connection_slots:
+            yield
+
+def get_retry_delay(attempt, retry_after=None):
+    """Return the number of seconds to wait before the attempt following
+    'attempt', honouring the Retry-After header value if any."""
+    if retry_after is not None:
+        try:
+            return max(int(retry_after), 0)
+        except ValueError:
+            pass
+    return min(CFG_OAI_HARVEST_RETRY_DELAY * 2 ** (attempt - 1),
+               CFG_OAI_HARVEST_RETRY_MAX_DELAY)
+
+def OAI_Pages(server, script, http_param_dict, method="POST", secure=False,
+              user=None, password=None, cert_file=None, key_file=None):
+    """Iterate over the answers of one OAI session (1 request, which
+    might lead to multiple answers because of resumption tokens).
+
+    The next answer is requested as soon as the resumption token of the
+    current one is known, so that it is downloaded while the caller
+    processes the current one.
+    """
+    def request(http_param_dict):
+        return HarvestJob(OAI_Request, server, script,
+                          http_request_parameters(http_param_dict, method),
+                          method, secure=secure, user=user, password=password,
+                          key_file=key_file, cert_file=cert_file)
+
+    next_answer = request(http_param_dict)
+    while next_answer is not None:
+        harvested_data = next_answer.result()
+
+        # FIXME We should NOT use regular expressions to parse XML. This works
+        # for the time being to escape namespaces.
+        rt_obj = re.search('<.*resumptionToken.*>(.+)</.*resumptionToken.*>',
+            harvested_data, re.DOTALL)
+        if rt_obj is not None and rt_obj != "":
+            http_param_dict = http_param_resume(http_param_dict, rt_obj.group(1))
+            next_answer = request(http_param_dict)
+        else:
+            next_answer = None
+        yield harvested_data
+
 def OAI_Session(server, script, http_param_dict , method="POST", output="",
                 resume_request_nbr=0, secure=False, user=None, password=None,
                 cert_file=None, key_file=None):
@@ -98,11 +193,11 @@ def OAI_Session(server, script, http_param_dict , method="POST", output="",
 
     output_path, output_name = os.path.split(output)
     harvested_files = []
-    i = resume_request_nbr
-    while True:
-        harvested_data = OAI_Request(server, script,
-                                     http_request_parameters(http_param_dict, method), method,
-                                     secure, user, password, cert_file, key_file)
+    i = resume_request_nbr - 1
+    for harvested_data in OAI_Pages(server, script, http_param_dict, method,
+                                    secure, user, password, cert_file,
+                                    key_file):
+        i = i + 1
         if output:
             # Write results to a file specified by 'output', once we have any
             # records retrieved. Thus we check for an "noRecordsMatch" error
@@ -120,16 +215,6 @@ def OAI_Session(server, script, http_param_dict , method="POST", output="",
         else:
             sys.stdout.write(harvested_data)
 
-        # FIXME We should NOT use regular expressions to parse XML. This works
-        # for the time being to escape namespaces.
-        rt_obj = re.search('<.*resumptionToken.*>(.+)</.*resumptionToken.*>',
-            harvested_data, re.DOTALL)
-        if rt_obj is not None and rt_obj != "":
-            http_param_dict = http_param_resume(http_param_dict, rt_obj.group(1))
-            i = i + 1
-        else:
-            break
-
     return i, harvested_files
 
 def harvest(server, script, http_param_dict , method="POST", output="",
@@ -139,7 +224,9 @@ def harvest(server, script, http_param_dict , method="POST", output="",
     Handle multiple OAI sessions (multiple requests, which might lead to
     multiple answers).
 
-    Needed for harvesting multiple sets in one row.
+    Needed for harvesting multiple sets in one row.  When the results
+    are saved in files, the sets are harvested concurrently, within the
+    limits of connection_slot().
 
     Returns a list of filepaths for harvested files.
 
@@ -193,7 +280,18 @@ http_param_dict - *dict* the URL parameters to send to the OAI script
                   certificate-based authentication
                   (If provided, 'key_file' must also be provided)
     """
-    if sets:
+    if sets and output:
+        sessions = [HarvestJob(OAI_Session, server, script,
+                               dict(http_param_dict, set=set), method, output,
+                               secure=secure, user=user, password=password,
+                               cert_file=cert_file, key_file=key_file)
+                    for set in sets]
+        all_harvested_files = []
+        for session in sessions:
+            dummy, harvested_files = session.result()
+            all_harvested_files.extend(harvested_files)
+        return all_harvested_files
+    elif sets:
         resume_request_nbr = 0
         all_harvested_files = []
         for set in sets:
@@ -278,42 +376,41 @@ def OAI_Request(server, script, params, method="POST", secure=False,
     i = 0
     while i < attempts:
         i = i + 1
-        # Try to establish a connection
-        try:
-            if secure and not (key_file and cert_file):
-                # Basic authentication over HTTPS
-                conn = httplib.HTTPSConnection(server)
-            elif secure and key_file and cert_file:
-                # Certificate-based authentication
-                conn = httplib.HTTPSConnection(server,
-                                               key_file=key_file,
-                                               cert_file=cert_file)
-            else:
-                # Unsecured connection
-                conn = httplib.HTTPConnection(server)
-        except (httplib.HTTPException, socket.error) as e:
-            raise InvenioOAIRequestError("An error occured when trying to connect to %s: %s" % (server, e))
-
-        # Connection established, perform a request
-        try:
-            if method == "GET":
-                conn.request("GET", script + "?" + params, headers=headers)
-            elif method == "POST":
-                conn.request("POST", script, params, headers)
-        except socket.gaierror as e:
-            # We'll retry in a few seconds
-            nb_seconds_retry = 30
-            sys.stderr.write("An error occured when trying to request %s: %s\nWill retry in %i seconds\n" % (server, e, nb_seconds_retry))
-            time.sleep(nb_seconds_retry)
-            continue
-
-        # Request sent, get results
-        try:
-            response = conn.getresponse()
-        except (httplib.HTTPException, socket.error) as e:
+        with connection_slot(server):
+            # Try to establish a connection
+            try:
+                if secure and not (key_file and cert_file):
+                    # Basic authentication over HTTPS
+                    conn = httplib.HTTPSConnection(server)
+                elif secure and key_file and cert_file:
+                    # Certificate-based authentication
+                    conn = httplib.HTTPSConnection(server,
+                                                   key_file=key_file,
+                                                   cert_file=cert_file)
+                else:
+                    # Unsecured connection
+                    conn = httplib.HTTPConnection(server)
+            except (httplib.HTTPException, socket.error) as e:
+                raise InvenioOAIRequestError("An error occured when trying to connect to %s: %s" % (server, e))
+
+            # Connection established, perform a request and get results
+            try:
+                if method == "GET":
+                    conn.request("GET", script + "?" + params, headers=headers)
+                elif method == "POST":
+                    conn.request("POST", script, params, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error) as e:
+                response = None
+                error = e
+            finally:
+                conn.close()
+
+        if response is None:
             # We'll retry in a few seconds
-            nb_seconds_retry = 30
-            sys.stderr.write("An error occured when trying to read response from %s: %s\nWill retry in %i seconds\n" % (server, e, nb_seconds_retry))
+            nb_seconds_retry = get_retry_delay(i)
+            sys.stderr.write("An error occured when trying to request %s: %s\nWill retry in %i seconds\n" % (server, error, nb_seconds_retry))
             time.sleep(nb_seconds_retry)
             continue
 
@@ -330,16 +427,10 @@ def OAI_Request(server, script, params, method="POST", secure=False,
                 response.reason, params))
 
         if response.status == 200:
-            data = response.read()
-            conn.close()
             return data
 
         elif response.status == 503:
-            try:
-                nb_seconds_to_wait = \
-                    int(response.getheader("Retry-After", "%d" % (i*i)))
-            except ValueError:
-                nb_seconds_to_wait = 10
+            nb_seconds_to_wait = get_retry_delay(i, response.getheader("Retry-After"))
             sys.stderr.write("Retry in %d seconds...\n" % nb_seconds_to_wait)
             time.sleep(nb_seconds_to_wait)
 
@@ -350,27 +441,19 @@ def OAI_Request(server, script, params, method="POST", secure=False,
                 "/".join(response.getheader("Location").split("/")[3:])
 
         elif response.status == 401:
+            # The requests may run in background threads, where the user
+            # can't be prompted for credentials and exiting is not possible.
             if user is not None:
-                sys.stderr.write("Try again\n")
-            if not secure:
-                sys.stderr.write("*WARNING* Your password will be sent in clear!\n")
-            # getting input from user
-            sys.stderr.write('User:')
-            try:
-                user = raw_input()
-                password = getpass.getpass()
-            except EOFError as e:
-                sys.stderr.write(str(e))
-                sys.stderr.write("\n")
-                sys.exit(1)
-            except KeyboardInterrupt as e:
-                sys.stderr.write(str(e))
-                sys.stderr.write("\n")
-                sys.exit(1)
-            headers["Authorization"] = "Basic " + base64.encodestring(user + ":" + password).strip()
+                raise InvenioOAIRequestError(
+                    "Authentication failed for user %s at %s: %s\n"
+                    % (user, server, params))
+            raise InvenioOAIRequestError(
+                "Authentication required at %s, the user and password of "
+                "the repository must be given: %s\n" % (server, params))
         else:
-            sys.stderr.write("Retry in 10 seconds...\n")
-            time.sleep(10)
+            nb_seconds_to_wait = get_retry_delay(i)
+            sys.stderr.write("Retry in %d seconds...\n" % nb_seconds_to_wait)
+            time.sleep(nb_seconds_to_wait)
 
-    raise InvenioOAIRequestError("Harvesting interrupted (after 10 attempts) at %s: %s\n"
-        % (time.strftime("%Y-%m-%d %H:%M:%S --> ", time.localtime()), params))
+    raise InvenioOAIRequestError("Harvesting interrupted (after %d attempts) at %s: %s\n"
+        % (attempts, time.strftime("%Y-%m-%d %H:%M:%S --> ", time.localtime()), params))
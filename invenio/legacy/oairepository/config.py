@@ -26,3 +26,7 @@ CFG_OAI_REPOSITORY_MARCXML_SIZE = 1000
 # Makefile.am and tabcreate.sql defaults for setSpec column in
 # oaiREPOSITORY MySQL table.
 CFG_OAI_REPOSITORY_GLOBAL_SET_SPEC = "GLOBAL_SET"
+
+# Size in bytes of the chunks in which ListRecords and ListIdentifiers
+# responses are sent to the harvesters
+CFG_OAI_REPOSITORY_RESPONSE_CHUNK_SIZE = 65536
@@ -19,17 +19,12 @@
 
 __revision__ = "$Id$"
 
-from six.moves import cPickle
-import os
+import base64
+import binascii
+import json
 import re
 import time
-import tempfile
-import sys
 import datetime
-if sys.hexversion < 0x2050000:
-    from glob import glob as iglob
-else:
-    from glob import iglob
 from flask import url_for
 from six import iteritems
 
@@ -42,7 +37,6 @@ from invenio.config import \
      CFG_OAI_SET_FIELD, \
      CFG_OAI_PREVIOUS_SET_FIELD, \
      CFG_OAI_METADATA_FORMATS, \
-     CFG_CACHEDIR, \
      CFG_SITE_NAME, \
      CFG_SITE_SUPPORT_EMAIL, \
      CFG_SITE_URL, \
@@ -64,9 +58,11 @@ from invenio.utils.html import X, EscapedXMLString
 from invenio.legacy.dbquery import run_sql, wash_table_column_name
 from invenio.legacy.search_engine import record_exists, get_all_restricted_recids, search_unit_in_bibxxx, get_record, search_pattern
 from invenio.modules.formatter import format_record
+from invenio.legacy.bibformat.dblayer import get_preformatted_records
 from invenio.legacy.bibrecord import record_get_field_instances
-from invenio.ext.logging import register_exception
-from invenio.legacy.oairepository.config import CFG_OAI_REPOSITORY_GLOBAL_SET_SPEC
+from invenio.legacy.oairepository.config import \
+     CFG_OAI_REPOSITORY_GLOBAL_SET_SPEC, \
+     CFG_OAI_REPOSITORY_RESPONSE_CHUNK_SIZE
 from invenio.utils.date import localtime_to_utc, utc_to_localtime
 from invenio.base.globals import cfg
 
@@ -185,6 +181,50 @@ def get_field(recid, field):
 
     return [row[0] for row in run_sql(query, (recid, field))]
 
+def get_fields(recids, field):
+    """
+    Gets lists of field 'field' for the records with 'recids' system
+    numbers, as a dictionary keyed by recid.
+    """
+    out = {}
+    recids = list(recids)
+    if not recids:
+        return out
+
+    digit = field[0:2]
+
+    bibbx = "bib%sx" % digit
+    bibx  = "bibrec_bib%sx" % digit
+    query = "SELECT bibx.id_bibrec, bx.value FROM %s AS bx, %s AS bibx WHERE bibx.id_bibrec IN (%s) AND bx.id=bibx.id_bibxxx AND bx.tag=%%s" % (wash_table_column_name(bibbx), wash_table_column_name(bibx), ', '.join(['%s'] * len(recids)))
+
+    for recid, value in run_sql(query, recids + [field]):
+        out.setdefault(recid, []).append(value)
+    return out
+
+def get_modification_dates(recids):
+    """Returns the dates of last modification in UTC of the records
+    'recids', as a dictionary keyed by recid.  Records that do not exist
+    are not in the dictionary.
+    """
+    recids = list(recids)
+    if not recids:
+        return {}
+    res = run_sql("SELECT id, DATE_FORMAT(modification_date,'%%Y-%%m-%%d %%H:%%i:%%s') FROM bibrec WHERE id IN (%s)" % ', '.join(['%s'] * len(recids)), recids)
+    return dict((recid, date and localtime_to_utc(date) or "") for recid, date in res)
+
+def get_deleted_recids(recids):
+    """Returns the records among 'recids' that are marked as deleted,
+    in the same way as record_exists().
+    """
+    recids = list(recids)
+    if not recids:
+        return intbitset()
+    values = ['DELETED']
+    if CFG_CERN_SITE:
+        values.append('DUMMY')
+    query = "SELECT bibx.id_bibrec FROM bib98x AS bx, bibrec_bib98x AS bibx WHERE bibx.id_bibrec IN (%s) AND bx.id=bibx.id_bibxxx AND bx.tag LIKE '980__%%' AND bx.value IN (%s)" % (', '.join(['%s'] * len(recids)), ', '.join(['%s'] * len(values)))
+    return intbitset(run_sql(query, recids + values))
+
 def get_modification_date(recid):
     """Returns the date of last modification for the record 'recid'.
     Return empty string if no record or modification date in UTC.
@@ -323,72 +363,102 @@ def print_record(recid, prefix='marcxml', verb='ListRecords', set_spec=None, set
       then return nothing.
 
     """
+    return "".join(print_records([recid], prefix, verb, set_spec, set_last_updated))
 
-    record_exists_result = record_exists(recid) == 1
-    if record_exists_result:
-        sets = get_field(recid, CFG_OAI_SET_FIELD)
+def print_records(recids, prefix='marcxml', verb='ListRecords', set_spec=None, set_last_updated=None):
+    """Yields the records 'recids' formatted according to 'prefix', as
+    print_record() does, but fetching the needed information for all
+    the records at once.
+    """
+    recids = list(recids)
+    modification_dates = get_modification_dates(recids)
+    deleted_recids = get_deleted_recids(modification_dates)
+    all_sets = get_fields(recids, CFG_OAI_SET_FIELD)
+    all_idents = get_fields(recids, CFG_OAI_ID_FIELD)
+
+    existing_recids = []
+    for recid in recids:
+        if recid not in modification_dates or recid in deleted_recids:
+            continue
+        sets = all_sets.get(recid, [])
         if set_spec is not None and not set_spec in sets and not [set_ for set_ in sets if set_.startswith("%s:" % set_spec)]:
             ## the record is not in the requested set, and is not
             ## in any subset
-            record_exists_result = False
+            continue
+        existing_recids.append(recid)
 
-    if record_exists_result:
-        status = None
-    else:
-        status = 'deleted'
+    if verb != 'ListIdentifiers':
+        of = CFG_OAI_METADATA_FORMATS[prefix][0]
+        preformatted_records = get_preformatted_records(existing_recids, of)
+        ## Only records having a provenance base URL have an about part
+        provenance_recids = get_fields(existing_recids, CFG_BIBUPLOAD_EXTERNAL_OAIID_TAG[:5] + CFG_OAI_PROVENANCE_BASEURL_SUBFIELD)
 
-    if not record_exists_result and CFG_OAI_DELETED_POLICY not in ('persistent', 'transient'):
-        return ""
+    existing_recids = set(existing_recids)
+    for recid in recids:
+        record_exists_result = recid in existing_recids
 
-    idents = get_field(recid, CFG_OAI_ID_FIELD)
-    if not idents:
-        return ""
-    ## FIXME: Move these checks in a bibtask
-    #try:
-        #assert idents, "No OAI ID for record %s, please do your checks!" % recid
-    #except AssertionError as err:
-        #register_exception(alert_admin=True)
-        #return ""
-    #try:
-        #assert len(idents) == 1, "More than OAI ID found for recid %s. Considering only the first one, but please do your checks: %s" % (recid, idents)
-    #except AssertionError as err:
-        #register_exception(alert_admin=True)
-    ident = idents[0]
-
-    header_body = EscapedXMLString('')
-    header_body += X.identifier()(ident)
-    if set_last_updated:
-        header_body += X.datestamp()(max(get_modification_date(recid), set_last_updated))
-    else:
-        header_body += X.datestamp()(get_modification_date(recid))
-    for set_spec in get_field(recid, CFG_OAI_SET_FIELD):
-        if set_spec and set_spec != CFG_OAI_REPOSITORY_GLOBAL_SET_SPEC:
-            # Print only if field not empty
-            header_body += X.setSpec()(set_spec)
+        if record_exists_result:
+            status = None
+        else:
+            status = 'deleted'
+
+        if not record_exists_result and CFG_OAI_DELETED_POLICY not in ('persistent', 'transient'):
+            continue
+
+        idents = all_idents.get(recid)
+        if not idents:
+            continue
+        ## FIXME: Move these checks in a bibtask
+        #try:
+            #assert idents, "No OAI ID for record %s, please do your checks!" % recid
+        #except AssertionError as err:
+            #register_exception(alert_admin=True)
+            #return ""
+        #try:
+            #assert len(idents) == 1, "More than OAI ID found for recid %s. Considering only the first one, but please do your checks: %s" % (recid, idents)
+        #except AssertionError as err:
+            #register_exception(alert_admin=True)
+        ident = idents[0]
+
+        header_body = EscapedXMLString('')
+        header_body += X.identifier()(ident)
+        if set_last_updated:
+            header_body += X.datestamp()(max(modification_dates.get(recid, ""), set_last_updated))
+        else:
+            header_body += X.datestamp()(modification_dates.get(recid, ""))
+        for a_set in all_sets.get(recid, []):
+            if a_set and a_set != CFG_OAI_REPOSITORY_GLOBAL_SET_SPEC:
+                # Print only if field not empty
+                header_body += X.setSpec()(a_set)
 
-    header = X.header(status=status)(header_body)
+        header = X.header(status=status)(header_body)
 
-    if verb == 'ListIdentifiers':
-        return header
-    else:
-        if record_exists_result:
-            metadata_body = format_record(recid, CFG_OAI_METADATA_FORMATS[prefix][0])
-            metadata = X.metadata(body=metadata_body)
-            provenance_body = get_record_provenance(recid)
-            if provenance_body:
-                provenance = X.about(body=provenance_body)
+        if verb == 'ListIdentifiers':
+            yield header
+        else:
+            if record_exists_result:
+                metadata_body, needs_2nd_pass = preformatted_records.get(recid, (None, None))
+                if metadata_body is None or needs_2nd_pass:
+                    metadata_body = format_record(recid, of)
+                metadata = X.metadata(body=metadata_body)
+                if recid in provenance_recids:
+                    provenance_body = get_record_provenance(recid)
+                else:
+                    provenance_body = ''
+                if provenance_body:
+                    provenance = X.about(body=provenance_body)
+                else:
+                    provenance = ''
+                rights_body = get_record_rights(recid)
+                if rights_body:
+                    rights = X.about(body=rights_body)
+                else:
+                    rights = ''
             else:
+                metadata = ''
                 provenance = ''
-            rights_body = get_record_rights(recid)
-            if rights_body:
-                rights = X.about(body=rights_body)
-            else:
                 rights = ''
-        else:
-            metadata = ''
-            provenance = ''
-            rights = ''
-        return X.record()(header, metadata, provenance, rights)
+            yield X.record()(header, metadata, provenance, rights)
 
 def oai_list_metadata_formats(argd):
     """Generates response to oai_list_metadata_formats verb."""
@@ -420,52 +490,57 @@ def oai_list_records_or_identifiers(req, argd):
         resumption_token_was_specified = True
         try:
             cache = oai_cache_load(argd['resumptionToken'])
-            last_recid = cache['last_recid']
-            argd = cache['argd']
-            complete_list = cache['complete_list']
-            complete_list = filter_out_based_on_date_range(complete_list, argd.get('from', ''), argd.get('until', ''))
-        except Exception, e:
-            # Ignore cache not found errors
-            if not isinstance(e, IOError) or e.errno != 2:
-                register_exception(alert_admin=True)
+        except ValueError:
             req.write(oai_error(argd, [("badResumptionToken", "ResumptionToken expired or invalid: %s" % argd['resumptionToken'])]))
             return
+        argd = cache['argd']
     else:
-        last_recid = 0
+        ## The date range is computed once for the whole harvest, so
+        ## that the list does not move while it is walked through
+        fromdate, untildate = get_date_range(argd.get('from', ""), argd.get('until', ""), argd.get('set', ""))
         complete_list = oai_get_recid_list(argd.get('set', ""), argd.get('from', ""), argd.get('until', ""))
 
         if not complete_list: # noRecordsMatch error
             req.write(oai_error(argd, [("noRecordsMatch", "no records correspond to the request")]))
             return
 
-    cursor = 0
-    for cursor, recid in enumerate(complete_list):
-        ## Let's fast-forward the cursor to point after the last recid that was
-        ## disseminated successfully
-        if recid > last_recid:
-            break
+        cache = {
+            'argd': argd,
+            'from': fromdate,
+            'until': untildate,
+            'last_recid': 0,
+            'cursor': 0,
+            'complete_list_size': len(complete_list),
+        }
+
+    cursor = cache['cursor']
+    recids, more_recids = oai_get_recid_page(argd.get('set', ""), cache['from'], cache['until'], cache['last_recid'])
 
     set_last_updated = get_set_last_update(argd.get('set', ""))
 
     req.write(oai_header(argd, verb))
-    for recid in list(complete_list)[cursor:cursor+CFG_OAI_LOAD]:
-        req.write(print_record(recid, argd['metadataPrefix'], verb=verb, set_spec=argd.get('set'), set_last_updated=set_last_updated))
-
-    if list(complete_list)[cursor+CFG_OAI_LOAD:]:
-        resumption_token = oai_generate_resumption_token(argd.get('set', ''))
-        cache = {
-            'argd': argd,
-            'last_recid': recid,
-            'complete_list': complete_list.fastdump(),
-        }
-        oai_cache_dump(resumption_token, cache)
+    chunk = []
+    chunk_size = 0
+    for record in print_records(recids, argd['metadataPrefix'], verb=verb, set_spec=argd.get('set'), set_last_updated=set_last_updated):
+        chunk.append(record)
+        chunk_size += len(record)
+        if chunk_size >= CFG_OAI_REPOSITORY_RESPONSE_CHUNK_SIZE:
+            req.write("".join(chunk))
+            chunk = []
+            chunk_size = 0
+    if chunk:
+        req.write("".join(chunk))
+
+    if more_recids:
+        cache['last_recid'] = recids[-1]
+        cache['cursor'] = cursor + len(recids)
+        resumption_token = oai_cache_dump(cache)
         expdate = oai_get_response_date(CFG_OAI_EXPIRE)
-        req.write(X.resumptionToken(expirationDate=expdate, cursor=cursor, completeListSize=len(complete_list))(resumption_token))
+        req.write(X.resumptionToken(expirationDate=expdate, cursor=cursor, completeListSize=cache['complete_list_size'])(resumption_token))
     elif resumption_token_was_specified:
         ## Since a resumptionToken was used we shall put a last empty resumptionToken
-        req.write(X.resumptionToken(cursor=cursor, completeListSize=len(complete_list))(""))
+        req.write(X.resumptionToken(cursor=cursor, completeListSize=cache['complete_list_size'])(""))
     req.write(oai_footer(verb))
-    oai_cache_gc()
 
 def oai_list_sets(argd):
     """
@@ -610,8 +685,10 @@ def get_set_last_update(set_spec=""):
         return None
 
 
-def filter_out_based_on_date_range(recids, fromdate="", untildate="", set_spec=None):
-    """ Filter out recids based on date range."""
+def get_date_range(fromdate="", untildate="", set_spec=None):
+    """
+    Returns the (fromdate, untildate) range in local time of a request.
+    """
     if fromdate:
         fromdate = normalize_date(fromdate, "T00:00:00Z")
     else:
@@ -631,6 +708,12 @@ def filter_out_based_on_date_range(recids, fromdate="", untildate="", set_spec=N
             if last_updated > fromdate:
                 fromdate = utc_to_localtime(get_earliest_datestamp())
 
+    return fromdate, untildate
+
+def filter_out_based_on_date_range(recids, fromdate="", untildate="", set_spec=None):
+    """ Filter out recids based on date range."""
+    fromdate, untildate = get_date_range(fromdate, untildate, set_spec)
+
     recids = intbitset(recids) ## Let's clone :-)
 
     if fromdate and untildate:
@@ -666,58 +749,137 @@ def oai_get_recid_list(set_spec="", fromdate="", untildate=""):
             ret -= search_unit_in_bibxxx(p='DUMMY', f='980__%', m='e')
     return filter_out_based_on_date_range(ret, fromdate, untildate, set_spec)
 
-def oai_generate_resumption_token(set_spec):
-    """Generates unique ID for resumption token management."""
-    fd, name = tempfile.mkstemp(dir=os.path.join(CFG_CACHEDIR, 'RTdata'), prefix='%s___' % set_spec)
-    os.close(fd)
-    return os.path.basename(name)
+def oai_get_recid_page(set_spec="", fromdate="", untildate="", last_recid=0, size=CFG_OAI_LOAD):
+    """
+    Returns the 'size' recids following 'last_recid' in the list of
+    oai_get_recid_list(), and whether more recids follow them.
+
+    'fromdate' and 'untildate' are the local time boundaries returned by
+    get_date_range().  The records are walked in the order of their
+    recids, so that every page costs the same whatever its position in
+    the list.
+    """
+    fields = [CFG_OAI_SET_FIELD]
+    if CFG_OAI_DELETED_POLICY != 'no':
+        fields.append(CFG_OAI_PREVIOUS_SET_FIELD)
+    if cfg.get('CFG_OAI_FILTER_RESTRICTED_RECORDS', True):
+        restricted_recids = get_all_restricted_recids()
+    else:
+        restricted_recids = intbitset()
+
+    page = []
+    while len(page) <= size:
+        candidates = set()
+        bound = None
+        for field in fields:
+            recids, exhausted = oai_get_set_recids_after(field, set_spec, fromdate, untildate, last_recid, size)
+            candidates.update(recids)
+            if not exhausted:
+                ## The recids of this field after its last one are
+                ## not known yet
+                bound = min(bound or recids[-1], recids[-1])
+        if bound is not None:
+            candidates = [recid for recid in candidates if recid <= bound]
+        candidates = sorted(candidates)
+        if not candidates:
+            break
+        last_recid = candidates[-1]
+        candidates = intbitset(candidates) - restricted_recids
+        if CFG_OAI_DELETED_POLICY == 'no':
+            candidates -= get_deleted_recids(candidates)
+        page.extend(candidates)
+        if bound is None:
+            break
+    return page[:size], len(page) > size
 
-def oai_delete_resumption_tokens_for_set(set_spec):
+def oai_get_set_recids_after(field, set_spec, fromdate, untildate, last_recid, size):
     """
-    In case a set is modified by the admin interface, this will delete
-    any resumption token that is now invalid.
+    Returns the recids greater than 'last_recid' having in 'field' the
+    OAI set 'set_spec' or one of its subsets (any set if 'set_spec' is
+    empty), and modified between 'fromdate' and 'untildate', in
+    increasing order, and whether all of them were returned.
+
+    At most 'size' values of 'field' are read, walking the id_bibrec
+    index of the bibrec_bibxxx table from 'last_recid' on.
     """
-    aset = set_spec
-    while aset:
-        for name in iglob(os.path.join(CFG_CACHEDIR, 'RTdata', '%s___*' % set_spec)):
-            os.remove(name)
-        aset = aset.rsplit(":", 1)[0]
-    for name in iglob(os.path.join(CFG_CACHEDIR, 'RTdata', '___*')):
-        os.remove(name)
+    bibbx = "bib%sx" % field[0:2]
+    bibx  = "bibrec_bib%sx" % field[0:2]
+
+    conditions = ["bibx.id_bibrec>%s", "bx.tag=%s"]
+    params = [last_recid, field]
+    if set_spec:
+        conditions.append("(bx.value=%s OR bx.value LIKE %s)")
+        params.append(set_spec)
+        params.append("%s:%%" % set_spec.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+    join = ""
+    if fromdate or untildate:
+        join = "JOIN bibrec AS b ON b.id=bibx.id_bibrec"
+    if fromdate:
+        conditions.append("b.modification_date>=%s")
+        params.append(fromdate)
+    if untildate:
+        conditions.append("b.modification_date<=%s")
+        params.append(untildate)
+
+    query = """SELECT bibx.id_bibrec FROM %s AS bibx
+               JOIN %s AS bx ON bx.id=bibx.id_bibxxx %s
+               WHERE %s ORDER BY bibx.id_bibrec LIMIT %%s""" % (
+        wash_table_column_name(bibx), wash_table_column_name(bibbx), join,
+        " AND ".join(conditions))
+    params.append(size)
+    res = run_sql(query, params)
+    recids = []
+    for row in res:
+        ## A record has a row per set
+        if not recids or recids[-1] != row[0]:
+            recids.append(row[0])
+    return recids, len(res) < size
 
-def oai_cache_dump(resumption_token, cache):
+def oai_cache_dump(cache):
     """
-    Given a resumption_token and the cache, stores the cache.
+    Returns the resumption token storing the cache.
+
+    The token is the cache itself, i.e. the frozen request and the
+    position in the list, so that nothing has to be kept on the server
+    between the requests of a harvester.
     """
-    cPickle.dump(cache, open(os.path.join(CFG_CACHEDIR, 'RTdata', resumption_token), 'w'), -1)
+    cache = dict(cache, expires=int(time.time() + CFG_OAI_EXPIRE))
+    return base64.urlsafe_b64encode(json.dumps(cache, sort_keys=True)).rstrip('=')
 
 def oai_cache_load(resumption_token):
     """
     Restores the cache from the resumption_token.
-    """
-    fullpath = os.path.join(CFG_CACHEDIR, 'RTdata', resumption_token)
-    if os.path.dirname(os.path.abspath(fullpath)) != os.path.abspath(os.path.join(CFG_CACHEDIR, 'RTdata')):
-        raise ValueError("Invalid path")
-    return cPickle.load(open(fullpath))
 
-def oai_cache_gc():
-    """
-    OAI Cache Garbage Collector.
+    @raise ValueError: if the resumption_token is invalid or expired.
     """
-    cache_dir = os.path.join(CFG_CACHEDIR, 'RTdata')
-
-    if not os.path.isdir(cache_dir):
-        os.makedirs(cache_dir)
-
-    for file_ in os.listdir(cache_dir):
-        filename = os.path.join(cache_dir, file_)
-        # cache entry expires when not modified during a specified period of time
-        if ((time.time() - os.path.getmtime(filename)) > CFG_OAI_EXPIRE):
-            try:
-                os.remove(filename)
-            except OSError as e:
-                # Most probably the cache was already deleted
-                pass
+    try:
+        resumption_token = str(resumption_token)
+        cache = json.loads(base64.urlsafe_b64decode(resumption_token + '=' * (-len(resumption_token) % 4)))
+        argd = dict((str(key), value.encode('utf-8')) for key, value in cache['argd'].items())
+        cache = {
+            'argd': argd,
+            'from': cache['from'].encode('utf-8'),
+            'until': cache['until'].encode('utf-8'),
+            'last_recid': cache['last_recid'],
+            'cursor': cache['cursor'],
+            'complete_list_size': cache['complete_list_size'],
+            'expires': cache['expires'],
+        }
+    except (AttributeError, KeyError, TypeError, UnicodeError, binascii.Error):
+        raise ValueError("Invalid resumption token")
+    if argd.get('verb') not in ('ListRecords', 'ListIdentifiers') or \
+           argd.get('metadataPrefix') not in CFG_OAI_METADATA_FORMATS or \
+           [param for param in argd if param not in CFG_VERBS['ListRecords'] and param != 'verb']:
+        raise ValueError("Invalid resumption token")
+    for date in (cache['from'], cache['until']):
+        if date and not re.match(r"\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d\Z", date):
+            raise ValueError("Invalid resumption token")
+    for key in ('last_recid', 'cursor', 'complete_list_size', 'expires'):
+        if not isinstance(cache[key], (int, long)) or cache[key] < 0:
+            raise ValueError("Invalid resumption token")
+    if cache['expires'] < time.time():
+        raise ValueError("Expired resumption token")
+    return cache
 
 def get_all_sets():
     """
@@ -103,8 +103,10 @@ class WebInterfaceOAIProviderPages(WebInterfaceDirectory):
                 req.headers_out["Retry-After"] = "%d" % (CFG_OAI_SLEEP - time_gap)
                 req.status = apache.HTTP_SERVICE_UNAVAILABLE
                 return "Retry after %d seconds" % (CFG_OAI_SLEEP - time_gap)
-        command = "touch %s/RTdata/RTdata" % CFG_CACHEDIR
-        os.system(command)
+        if not os.path.isdir("%s/RTdata" % CFG_CACHEDIR):
+            os.makedirs("%s/RTdata" % CFG_CACHEDIR)
+        open("%s/RTdata/RTdata" % CFG_CACHEDIR, "a").close()
+        os.utime("%s/RTdata/RTdata" % CFG_CACHEDIR, None)
 
 
         ## create OAI response
@@ -22,7 +22,9 @@
 from intbitset import intbitset
 
 from invenio.base.globals import cfg
-from invenio.legacy.miscutil.data_cacher import DataCacher, DataCacherProxy
+from invenio.base.signals import webcoll_after_reclist_cache_update
+from invenio.legacy.miscutil.data_cacher import DataCacher, \
+    DataCacherProxy, publish_data_change
 from invenio.utils.memoise import memoize
 
 from .models import Collection, Collectionname
@@ -48,7 +50,8 @@ class CollectionAllChildrenDataCacher(DataCacher):
             return max(get_table_update_time('collection'),
                        get_table_update_time('collection_collection'))
 
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            ('collection', 'collection_collection'))
 
 collection_allchildren_cache = DataCacherProxy(CollectionAllChildrenDataCacher)
 
@@ -86,7 +89,8 @@ class CollectionRecListDataCacher(DataCacher):
             from invenio.legacy.dbquery import get_table_update_time
             return get_table_update_time('collection')
 
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            ('collection', ))
 
 
 collection_reclist_cache = DataCacherProxy(CollectionRecListDataCacher)
@@ -208,7 +212,8 @@ class CollectionI18nNameDataCacher(DataCacher):
             from invenio.legacy.dbquery import get_table_update_time
             return get_table_update_time('collectionname')
 
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            ('collectionname', ))
 
 collection_i18nname_cache = DataCacherProxy(CollectionI18nNameDataCacher)
 
@@ -237,3 +242,11 @@ def get_coll_i18nname(c, ln=None, verify_cache_timestamp=True):
     except KeyError:
         pass  # translation in LN does not exist
     return out
+
+
+def publish_collections_change(sender, **kwargs):
+    """Let the collection caches know that webcoll has updated them."""
+    publish_data_change('collection', 'collection_collection',
+                        'collectionname')
+
+webcoll_after_reclist_cache_update.connect(publish_collections_change)
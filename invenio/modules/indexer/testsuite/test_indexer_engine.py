@@ -19,6 +19,9 @@
 
 """Unit tests for the indexing engine."""
 
+from intbitset import intbitset
+from mock import patch
+
 from invenio.base.wrappers import lazy_import
 from invenio.testsuite import InvenioTestCase, make_test_suite, run_test_suite
 
@@ -46,6 +49,167 @@ class TestListSetOperations(InvenioTestCase):
                          bibindex_engine.list_unique([1, 2, 3, 3, 1, 2]))
 
 
+class TestChunksBySize(InvenioTestCase):
+
+    """Tests for splitting the rows of a bulk flush."""
+
+    def test_chunks_by_size(self):
+        """bibindex engine - rows are split by cumulated size."""
+        rows = [('a', 'xxx'), ('b', 'yyy'), ('c', 'zzz')]
+        self.assertEqual([[('a', 'xxx'), ('b', 'yyy')], [('c', 'zzz')]],
+                         list(bibindex_engine._chunks_by_size(rows, 8)))
+
+    def test_chunks_by_size_big_row(self):
+        """bibindex engine - a row bigger than the limit has its own chunk."""
+        rows = [('a', 'xxx'), ('b', 100 * 'y')]
+        self.assertEqual([[('a', 'xxx')], [('b', 100 * 'y')]],
+                         list(bibindex_engine._chunks_by_size(rows, 8)))
+
+
+class TestSplitRecIDsInChunks(InvenioTestCase):
+
+    """Tests for splitting recID ranges into indexing chunks."""
+
+    def test_split_by_flush(self):
+        """bibindex engine - chunks do not cross flushes."""
+        self.assertEqual([(1, 3), (4, 5), (10, 10), (11, 12)],
+                         list(bibindex_engine.split_recIDs_in_chunks(
+                             [[1, 5], [10, 12]], 3)))
+
+    def test_split_by_chunksize(self):
+        """bibindex engine - chunks are not bigger than chunksize."""
+        chunks = list(bibindex_engine.split_recIDs_in_chunks(
+            [[1, 2500]], 10000))
+        self.assertEqual([(1, 1000), (1001, 2000), (2001, 2500)], chunks)
+
+
+class TestWordTableFlush(InvenioTestCase):
+
+    """Tests for flushing word tables into the database."""
+
+    prefixes = ('test_one_', 'test_two_')
+
+    def setUp(self):
+        """Create empty copies of the title index tables."""
+        self.index_id = bibindex_engine.get_index_id_from_index_name('title')
+        for prefix in self.prefixes:
+            bibindex_engine.init_temporary_reindex_tables(self.index_id,
+                                                          prefix)
+
+    def tearDown(self):
+        for prefix in self.prefixes:
+            for table_type in ('WORD', 'PAIR', 'PHRASE'):
+                for suffix in ('F', 'R'):
+                    bibindex_engine.run_sql(
+                        "DROP TABLE IF EXISTS %sidx%s%02d%s" %
+                        (prefix, table_type, self.index_id, suffix))
+
+    def _table(self, prefix, hitlists=None):
+        """Return the word table of PREFIX, storing HITLISTS first."""
+        table = bibindex_engine.WordTable('title', 'WORD',
+                                          table_prefix=prefix)
+        table.virtual_indexes = []
+        for term, recids in (hitlists or {}).items():
+            bibindex_engine.run_sql(
+                "INSERT INTO %s (term, hitlist) VALUES (%%s, %%s)" %
+                table.table_name, (term, intbitset(recids).fastdump()))
+        return table
+
+    def _hitlists(self, table):
+        return dict((term, intbitset(hitlist).tolist()) for term, hitlist in
+                    bibindex_engine.run_sql("SELECT term, hitlist FROM %s" %
+                                            table.table_name))
+
+    def _termlists(self, table):
+        reverse_table = table.table_name[:-1] + 'R'
+        return sorted(
+            (recid, termtype,
+             bibindex_engine.deserialize_via_marshal(termlist))
+            for recid, termlist, termtype in bibindex_engine.run_sql(
+                "SELECT id_bibrec, termlist, type FROM %s" % reverse_table))
+
+    def test_bulk_flush(self):
+        """bibindex engine - bulk flush as one by one flush."""
+        stored = {'existing': [1, 2, 3], 'removed': [4], 'Word': [8]}
+        changes = {'existing': {4: 1, 1: -1}, 'removed': {4: -1},
+                   'new': {5: 1, 6: 1}, 'New': {6: 1, 7: 1},
+                   'empty': {7: -1}, 'word': {9: 1}}
+        bulk, single = [self._table(prefix, stored)
+                        for prefix in self.prefixes]
+        bulk.value = dict((word, dict(signs))
+                          for word, signs in changes.items())
+        bulk.put_words_into_db(changes.keys())
+        single.value = dict((word, dict(signs))
+                            for word, signs in changes.items())
+        for word in changes:
+            single.put_word_into_db(word)
+
+        hitlists = self._hitlists(bulk)
+        self.assertEqual(hitlists, self._hitlists(single))
+        self.assertEqual(hitlists['existing'], [2, 3, 4])
+        self.assertFalse('removed' in hitlists)
+        self.assertFalse('empty' in hitlists)
+
+    def test_bulk_flush_fallback(self):
+        """bibindex engine - words clashing in a bulk insert are flushed."""
+        table = self._table(self.prefixes[0], {'existing': [1, 2, 3]})
+        table.value = {'existing': {4: 1}, 'new': {5: 1, 6: 1},
+                       'other': {7: 1}}
+        run_sql_many = bibindex_engine.run_sql_many
+
+        def clashing_run_sql_many(query, params):
+            if query.startswith('INSERT INTO') and \
+                    'ON DUPLICATE' not in query:
+                raise bibindex_engine.IntegrityError(
+                    1062, "Duplicate entry for key 'term'")
+            return run_sql_many(query, params)
+
+        with patch('invenio.legacy.bibindex.engine.run_sql_many',
+                   side_effect=clashing_run_sql_many) as mock_run_sql_many:
+            table.put_words_into_db(table.value.keys())
+        self.assertTrue(any('ON DUPLICATE' not in call[0][0]
+                            for call in mock_run_sql_many.call_args_list))
+        self.assertEqual(self._hitlists(table),
+                         {'existing': [1, 2, 3, 4], 'new': [5, 6],
+                          'other': [7]})
+
+    def test_add_recID_range(self):
+        """bibindex engine - adding records keeps their current terms."""
+        table = self._table(self.prefixes[0])
+        reverse_table = table.table_name[:-1] + 'R'
+        bibindex_engine.run_sql(
+            "INSERT INTO %s (id_bibrec, termlist, type) "
+            "VALUES (1, %%s, 'CURRENT')" % reverse_table,
+            (bibindex_engine.serialize_via_marshal(['old']), ))
+        self.assertEqual(table.add_recID_range(1, 2, {1: ['a'], 2: ['b']}),
+                         2)
+        termlists = dict(
+            ((recid, termtype),
+             bibindex_engine.deserialize_via_marshal(termlist))
+            for recid, termlist, termtype in bibindex_engine.run_sql(
+                "SELECT id_bibrec, termlist, type FROM %s" % reverse_table))
+        self.assertEqual(termlists, {(1, 'CURRENT'): ['old'],
+                                     (1, 'FUTURE'): ['a'],
+                                     (2, 'CURRENT'): [],
+                                     (2, 'FUTURE'): ['b']})
+        self.assertEqual(table.value, {'a': {1: 1}, 'b': {2: 1}})
+
+    def test_workers(self):
+        """bibindex engine - terms collected by workers as by one process."""
+        tables = {}
+        with patch('invenio.legacy.bibindex.engine.chunksize', 7), \
+                patch('invenio.legacy.bibindex.engine.'
+                      'task_sleep_now_if_required'):
+            for prefix, workers in zip(self.prefixes, (1, 2)):
+                tables[workers] = self._table(prefix)
+                tables[workers].add_recIDs([[1, 40]], 10, workers=workers)
+        self.assertTrue(self._hitlists(tables[1]))
+        self.assertEqual(self._hitlists(tables[2]),
+                         self._hitlists(tables[1]))
+        self.assertEqual(self._termlists(tables[2]),
+                         self._termlists(tables[1]))
+
+
 class TestWashIndexTerm(InvenioTestCase):
 
     """Tests for washing index terms, useful for both searching and indexing."""
@@ -278,6 +442,9 @@ class TestGetValuesFromRecjson(InvenioTestCase):
 
 
 TEST_SUITE = make_test_suite(TestListSetOperations,
+                             TestChunksBySize,
+                             TestSplitRecIDsInChunks,
+                             TestWordTableFlush,
                              TestWashIndexTerm,
                              TestGetWordsFromPhrase,
                              TestGetPairsFromPhrase,
@@ -19,12 +19,26 @@
 
 """Wrapper for *Flask-Cache* as engine for *JSONAlchemy*."""
 
+import hashlib
+import json
+
 import six
 
 from invenio.ext.cache import cache
 from invenio.modules.jsonalchemy.storage import Storage
 
 
+def _index_items(data):
+    """Return the indexed ``(key, value)`` pairs of a JSON.
+
+    Only the top level string values are indexed.
+    """
+    if data is None:
+        return set()
+    return set((key, value) for key, value in six.iteritems(data)
+               if isinstance(value, six.string_types))
+
+
 class CacheStorage(Storage):
 
     """Implement storage engine for Flask-Cache useful for testing."""
@@ -35,7 +49,31 @@ class CacheStorage(Storage):
 
     def _set(self, data):
         self._keys = self._keys | set([data['_id']])
+        old_data = cache.get(self._prefix + data['_id'])
         cache.set(self._prefix + data['_id'], data, timeout=99999)
+        self._reindex(data['_id'], old_data, data)
+
+    def _index_key(self, item):
+        """Return the cache key of the secondary index entry of an item."""
+        return '{0}::index::{1}'.format(self._prefix, hashlib.sha1(
+            json.dumps(item, sort_keys=True)).hexdigest())
+
+    def _reindex(self, id, old_data, new_data):
+        """Update the secondary index entries of a changed JSON."""
+        old_items = _index_items(old_data)
+        new_items = _index_items(new_data)
+        for item in old_items - new_items:
+            key = self._index_key(item)
+            ids = cache.get(key) or set()
+            ids.discard(id)
+            if ids:
+                cache.set(key, ids, timeout=99999)
+            else:
+                cache.delete(key)
+        for item in new_items - old_items:
+            key = self._index_key(item)
+            cache.set(key, (cache.get(key) or set()) | set([id]),
+                      timeout=99999)
 
     def _get(self, id):
         value = cache.get(self._prefix + id)
@@ -106,7 +144,21 @@ class CacheStorage(Storage):
                 elif test_v != v:
                     return False
             return True
-        return filter(_find, map(self._get, self._keys))
+        items = _index_items(query)
+        if items:
+            # the index narrows down the candidates, _find checks them anyway
+            ids = None
+            for item in items:
+                indexed = cache.get(self._index_key(item)) or set()
+                ids = indexed if ids is None else ids & indexed
+                if not ids:
+                    return []
+        else:
+            ids = self._keys
+        if not ids:
+            return []
+        return filter(_find, cache.get_many(
+            *[self._prefix + id for id in ids]))
 
     def create(self):
         """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.create`."""
@@ -114,5 +166,9 @@ class CacheStorage(Storage):
 
     def drop(self):
         """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.create`."""
-        while self._keys:
-            cache.delete(self._prefix + self._keys.pop())
+        keys = self._keys
+        while keys:
+            id = keys.pop()
+            self._reindex(id, cache.get(self._prefix + id), None)
+            cache.delete(self._prefix + id)
+        self._keys = keys
@@ -17,16 +17,72 @@
 # along with Invenio; if not, write to the Free Software Foundation, Inc.,
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 
-"""SQLAlchemy storage engine implementation."""
+"""SQLAlchemy storage engine implementation.
+
+The values of the fields and the searches are computed inside the database
+for the backends able to query JSON documents: PostgreSQL, MySQL (5.7.8 or
+newer), MariaDB (10.2.3 or newer) and SQLite (3.38 or newer).  Only the top
+level keys needed are transferred and the rest of the work is done in Python.
+With any other backend the whole documents are loaded and everything is done
+in Python, which gives the same results, just slower.
+"""
+
+import json
+import sqlite3
 
 import six
 
 from flask.helpers import locked_cached_property
+from sqlalchemy import Text, bindparam, cast, func
 from werkzeug import import_string
 
 from invenio.modules.jsonalchemy.storage import Storage
 
 
+def _json_path(key):
+    """Return the MySQL/SQLite JSON path of a top level key."""
+    return '$."{0}"'.format(key)
+
+
+def _simple_key(key):
+    """Check whether the key can be used inside a JSON path."""
+    return '"' not in key and '\\' not in key
+
+
+def _path_values(value, path):
+    """Yield the values found following `path`, lists are flattened."""
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            for found in _path_values(item, path):
+                yield found
+    elif not path:
+        if value is not None:
+            yield value
+    elif isinstance(value, dict) and path[0] in value:
+        for found in _path_values(value[path[0]], path[1:]):
+            yield found
+
+
+def _hashable(value):
+    """Return a hashable version of a JSON value."""
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return json.dumps(value, sort_keys=True)
+
+
+def _matches(document, query):
+    """Check whether the document matches the query prototype document."""
+    for key, value in six.iteritems(query):
+        test_value = document.get(key)
+        if test_value is None and value is not None:
+            return False
+        elif test_value != value:
+            return False
+    return True
+
+
 class SQLAlchemyStorage(Storage):
 
     """Implement database backend for SQLAlchemy model storage."""
@@ -69,8 +125,8 @@ class SQLAlchemyStorage(Storage):
         """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.save_many`."""
         if ids is None:
             ids = map(lambda j: j['_id'], jsons)
-        self.db.session.add_all([self.model(id=id, json=json)
-                                 for id, json in zip(ids, jsons)])
+        self.db.session.add_all([self.model(id=id, json=data)
+                                 for id, data in zip(ids, jsons)])
         self.db.session.commit()
 
     def update_one(self, json, id=None):
@@ -85,11 +141,27 @@ class SQLAlchemyStorage(Storage):
     def update_many(self, jsons, ids=None):
         """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.update_many`."""
         #FIXME: what if we get only the fields that have change
+        jsons = list(jsons)
         if ids is None:
             ids = map(lambda j: j['_id'], jsons)
+        values = dict(zip(ids, jsons))
+        if not values:
+            return
 
-        for id, json in zip(ids, jsons):
-            self.db.session.merge(self.model(id=id, json=json))
+        table = self.model.__table__
+        existing = set(id for id, in self.db.session.query(self.model.id)
+                       .filter(self.model.id.in_(values.keys())))
+        if existing:
+            self.db.session.execute(
+                table.update()
+                .where(table.c.id == bindparam('b_id'))
+                .values(json=bindparam('b_json', type_=table.c.json.type)),
+                [{'b_id': id, 'b_json': values[id]} for id in existing])
+        if len(existing) < len(values):
+            self.db.session.execute(
+                table.insert(),
+                [{'id': id, 'json': values[id]} for id in values
+                 if id not in existing])
         self.db.session.commit()
 
     def get_one(self, id):
@@ -99,26 +171,136 @@ class SQLAlchemyStorage(Storage):
 
     def get_many(self, ids):
         """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.get_many`."""
-        for json in self.db.session.query(self.model.json)\
+        for row in self.db.session.query(self.model.json)\
                 .filter(self.model.id.in_(ids))\
                 .all():
-            yield json[0]
+            yield row[0]
+
+    @locked_cached_property
+    def _json_functions(self):
+        """Return the functions extracting the top level values of the JSON.
+
+        The first one returns the value as JSON text, the second one returns
+        strings unquoted.  `None` if the backend can't query JSON documents.
+        """
+        dialect = self.db.engine.dialect
+        if dialect.name == 'postgresql':
+            return (
+                lambda column, key: cast(
+                    func.json_extract_path(column, key), Text),
+                func.json_extract_path_text,
+            )
+        version = tuple(dialect.server_version_info or ())
+        if dialect.name == 'mysql':
+            if getattr(dialect, 'is_mariadb', False) or 'MariaDB' in version:
+                supported = version >= (10, 2, 3)
+            else:
+                supported = version >= (5, 7, 8)
+            if supported:
+                return (
+                    lambda column, key: func.json_extract(
+                        column, _json_path(key)),
+                    lambda column, key: func.json_unquote(
+                        func.json_extract(column, _json_path(key))),
+                )
+        if dialect.name == 'sqlite' and \
+                sqlite3.sqlite_version_info >= (3, 38, 0):
+            return (
+                lambda column, key: func.json_quote(
+                    func.json_extract(column, _json_path(key))),
+                lambda column, key: func.json_extract(
+                    column, _json_path(key)),
+            )
+        return None
 
-    def get_field_values(self, recids, field, repetitive_values=True, count=False,
-                         include_recid=False, split_by=0):
-        """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.get_field_values`."""
-        #TODO
-        raise NotImplementedError()
+    def _iter_documents(self, ids, keys, split_by=0):
+        """Yield the id and the top level `keys` of the JSON of each id.
 
-    def get_fields_values(self, recids, fields, repetitive_values=True, count=False,
-                          include_recid=False, split_by=0):
+        Only these keys are loaded when the backend can query JSON documents,
+        otherwise the whole JSON is returned.
+        """
+        ids = list(ids)
+        native = self._json_functions is not None and \
+            all(_simple_key(key) for key in keys)
+        if split_by <= 0:
+            split_by = len(ids) or 1
+        for start in six.moves.range(0, len(ids), split_by):
+            chunk = ids[start:start + split_by]
+            if not native:
+                rows = self.db.session.query(self.model.id, self.model.json)
+            else:
+                extract = self._json_functions[0]
+                rows = self.db.session.query(
+                    self.model.id,
+                    *[extract(self.model.json, key) for key in keys])
+            rows = rows.filter(self.model.id.in_(chunk))\
+                .order_by(self.model.id)
+            for row in rows:
+                if not native:
+                    yield row[0], row[1]
+                else:
+                    yield row[0], dict(
+                        (key, json.loads(value))
+                        for key, value in zip(keys, row[1:])
+                        if value is not None)
+
+    def get_field_values(self, recids, field, repetitive_values=True,
+                         count=False, include_recid=False, split_by=0):
+        """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.get_field_values`.
+
+        The field can be a dotted path, like ``authors.full_name``, the lists
+        found on the way are flattened.  `split_by` is the number of ids
+        queried at once.
+        """
+        return self.get_fields_values(
+            recids, [field], repetitive_values=repetitive_values,
+            count=count, include_recid=include_recid,
+            split_by=split_by)[field]
+
+    def get_fields_values(self, recids, fields, repetitive_values=True,
+                          count=False, include_recid=False, split_by=0):
         """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.get_fields_values`."""
-        #TODO
-        raise NotImplementedError()
+        paths = dict((field, field.split('.')) for field in fields)
+        keys = sorted(set(path[0] for path in paths.values()))
+        values = dict((field, []) for field in fields)
+        for id, document in self._iter_documents(recids, keys, split_by):
+            for field, path in six.iteritems(paths):
+                values[field].extend(
+                    (id, value) if include_recid else value
+                    for value in _path_values(document, path))
+        if repetitive_values:
+            return values
+
+        for field, field_values in six.iteritems(values):
+            counts = {}
+            unique_values = []
+            for value in field_values:
+                key = _hashable(value)
+                if key not in counts:
+                    counts[key] = 0
+                    unique_values.append((key, value))
+                counts[key] += 1
+            values[field] = [(value, counts[key]) if count else value
+                             for key, value in unique_values]
+        return values
 
     def search(self, query):
-        """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.search`."""
-        raise NotImplementedError()
+        """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.search`.
+
+        The string values of the query are compared inside the database, every
+        other value is checked once the documents are loaded.
+        """
+        documents = self.db.session.query(self.model.json)
+        if self._json_functions is not None:
+            extract = self._json_functions[1]
+            for key, value in six.iteritems(query):
+                if isinstance(value, six.string_types) and \
+                        _simple_key(key):
+                    documents = documents.filter(
+                        extract(self.model.json, key) == value)
+        for document, in documents:
+            if _matches(document, query):
+                yield document
 
     def create(self):
         """See :meth:`~invenio.modules.jsonalchemy.storage.Storage.create`."""
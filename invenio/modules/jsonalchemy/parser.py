@@ -24,9 +24,21 @@ from thedifferent configuration files the field and model definitions.
 
 Default extensions to both parsers could be added inside
 :mod:`invenio.modules.jsonalchemy.jsonext.parsers`
+
+The parsed definitions are cached on disk, under ``CFG_CACHEDIR``, keyed by
+the content of the configuration files and of the parser extensions, so
+that processes do not have to parse them again while they do not change.
 """
+import hashlib
+import marshal
 import os
 import six
+import sys
+import tempfile
+import types
+
+from flask import current_app, has_app_context
+from six.moves import cPickle
 
 from pyparsing import ParseException, FollowedBy, Suppress, OneOrMore, Word, \
     LineEnd, ZeroOrMore, Optional, Literal, alphas, alphanums, \
@@ -34,6 +46,8 @@ from pyparsing import ParseException, FollowedBy, Suppress, OneOrMore, Word, \
     empty, col, restOfLine, delimitedList, Each, Keyword, commaSeparatedList, \
     Group
 
+from invenio.base.globals import cfg
+
 from .errors import FieldParserException, ModelParserException
 from .registry import fields_definitions, models_definitions, parsers
 
@@ -247,6 +261,98 @@ def _create_model_parser():
     return ZeroOrMore(COMMENT) & rules
 
 
+DEFINITIONS_CACHE_VERSION = 1
+"""Version of the cached definitions, to increase when their structure
+changes."""
+
+
+def _definitions_cache_path(kind, namespace, files):
+    """Return the path of the cached definitions parsed from ``files``.
+
+    The name of the file contains a digest of the content of the
+    configuration files and of the parser modules.
+    """
+    digest = hashlib.sha1(repr((DEFINITIONS_CACHE_VERSION, len(files),
+                                tuple(sys.version_info))).encode('utf-8'))
+    modules = [sys.modules[__name__]] + [module for module in parsers]
+    sources = [os.path.splitext(module.__file__)[0] + '.py'
+               for module in modules]
+    for path in list(files) + sources:
+        content = b''
+        if os.path.exists(path):
+            with open(path, 'rb') as source:
+                content = source.read()
+        digest.update(hashlib.sha1(content).digest())
+    return os.path.join(cfg['CFG_CACHEDIR'], 'jsonalchemy', '%s.%s.%s' % (
+        kind, namespace, digest.hexdigest()))
+
+
+def _persistent_id(obj):
+    """Store the code objects, which cannot be pickled, with marshal."""
+    if isinstance(obj, types.CodeType):
+        return marshal.dumps(obj)
+    return None
+
+
+def load_definitions(kind, namespace, files):
+    """Return the cached definitions parsed from ``files``, or ``None``.
+
+    Missing, stale or unreadable caches are ignored.
+    """
+    if not has_app_context():
+        return None
+    path = _definitions_cache_path(kind, namespace, files)
+    try:
+        with open(path, 'rb') as cache_file:
+            unpickler = cPickle.Unpickler(cache_file)
+            unpickler.persistent_load = marshal.loads
+            cached_path, definitions = unpickler.load()
+    except IOError:
+        return None
+    except Exception:
+        current_app.logger.warning("Cannot load cached definitions %s",
+                                   path, exc_info=True)
+        return None
+    if cached_path != os.path.basename(path):
+        return None
+    return definitions
+
+
+def store_definitions(kind, namespace, files, definitions):
+    """Cache the definitions parsed from ``files``.
+
+    The cache is written to a temporary file which is then renamed, so that
+    other processes never read a partial cache.  Older caches of the same
+    definitions are removed.
+    """
+    if not has_app_context():
+        return
+    path = _definitions_cache_path(kind, namespace, files)
+    directory, name = os.path.split(path)
+    temporary = None
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, temporary = tempfile.mkstemp(prefix=name + '.', dir=directory)
+        with os.fdopen(fd, 'wb') as cache_file:
+            pickler = cPickle.Pickler(cache_file, cPickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = _persistent_id
+            pickler.dump((name, definitions))
+        os.rename(temporary, path)
+        temporary = None
+        prefix = '%s.%s.' % (kind, namespace)
+        for filename in os.listdir(directory):
+            if filename.startswith(prefix) and filename != name and \
+                    filename.count('.') == name.count('.'):
+                os.remove(os.path.join(directory, filename))
+    except Exception:
+        current_app.logger.warning("Cannot cache definitions %s", path,
+                                   exc_info=True)
+    finally:
+        if temporary is not None and os.path.exists(temporary):
+            os.remove(temporary)
+
+
 class FieldParser(object):
 
     """Field definitions parser."""
@@ -368,7 +474,18 @@ class FieldParser(object):
         """
         cls._field_definitions[namespace] = {}
         cls._legacy_field_matchings = {}
-        cls(namespace)._create()
+        parser = cls(namespace)
+        cached = load_definitions('fields', namespace, parser.files)
+        if cached is not None:
+            cls._field_definitions[namespace], legacy_field_matchings = cached
+            if legacy_field_matchings is not None:
+                cls._legacy_field_matchings[namespace] = \
+                    legacy_field_matchings
+            return
+        parser._create()
+        store_definitions('fields', namespace, parser.files,
+                          (cls._field_definitions[namespace],
+                           cls._legacy_field_matchings.get(namespace)))
 
     def _create(self):
         """
@@ -645,7 +762,16 @@ class ModelParser(object):
         It does it inside the given namespace and parse it again.
         """
         cls._model_definitions[namespace] = {}
-        cls(namespace)._create()
+        parser = cls(namespace)
+        # the models are checked against the field definitions
+        files = FieldParser(namespace).files + parser.files
+        cached = load_definitions('models', namespace, files)
+        if cached is not None:
+            cls._model_definitions[namespace] = cached
+            return
+        parser._create()
+        store_definitions('models', namespace, files,
+                          cls._model_definitions[namespace])
 
     def _create(self):
         """
@@ -22,6 +22,7 @@
 __revision__ = \
     "$Id$"
 
+import mock
 import tempfile
 
 from flask_registry import PkgResourcesDirDiscoveryRegistry, \
@@ -266,6 +267,46 @@ class TestParser(InvenioTestCase):
             lambda: get_producer_rules('foo', 'json_for_marc', 'testsuite'))
         clean_field_model_definitions()
 
+    def test_definitions_cache(self):
+        """JsonAlchemy - parsed definitions are cached on disk"""
+        from invenio.modules.jsonalchemy import parser
+        clean_field_model_definitions()
+        fields = Field_parser.field_definitions('testsuite')
+        legacy = Field_parser.legacy_field_matchings('testsuite')
+        models = Model_parser.model_definitions('testsuite')
+        clean_field_model_definitions()
+        with mock.patch.object(parser.FieldParser, '_create') as create_fields:
+            with mock.patch.object(parser.ModelParser,
+                                   '_create') as create_models:
+                self.assertEqual(
+                    sorted(Field_parser.field_definitions('testsuite')),
+                    sorted(fields))
+                self.assertEqual(
+                    Field_parser.legacy_field_matchings('testsuite'), legacy)
+                self.assertEqual(
+                    sorted(Model_parser.model_definitions('testsuite')),
+                    sorted(models))
+                self.assertFalse(create_fields.called)
+                self.assertFalse(create_models.called)
+        clean_field_model_definitions()
+
+    def test_broken_definitions_cache(self):
+        """JsonAlchemy - broken definitions caches are rebuilt"""
+        from invenio.modules.jsonalchemy import parser
+        files = Field_parser('testsuite').files
+        clean_field_model_definitions()
+        Field_parser.reparse('testsuite')
+        path = parser._definitions_cache_path('fields', 'testsuite', files)
+        with open(path, 'wb') as cache_file:
+            cache_file.write(b'broken')
+        self.assertEqual(
+            parser.load_definitions('fields', 'testsuite', files), None)
+        Field_parser.reparse('testsuite')
+        self.assertTrue(len(Field_parser.field_definitions('testsuite')) >= 22)
+        self.assertNotEqual(
+            parser.load_definitions('fields', 'testsuite', files), None)
+        clean_field_model_definitions()
+
 
 TEST_SUITE = make_test_suite(TestParser)
 
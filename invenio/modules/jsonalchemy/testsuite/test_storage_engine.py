@@ -60,7 +60,177 @@ class TestStorageEngineConfig(InvenioTestCase):
         self.assertEqual(DummyJson.storage_engine.get_one(1)['_id'],
                          database[1]['_id'])
 
-TEST_SUITE = make_test_suite(TestStorageEngineConfig)
+
+class TestCacheStorage(InvenioTestCase):
+    """Test for the cache storage engine."""
+
+    def setUp(self):
+        from invenio.modules.jsonalchemy.jsonext.engines.cache import \
+            CacheStorage
+        self.storage = CacheStorage(model='test_cache_storage::')
+        self.storage.drop()
+
+    def tearDown(self):
+        self.storage.drop()
+
+    def test_search(self):
+        self.storage.save_one({'_id': '1', 'type': 'book', 'lang': 'en'})
+        self.storage.save_one({'_id': '2', 'type': 'book', 'lang': 'fr',
+                               'pages': 10})
+        self.assertEqual(
+            sorted(json['_id'] for json in
+                   self.storage.search({'type': 'book'})), ['1', '2'])
+        self.assertEqual(
+            [json['_id'] for json in
+             self.storage.search({'type': 'book', 'lang': 'fr'})], ['2'])
+        self.assertEqual(
+            [json['_id'] for json in self.storage.search({'pages': 10})],
+            ['2'])
+        self.assertEqual(self.storage.search({'type': 'thesis'}), [])
+
+        self.storage.update_one({'_id': '2', 'type': 'thesis'})
+        self.assertEqual(
+            [json['_id'] for json in self.storage.search({'type': 'book'})],
+            ['1'])
+        self.assertEqual(
+            [json['_id'] for json in
+             self.storage.search({'type': 'thesis'})], ['2'])
+
+
+class TestSQLAlchemyStorageValues(InvenioTestCase):
+    """Test for the field values of the SQLAlchemy storage engine."""
+
+    def test_path_values(self):
+        from invenio.modules.jsonalchemy.jsonext.engines.sqlalchemy import \
+            _path_values
+        json = {'authors': [{'full_name': 'Ellis, J'},
+                            {'full_name': 'Ellis, N'}],
+                'title': {'title': 'Higgs'},
+                'keywords': ['a', ['b', 'c']]}
+        self.assertEqual(list(_path_values(json, ['authors', 'full_name'])),
+                         ['Ellis, J', 'Ellis, N'])
+        self.assertEqual(list(_path_values(json, ['title', 'title'])),
+                         ['Higgs'])
+        self.assertEqual(list(_path_values(json, ['keywords'])),
+                         ['a', 'b', 'c'])
+        self.assertEqual(list(_path_values(json, ['abstract'])), [])
+
+class TestSQLAlchemyStorage(InvenioTestCase):
+
+    """Test the SQLAlchemy storage engine against an SQLite database.
+
+    Every test runs with the JSON functions of the database, when they are
+    available, and with the documents loaded in Python.
+    """
+
+    def setUp(self):
+        from sqlalchemy import Column, Integer, create_engine
+        from sqlalchemy.ext.declarative import declarative_base
+        from sqlalchemy.orm import scoped_session, sessionmaker
+        from sqlalchemy.pool import StaticPool
+        from sqlalchemy_utils import JSONType
+
+        class Backend(object):
+            engine = create_engine(
+                'sqlite://', connect_args={'check_same_thread': False},
+                poolclass=StaticPool)
+            session = scoped_session(sessionmaker(bind=engine))
+
+        class Document(declarative_base()):
+            __tablename__ = 'test_sqlalchemy_storage'
+            id = Column(Integer, primary_key=True)
+            json = Column(JSONType)
+
+        self.backend = Backend
+        self.model = Document
+        self.documents = [
+            {'_id': 1, 'title': 'Higgs', 'type': 'book',
+             'authors': [{'full_name': 'Ellis, J'},
+                         {'full_name': 'Ellis, N'}]},
+            {'_id': 2, 'title': 'Quarks', 'type': 'book', 'pages': 10,
+             'authors': [{'full_name': 'Ellis, J'}]},
+            {'_id': 3, 'title': 'Gluons', 'type': 'thesis',
+             'keywords': ['a', ['b', 'c']]},
+        ]
+
+    def tearDown(self):
+        self.backend.session.remove()
+        self.backend.engine.dispose()
+
+    def storages(self):
+        """Yield storages using the JSON functions and loading the JSON."""
+        from invenio.modules.jsonalchemy.jsonext.engines.sqlalchemy import \
+            SQLAlchemyStorage
+        native = SQLAlchemyStorage(self.model,
+                                   sqlalchemy_backend=self.backend)
+        if native._json_functions is not None:
+            yield native
+        fallback = SQLAlchemyStorage(self.model,
+                                     sqlalchemy_backend=self.backend)
+        fallback.__dict__['_json_functions'] = None
+        yield fallback
+
+    def test_update_many(self):
+        for storage in self.storages():
+            storage.update_many(self.documents[:2])
+            self.assertEqual(sorted(d['_id'] for d in
+                                    storage.get_many([1, 2, 3])), [1, 2])
+
+            updated = dict(self.documents[1], title='Leptons')
+            storage.update_many([updated, self.documents[2]])
+            self.assertEqual(storage.get_one(1), self.documents[0])
+            self.assertEqual(storage.get_one(2), updated)
+            self.assertEqual(storage.get_one(3), self.documents[2])
+            self.assertEqual(self.backend.session.query(self.model).count(),
+                             3)
+            storage.update_many([])
+            storage.drop()
+
+    def test_get_fields_values(self):
+        for storage in self.storages():
+            storage.save_many(self.documents)
+            values = storage.get_fields_values(
+                [1, 2, 3], ['title', 'authors.full_name', 'keywords'],
+                split_by=2)
+            self.assertEqual(values['title'], ['Higgs', 'Quarks', 'Gluons'])
+            self.assertEqual(values['authors.full_name'],
+                             ['Ellis, J', 'Ellis, N', 'Ellis, J'])
+            self.assertEqual(values['keywords'], ['a', 'b', 'c'])
+            self.assertEqual(
+                storage.get_field_values([2, 3], 'title',
+                                         include_recid=True),
+                [(2, 'Quarks'), (3, 'Gluons')])
+            self.assertEqual(
+                storage.get_field_values([1, 2], 'authors.full_name',
+                                         repetitive_values=False,
+                                         count=True),
+                [('Ellis, J', 2), ('Ellis, N', 1)])
+            self.assertEqual(storage.get_field_values([1, 2], 'abstract'),
+                             [])
+            storage.drop()
+
+    def test_search(self):
+        for storage in self.storages():
+            storage.save_many(self.documents)
+            self.assertEqual(
+                sorted(d['_id'] for d in storage.search({'type': 'book'})),
+                [1, 2])
+            self.assertEqual(
+                [d['_id'] for d in
+                 storage.search({'type': 'book', 'pages': 10})], [2])
+            self.assertEqual(
+                [d['_id'] for d in
+                 storage.search({'title': 'Gluons', 'type': 'thesis'})],
+                [3])
+            self.assertEqual(
+                list(storage.search({'type': 'book', 'title': 'Gluons'})),
+                [])
+            self.assertEqual(list(storage.search({'type': 'article'})), [])
+            storage.drop()
+
+TEST_SUITE = make_test_suite(TestStorageEngineConfig, TestCacheStorage,
+                             TestSQLAlchemyStorageValues,
+                             TestSQLAlchemyStorage)
 
 if __name__ == '__main__':
     run_test_suite(TEST_SUITE)
@@ -19,7 +19,6 @@
 
 """Tasks used for main OAI harvesting workflow."""
 
-import os
 import time
 
 from functools import wraps
@@ -117,6 +116,71 @@ def get_repositories_list(repositories=()):
     return _get_repositories_list
 
 
+class RepositoryHarvest(object):
+
+    """Stand-in for the object of a repository harvested in the background.
+
+    It carries what the harvesting step reads from and writes to the
+    workflow object: the repository and the options of the task.
+    """
+
+    def __init__(self, repository, options):
+        """Initialize the harvest of REPOSITORY with OPTIONS."""
+        self.data = repository
+        self.extra_data = {"options": options}
+
+
+# The background harvests of every engine, by repository name
+_harvest_jobs = {}
+
+
+def _get_harvest_path(eng):
+    """Return the path prefix of the files harvested by ENG."""
+    return "%s_%d_%s_" % (
+        "%s/oaiharvest_%s" % (cfg['CFG_TMPSHAREDDIR'], eng.uuid),
+        1, time.strftime("%Y%m%d%H%M%S"))
+
+
+def _init_harvest_options(obj):
+    """Check if user requested from-until or identifiers harvesting."""
+    try:
+        if "dates" not in obj.extra_data["options"]:
+            obj.extra_data["options"]["dates"] = []
+        if "identifiers" not in obj.extra_data["options"]:
+            obj.extra_data["options"]["identifiers"] = []
+    except TypeError:
+        obj.extra_data["options"] = {"dates": [], "identifiers": []}
+
+
+def start_harvesting(get_list_function):
+    """Start harvesting all the repositories in the background.
+
+    The repositories are then downloaded while the records of the
+    previous ones are being processed, within the connection limits of
+    the OAI harvesting getter.  harvest_records waits for the harvest of
+    the current repository to complete.
+
+    :param get_list_function: function returning the repositories.
+    """
+    @wraps(start_harvesting)
+    def _start_harvesting(obj, eng):
+        from invenio.legacy.oaiharvest.getter import HarvestJob
+        from invenio.legacy.oaiharvest.utils import harvest_step
+
+        _init_harvest_options(obj)
+        jobs = _harvest_jobs.setdefault(eng.uuid, {})
+        for repository in get_list_function(obj, eng) or []:
+            if repository["name"] in jobs:
+                continue
+            harvest = RepositoryHarvest(repository, obj.extra_data["options"])
+            jobs[repository["name"]] = (
+                harvest, HarvestJob(harvest_step, harvest,
+                                    _get_harvest_path(eng)))
+        eng.log.info("started harvesting %d repositories" % (len(jobs),))
+
+    return _start_harvesting
+
+
 def harvest_records(obj, eng):
     """Run the harvesting task.
 
@@ -132,18 +196,10 @@ def harvest_records(obj, eng):
 
     harvested_identifier_list = []
 
-    harvestpath = "%s_%d_%s_" % (
-        "%s/oaiharvest_%s" % (cfg['CFG_TMPSHAREDDIR'], eng.uuid),
-        1, time.strftime("%Y%m%d%H%M%S"))
+    harvestpath = _get_harvest_path(eng)
 
     # ## go ahead: check if user requested from-until harvesting
-    try:
-        if "dates" not in obj.extra_data["options"]:
-            obj.extra_data["options"]["dates"] = []
-        if "identifiers" not in obj.extra_data["options"]:
-            obj.extra_data["options"]["identifiers"] = []
-    except TypeError:
-        obj.extra_data["options"] = {"dates": [], "identifiers": []}
+    _init_harvest_options(obj)
 
     arguments = obj.extra_data["repository"]["arguments"]
     if arguments:
@@ -154,9 +210,20 @@ def harvest_records(obj, eng):
 
     # Harvest phase
 
+    jobs = _harvest_jobs.get(eng.uuid, {})
     try:
-        harvested_files_list = harvest_step(obj,
-                                            harvestpath)
+        if obj.data["name"] in jobs:
+            # Started in the background by start_harvesting
+            harvest, job = jobs.pop(obj.data["name"])
+            if not jobs:
+                _harvest_jobs.pop(eng.uuid, None)
+            harvested_files_list = job.result()
+            for key, value in harvest.extra_data.items():
+                if key != "options":
+                    obj.extra_data[key] = value
+        else:
+            harvested_files_list = harvest_step(obj,
+                                                harvestpath)
     except Exception as e:
         eng.log.error("Error while harvesting %s. Skipping." % (obj.data,))
 
@@ -184,28 +251,15 @@ def harvest_records(obj, eng):
 
 
 def get_records_from_file(path=None):
-    """Allow to retrieve the records from a file."""
-    from ..utils import record_extraction_from_file
+    """Allow to retrieve the records from a file, one at a time.
+
+    To be used with foreach_iterator, so that only the position in the
+    file is stored in the engine.
+    """
+    from ..utils import iter_records_from_file
 
     @wraps(get_records_from_file)
     def _get_records_from_file(obj, eng):
-        if "_LoopData" not in eng.extra_data:
-            eng.extra_data["_LoopData"] = {}
-        if "get_records_from_file" not in eng.extra_data["_LoopData"]:
-            eng.extra_data["_LoopData"]["get_records_from_file"] = {}
-            if path:
-                eng.extra_data["_LoopData"]["get_records_from_file"].update(
-                    {"data": record_extraction_from_file(path)})
-            else:
-                eng.extra_data["_LoopData"]["get_records_from_file"].update(
-                    {"data": record_extraction_from_file(obj.data)})
-                eng.extra_data["_LoopData"]["get_records_from_file"][
-                    "path"] = obj.data
-
-        elif os.path.isfile(obj.data) and obj.data != \
-                eng.extra_data["_LoopData"]["get_records_from_file"]["path"]:
-            eng.extra_data["_LoopData"]["get_records_from_file"].update(
-                {"data": record_extraction_from_file(obj.data)})
-        return eng.extra_data["_LoopData"]["get_records_from_file"]["data"]
+        return iter_records_from_file(path or obj.data)
 
     return _get_records_from_file
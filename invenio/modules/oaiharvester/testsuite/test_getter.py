@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Tests for the OAI harvesting getter, against a local OAI-PMH stub."""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urlparse
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+
+class StubOAIServer(ThreadingMixIn, HTTPServer):
+
+    """OAI-PMH server answering every set with two resumption pages.
+
+    The first request for a second page is answered with a 503 error, the
+    requests for the set 'private' with a 401 error.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        """Listen on a free local port."""
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubOAIRequestHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.running = 0
+        self.max_running = 0
+        self.unavailable = set()
+
+
+class StubOAIRequestHandler(BaseHTTPRequestHandler):
+
+    """Request handler of StubOAIServer."""
+
+    def do_POST(self):
+        """Answer an OAI-PMH request."""
+        length = int(self.headers.getheader('content-length'))
+        params = dict(urlparse.parse_qsl(self.rfile.read(length)))
+        server = self.server
+        with server.lock:
+            server.requests.append(params)
+            server.running += 1
+            server.max_running = max(server.max_running, server.running)
+        try:
+            # let the concurrent requests overlap
+            time.sleep(0.05)
+            if params.get('set') == 'private':
+                self.send_response(401)
+                self.end_headers()
+                return
+            token = params.get('resumptionToken')
+            if token and token not in server.unavailable:
+                server.unavailable.add(token)
+                self.send_response(503)
+                self.send_header('Retry-After', '0')
+                self.end_headers()
+                return
+            if token:
+                body = '<record>%s-2</record>' % token
+            else:
+                body = ('<record>%s-1</record><resumptionToken>%s'
+                        '</resumptionToken>' % ((params.get('set', 'all'), ) * 2))
+            self.send_response(200)
+            self.send_header('Content-type', 'text/xml')
+            self.end_headers()
+            self.wfile.write('<OAI-PMH><ListRecords>%s</ListRecords></OAI-PMH>'
+                             % body)
+        finally:
+            with server.lock:
+                server.running -= 1
+
+    def log_message(self, *args):
+        """Be quiet."""
+        pass
+
+
+class OAIHarvestGetterTest(InvenioTestCase):
+
+    """Test the harvesting of a local OAI-PMH stub."""
+
+    def setUp(self):
+        """Start the stub server."""
+        self.server = StubOAIServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.location = '127.0.0.1:%d' % self.server.server_address[1]
+        self.directory = tempfile.mkdtemp()
+        self.http_proxy = os.environ.pop('http_proxy', None)
+
+    def tearDown(self):
+        """Stop the stub server."""
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+        if self.http_proxy is not None:
+            os.environ['http_proxy'] = self.http_proxy
+
+    def _harvest(self, sets=None):
+        from invenio.legacy.oaiharvest import getter
+        files = getter.harvest(self.location, '/oai2d',
+                               {'verb': 'ListRecords',
+                                'metadataPrefix': 'marcxml'},
+                               output=os.path.join(self.directory, 'test_'),
+                               sets=sets)
+        return [open(path).read() for path in files]
+
+    def test_resumption_pages(self):
+        """oaiharvest - resumption pages are harvested in order"""
+        pages = self._harvest()
+        self.assertEqual(len(pages), 2)
+        self.assertTrue('<record>all-1</record>' in pages[0])
+        self.assertTrue('<record>all-2</record>' in pages[1])
+        # the 503 answer was retried
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_sets_are_harvested_concurrently(self):
+        """oaiharvest - sets are harvested concurrently, in bounded number"""
+        from invenio.legacy.oaiharvest.config import \
+            CFG_OAI_HARVEST_MAX_CONNECTIONS_PER_SERVER
+        sets = ['a', 'b', 'c', 'd']
+        pages = self._harvest(sets)
+        self.assertEqual(len(pages), 8)
+        for i, set_spec in enumerate(sets):
+            self.assertTrue('<record>%s-1</record>' % set_spec in pages[2 * i])
+            self.assertTrue('<record>%s-2</record>' % set_spec
+                            in pages[2 * i + 1])
+        self.assertTrue(1 < self.server.max_running <=
+                        CFG_OAI_HARVEST_MAX_CONNECTIONS_PER_SERVER)
+
+    def test_authentication_required(self):
+        """oaiharvest - authentication errors are raised from the jobs"""
+        from invenio.legacy.oaiharvest.getter import InvenioOAIRequestError
+        self.assertRaises(InvenioOAIRequestError, self._harvest,
+                          ['a', 'private'])
+
+    def test_job_exit(self):
+        """oaiharvest - harvest jobs exiting raise from result()"""
+        from invenio.legacy.oaiharvest.getter import HarvestJob
+        job = HarvestJob(sys.exit, 1)
+        self.assertRaises(SystemExit, job.result)
+
+    def test_retry_delay(self):
+        """oaiharvest - retry delays back off and honour Retry-After"""
+        from invenio.legacy.oaiharvest.getter import get_retry_delay
+        from invenio.legacy.oaiharvest.config import \
+            CFG_OAI_HARVEST_RETRY_DELAY, CFG_OAI_HARVEST_RETRY_MAX_DELAY
+        self.assertEqual(get_retry_delay(1), CFG_OAI_HARVEST_RETRY_DELAY)
+        self.assertEqual(get_retry_delay(2), 2 * CFG_OAI_HARVEST_RETRY_DELAY)
+        self.assertEqual(get_retry_delay(100), CFG_OAI_HARVEST_RETRY_MAX_DELAY)
+        self.assertEqual(get_retry_delay(3, '7'), 7)
+        self.assertEqual(get_retry_delay(1, 'soon'),
+                         CFG_OAI_HARVEST_RETRY_DELAY)
+
+
+TEST_SUITE = make_test_suite(OAIHarvestGetterTest)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -193,6 +193,34 @@ class OAIHarvesterUtils(InvenioTestCase):
 
         self.assertEqual(len(record_extraction_from_file(path_tmp)), 1)
 
+    def test_records_iteration_from_file(self):
+        """Test iterating over the records of an OAI XML file."""
+        from invenio.modules.oaiharvester.utils import (
+            iter_records_from_file, record_extraction_from_string)
+        xml_sample = """<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+        <responseDate>2014-11-05T09:32:51Z</responseDate>
+        <request verb="ListRecords" metadataPrefix="marcxml">http://example.org/oai2d</request>
+        <ListRecords>
+        <record><header><identifier>oai:example.org:1</identifier></header>
+        <metadata><record xmlns="http://www.loc.gov/MARC21/slim"><controlfield tag="001">1</controlfield></record></metadata>
+        </record>
+        <record><header><identifier>oai:example.org:2</identifier></header></record>
+        <resumptionToken>token</resumptionToken>
+        </ListRecords>
+        </OAI-PMH>"""
+        fd_tmp, path_tmp = tempfile.mkstemp()
+        os.write(fd_tmp, xml_sample)
+        os.close(fd_tmp)
+
+        records = iter_records_from_file(path_tmp)
+        self.assertFalse(isinstance(records, list))
+        records = list(records)
+        os.remove(path_tmp)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records, record_extraction_from_string(xml_sample))
+        self.assertTrue("oai:example.org:2" in records[1])
+        self.assertTrue("responseDate" in records[1])
+
 
 TEST_SUITE = make_test_suite(OAIHarvesterUtils)
 
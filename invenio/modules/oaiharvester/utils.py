@@ -19,6 +19,8 @@
 
 """OAI harvest utils."""
 
+from copy import deepcopy
+
 from lxml import etree
 
 from invenio.base.globals import cfg
@@ -36,10 +38,58 @@ def record_extraction_from_file(path, oai_namespace="http://www.openarchives.org
     :return: return a list of XML records as string
     :rtype: str
     """
-    list_of_records = []
-    with open(path) as xml_file:
-        list_of_records = record_extraction_from_string(xml_file.read(), oai_namespace)
-    return list_of_records
+    return list(iter_records_from_file(path, oai_namespace))
+
+
+def iter_records_from_file(path, oai_namespace="http://www.openarchives.org/OAI/2.0/"):
+    """Given a harvested file yield every record incl. headers.
+
+    The file is parsed incrementally and every record is dropped from
+    the tree once yielded, so that the memory used does not depend on
+    the size of the file.
+
+    :param path: is the path of the file harvested
+    :type path: str
+
+    :param oai_namespace: optionally provide the OAI-PMH namespace
+    :type oai_namespace: str
+
+    :return: iterator over the XML records as string
+    :rtype: iterator
+    """
+    if oai_namespace:
+        nsmap = {
+            None: oai_namespace
+        }
+        namespace_prefix = "{{{0}}}".format(oai_namespace)
+    else:
+        nsmap = cfg.get("OAIHARVESTER_DEFAULT_NAMESPACE_MAP")
+        namespace_prefix = ""
+    record_tag = "{0}record".format(namespace_prefix)
+    header_tags = ("{0}responseDate".format(namespace_prefix),
+                   "{0}request".format(namespace_prefix))
+
+    headers = []
+    depth = 0  # number of records being parsed, to skip nested ones
+    for event, element in etree.iterparse(path, events=("start", "end")):
+        if element.tag == record_tag:
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth:
+                continue
+            wrapper = etree.Element("OAI-PMH", nsmap=nsmap)
+            for header in headers:
+                wrapper.append(deepcopy(header))
+            # Moving the record out of the parsed tree frees it
+            wrapper.append(element)
+            yield etree.tostring(wrapper)
+        elif event == "end" and not depth:
+            if element.tag in header_tags:
+                headers.append(deepcopy(element))
+            if element.getparent() is not None:
+                element.clear()
 
 
 def record_extraction_from_string(xml_string, oai_namespace="http://www.openarchives.org/OAI/2.0/"):
@@ -35,6 +35,7 @@ from invenio.modules.workflows.tasks.workflows_tasks import (
 
 from invenio.modules.workflows.tasks.logic_tasks import (
     foreach,
+    foreach_iterator,
     end_for,
     simple_for,
     workflow_if,
@@ -54,6 +55,7 @@ from ..tasks.harvesting import (
     get_records_from_file,
     get_repositories_list,
     harvest_records,
+    start_harvesting,
 )
 
 
@@ -66,6 +68,7 @@ class oaiharvest_harvest_repositories(RecordWorkflow):
 
     workflow = [
         init_harvesting,
+        start_harvesting(get_repositories_list()),
         foreach(get_repositories_list(), "repository"),
         [
             write_something_generic("Harvesting", [task_update_progress,
@@ -75,7 +78,7 @@ class oaiharvest_harvest_repositories(RecordWorkflow):
             [
                 write_something_generic("Starting sub-workflows for file",
                                         [task_update_progress, write_message]),
-                foreach(get_records_from_file()),
+                foreach_iterator(get_records_from_file()),
                 [
                     workflow_if(filtering_oai_pmh_identifier),
                     [
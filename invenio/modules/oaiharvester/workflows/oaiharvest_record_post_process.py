@@ -42,6 +42,9 @@ class oaiharvest_record_post_process(RecordWorkflow):
 
     object_type = "OAI harvest"
 
+    # The records are post-processed independently from each other
+    parallel = True
+
     workflow = [
         workflow_if(post_process_selected("c")),
         [
@@ -23,6 +23,9 @@ import re
 from xml.etree import ElementTree as ET
 from six import StringIO
 
+from intbitset import intbitset
+from mock import patch
+
 from invenio.base.wrappers import lazy_import
 from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
 
@@ -114,8 +117,121 @@ class TestErrorCodes(InvenioTestCase):
 
         self.assertNotEqual([], [code for (code, dummy_text) in oai_repository_server.check_argd({'verb': 'ListRecords', 'resumptionToken': ''}) if code == 'badResumptionToken'])
 
+class TestResumptionToken(InvenioTestCase):
+    """Test for the resumption tokens."""
+
+    def test_resumption_token_round_trip(self):
+        """oairepository - resumption tokens keep the harvest position"""
+        cache = {'argd': {'verb': 'ListRecords', 'metadataPrefix': 'marcxml',
+                          'set': 'cern:experiment'},
+                 'from': '2014-01-01 00:00:00',
+                 'until': '2015-01-01 23:59:59',
+                 'last_recid': 42,
+                 'cursor': 500,
+                 'complete_list_size': 1234}
+        token = oai_repository_server.oai_cache_dump(cache)
+        self.assertTrue(re.match(r'[A-Za-z0-9_-]+\Z', token))
+        loaded = oai_repository_server.oai_cache_load(token)
+        del loaded['expires']
+        self.assertEqual(cache, loaded)
+
+    def test_invalid_resumption_token(self):
+        """oairepository - invalid resumption tokens are refused"""
+        self.assertRaises(ValueError, oai_repository_server.oai_cache_load,
+                          'not a token')
+        self.assertRaises(ValueError, oai_repository_server.oai_cache_load,
+                          'e30')
+        token = oai_repository_server.oai_cache_dump(
+            {'argd': {'verb': 'ListRecords', 'metadataPrefix': 'unknown'},
+             'from': '', 'until': '', 'last_recid': 0, 'cursor': 0,
+             'complete_list_size': 1})
+        self.assertRaises(ValueError, oai_repository_server.oai_cache_load,
+                          token)
+
+
+class TestRecidPages(InvenioTestCase):
+    """Test for the pages of records of the lists."""
+
+    def _walk(self, set_spec, fromdate, untildate, size):
+        """Return the recids of all the pages of a list."""
+        recids = []
+        last_recid = 0
+        while True:
+            page, more_recids = oai_repository_server.oai_get_recid_page(
+                set_spec, fromdate, untildate, last_recid, size)
+            recids.extend(page)
+            if not more_recids:
+                self.assertTrue(len(page) <= size)
+                return recids
+            self.assertEqual(len(page), size)
+            last_recid = page[-1]
+
+    def test_pages_as_list(self):
+        """oairepository - pages of the lists as their complete list"""
+        from invenio.legacy.dbquery import run_sql
+        dates = [row[0] for row in run_sql(
+            "SELECT DATE_FORMAT(modification_date, '%%Y-%%m-%%d') "
+            "FROM bibrec ORDER BY modification_date")]
+        middle = dates[len(dates) // 2]
+        sets = [''] + [set_spec for set_spec, dummy_name, dummy_description
+                       in oai_repository_server.get_all_sets().values()]
+        for policy in ('no', 'persistent'):
+            with patch('invenio.legacy.oairepository.server.'
+                       'CFG_OAI_DELETED_POLICY', policy):
+                for set_spec in sets:
+                    for fromdate, untildate in (('', ''), (middle, ''),
+                                                ('', middle)):
+                        expected = oai_repository_server.oai_get_recid_list(
+                            set_spec, fromdate, untildate).tolist()
+                        date_range = oai_repository_server.get_date_range(
+                            fromdate, untildate, set_spec)
+                        for size in (1, 3, 100):
+                            self.assertEqual(
+                                expected,
+                                self._walk(set_spec, date_range[0],
+                                           date_range[1], size),
+                                (policy, set_spec, fromdate, untildate,
+                                 size))
+
+    def test_page_boundaries(self):
+        """oairepository - pages skip deleted and restricted records"""
+        ## (recid, set) rows of the set field and of the previous set field
+        rows = {
+            '909COp': [(1, 'a'), (2, 'a'), (2, 'a:b'), (3, 'a'), (4, 'a'),
+                       (4, 'a:b'), (4, 'a:c'), (6, 'a'), (9, 'a')],
+            '909COq': [(5, 'a'), (7, 'a'), (8, 'a')],
+        }
+
+        def get_set_recids_after(field, set_spec, fromdate, untildate,
+                                 last_recid, size):
+            res = [recid for recid, dummy_set in rows[field]
+                   if recid > last_recid][:size]
+            return sorted(set(res)), len(res) < size
+
+        with patch('invenio.legacy.oairepository.server.'
+                   'oai_get_set_recids_after',
+                   side_effect=get_set_recids_after):
+            with patch('invenio.legacy.oairepository.server.'
+                       'get_all_restricted_recids',
+                       return_value=intbitset([3])):
+                with patch('invenio.legacy.oairepository.server.'
+                           'get_deleted_recids',
+                           side_effect=lambda recids:
+                           intbitset(recids) & intbitset([5, 8])):
+                    for policy, expected in (
+                            ('no', [1, 2, 4, 6, 9]),
+                            ('persistent', [1, 2, 4, 5, 6, 7, 8, 9])):
+                        with patch('invenio.legacy.oairepository.server.'
+                                   'CFG_OAI_DELETED_POLICY', policy):
+                            for size in (1, 2, 3):
+                                self.assertEqual(expected,
+                                                 self._walk('a', '', '', size))
+
+
 TEST_SUITE = make_test_suite(TestVerbs,
-                             TestErrorCodes)
+                             TestErrorCodes,
+                             TestResumptionToken,
+                             TestRecidPages)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the citation graph snapshot."""
+
+import os
+import shutil
+import tempfile
+
+from invenio.base.wrappers import lazy_import
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+citation_graph = lazy_import('invenio.legacy.bibrank.citation_graph')
+
+
+class TestCitationGraph(InvenioTestCase):
+
+    """Test the lookups in a citation graph snapshot."""
+
+    def setUp(self):
+        """Write a snapshot of a small citation graph."""
+        from numpy import array, diff, int32, save
+        self.directory = tempfile.mkdtemp()
+        # 1 cites 5, 2 cites 5 and 7, 5 cites 2 and 9 cites 1
+        citers = array([1, 2, 2, 5, 9], int32)
+        citees = array([5, 5, 7, 2, 1], int32)
+        arrays = {}
+        arrays['refs_indptr'], arrays['refs_indices'] = \
+            citation_graph._build_csr(citers, citees, 10)
+        arrays['cites_indptr'], arrays['cites_indices'] = \
+            citation_graph._build_csr(citees, citers, 10)
+        arrays['cites_counts'] = diff(arrays['cites_indptr'])
+        for name in citation_graph.CITATION_GRAPH_ARRAYS:
+            save(os.path.join(self.directory, '%s.1.npy' % name),
+                 arrays[name])
+        with open(os.path.join(self.directory, 'current'), 'w') as current:
+            current.write('1')
+        self.graph = citation_graph.get_citation_graph(self.directory)
+
+    def tearDown(self):
+        """Remove the snapshot."""
+        shutil.rmtree(self.directory)
+
+    def test_no_snapshot(self):
+        """citation graph - no snapshot written yet"""
+        self.assertEqual(None, citation_graph.get_citation_graph(
+            os.path.join(self.directory, 'missing')))
+
+    def test_neighbours(self):
+        """citation graph - references and citers of one record"""
+        self.assertEqual([5, 7], self.graph.refers_to(2).tolist())
+        self.assertEqual([1, 2], self.graph.cited_by(5).tolist())
+        self.assertEqual([], self.graph.cited_by(3).tolist())
+        self.assertEqual([], self.graph.cited_by(100).tolist())
+
+    def test_hitsets(self):
+        """citation graph - references and citers of many records"""
+        self.assertEqual([1, 5, 7], list(
+            self.graph.refers_to_hitset([1, 2, 9, 100])))
+        self.assertEqual([1, 2, 9], list(self.graph.cited_by_hitset([5, 1])))
+        self.assertEqual([5, 5, 7], sorted(
+            self.graph.refers_to_all([1, 2]).tolist()))
+
+    def test_cited_between(self):
+        """citation graph - records cited a given number of times"""
+        self.assertEqual([1, 2, 5, 7], list(self.graph.cited_between(0)))
+        self.assertEqual([5], list(self.graph.cited_between(2, 2)))
+        self.assertEqual([1, 2, 7], list(self.graph.cited_between(1, 1)))
+
+
+TEST_SUITE = make_test_suite(TestCitationGraph,)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
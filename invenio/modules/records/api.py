@@ -26,7 +26,7 @@ from sqlalchemy import or_
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from werkzeug.utils import cached_property
 
-from invenio.modules.jsonalchemy.reader import Reader
+from invenio.modules.jsonalchemy.reader import Reader, split_blob
 from invenio.modules.jsonalchemy.wrappers import SmartJson
 from invenio.modules.jsonalchemy.errors import ReaderException
 
@@ -53,9 +53,21 @@ class Record(SmartJson):
         return Reader.translate(blob, Record, master_format, **kwargs)
 
     @classmethod
-    def create_many(cls, blobs, master_format, **kwargs):
-        """Create many new record from the blob using the right reader."""
-        raise NotImplementedError()
+    def create_many(cls, blobs, master_format, save=False, **kwargs):
+        """Create many new records from the blobs using the right reader.
+
+        :param blobs: Either one blob containing several records, which is
+            split using the reader of `master_format`, or an iterable of blobs.
+        :param save: If set to `True` all the records are stored in one
+            transaction.  Their rows must exist already.
+        :return: List of the new records.
+        """
+        if isinstance(blobs, six.string_types):
+            blobs = split_blob(blobs, master_format)
+        records = [cls.create(blob, master_format, **kwargs) for blob in blobs]
+        if save:
+            cls._save_many(records)
+        return records
 
     @classmethod
     def get_record(cls, recid, reset_cache=False):
@@ -91,6 +103,73 @@ class Record(SmartJson):
         db.session.commit()
         return record
 
+    @classmethod
+    def get_records(cls, recids, reset_cache=False):
+        """Get many records from the DB, in the order of `recids`.
+
+        The records are fetched ``RECORDS_BULK_SIZE`` at once with a few
+        queries, the ones missing from the storage engine are created again
+        from their master format and stored in one transaction.
+
+        :param reset_cache: If set to `True` it creates the JSONs again.
+        :return: List of records, `None` for the records that can't be found.
+        """
+        recids = [int(recid) for recid in recids]
+        chunk_size = current_app.config.get('RECORDS_BULK_SIZE', 1000)
+        records = {}
+        for start in xrange(0, len(recids), chunk_size):
+            chunk = recids[start:start + chunk_size]
+            jsons = {} if reset_cache else cls._get_jsons(chunk)
+            for recid, json in six.iteritems(jsons):
+                records[recid] = Record(json)
+            missing = [recid for recid in chunk if recid not in jsons]
+            if missing:
+                records.update(cls._create_from_blobs(missing))
+        return [records.get(recid) for recid in recids]
+
+    @classmethod
+    def _get_jsons(cls, recids):
+        """Return the stored JSONs of the given records by record id."""
+        try:
+            return dict((json['_id'], json)
+                        for json in cls.storage_engine.get_many(recids)
+                        if json is not None)
+        except (KeyError, AttributeError):
+            # some engines fail as soon as one of the records is missing
+            pass
+        jsons = {}
+        for recid in recids:
+            try:
+                json = cls.storage_engine.get_one(recid)
+            except (NoResultFound, KeyError, AttributeError):
+                continue
+            if json is not None:
+                jsons[recid] = json
+        return jsons
+
+    @classmethod
+    def _create_from_blobs(cls, recids):
+        """Create and store the records again from their master format."""
+        blobs = cls.get_blobs(recids)
+        records = {}
+        records_sql = {}
+        for record_sql in RecordModel.query.filter(
+                RecordModel.id.in_(recids)):
+            blob = blobs.get(record_sql.id)
+            if blob is None:
+                continue
+            additional_info = record_sql.additional_info \
+                if record_sql.additional_info \
+                else {'master_format': 'marc'}
+            record = cls.create(blob, **additional_info)
+            record['modification_date'] = record_sql.modification_date
+            record['creation_date'] = record_sql.creation_date
+            records[record_sql.id] = record
+            records_sql[record_sql.id] = record_sql
+        if records:
+            cls._save_many(records.values(), records_sql)
+        return records
+
     @classmethod
     def get_blob(cls, recid):
         """Get the blob from where the record was created."""
@@ -106,6 +185,28 @@ class Record(SmartJson):
             current_app.logger.exception(
                 'Error retrieving the blob for recid {0}'.format(recid))
 
+    @classmethod
+    def get_blobs(cls, recids):
+        """Get the blobs from where the records were created, by record id."""
+        from invenio.ext.sqlalchemy import db
+        from invenio.modules.formatter.models import Bibfmt
+        from zlib import decompress
+        blobs = {}
+        duplicated = set()
+        for recid, value in db.session.query(
+                Bibfmt.id_bibrec, Bibfmt.value).filter(
+                Bibfmt.id_bibrec.in_(recids),
+                or_(Bibfmt.kind == 'master', Bibfmt.format == 'xm')):
+            if recid in blobs:
+                duplicated.add(recid)
+            blobs[recid] = value
+        for recid in set(recids) - set(blobs) | duplicated:
+            current_app.logger.error(
+                'Error retrieving the blob for recid {0}'.format(recid))
+            blobs.pop(recid, None)
+        return dict((recid, decompress(value))
+                    for recid, value in six.iteritems(blobs))
+
     @property
     def blob(self):
         """Return data blob."""
@@ -154,15 +255,44 @@ class Record(SmartJson):
         return filter(None, pids)
 
     def _save(self):
-        self.__class__.storage_engine.update_one(self.dumps())
-        record_sql = RecordModel.query.get(self['recid'])
-        record_sql.modification_date = self['modification_date']
-        record_sql.creation_date = self['creation_date']
-        record_sql.master_format = self.additional_info.master_format
-        record_sql.additional_info = self.additional_info
+        self.__class__._save_many([self])
+
+    @classmethod
+    def _save_many(cls, records, records_sql=None):
+        """Store the records and update their rows in one transaction.
+
+        :param records_sql: Already loaded SQL models of the records by record
+            id, the missing ones are fetched with one query.
+        :raise NoResultFound: if a record has no row, before anything is
+            stored.
+        """
         from invenio.ext.sqlalchemy import db
-        db.session.merge(record_sql)
-        db.session.commit()
+        records_sql = dict(records_sql or {})
+        missing = [record['recid'] for record in records
+                   if record['recid'] not in records_sql]
+        if missing:
+            records_sql.update(
+                (record_sql.id, record_sql) for record_sql in
+                RecordModel.query.filter(RecordModel.id.in_(missing)))
+            unknown = [recid for recid in missing if recid not in records_sql]
+            if unknown:
+                raise NoResultFound(
+                    'No row for the records {0}'.format(unknown))
+        try:
+            for record in records:
+                record_sql = records_sql[record['recid']]
+                record_sql.modification_date = record['modification_date']
+                record_sql.creation_date = record['creation_date']
+                record_sql.master_format = record.additional_info.master_format
+                record_sql.additional_info = record.additional_info
+                db.session.merge(record_sql)
+            jsons = [record.dumps() for record in records]
+            cls.storage_engine.update_many(
+                jsons, [json['_id'] for json in jsons])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
     # Legacy methods, try not to use them as they are already deprecated
 
@@ -246,4 +376,5 @@ class Record(SmartJson):
 create_record = Record.create
 create_records = Record.create_many
 get_record = Record.get_record
+get_records = Record.get_records
 get_record_blob = Record.get_blob
@@ -25,6 +25,10 @@ from .models import RecordMetadata as RecordMetadataModel
 RECORDS_BREADCRUMB_TITLE_KEY = 'title.title'
 """Key used to extract the breadcrumb title from the record."""
 
+RECORDS_BULK_SIZE = 1000
+"""Number of records fetched at once by
+:meth:`~invenio.modules.records.api.Record.get_records`."""
+
 RECORDS_ENGINE = ('invenio.modules.jsonalchemy.jsonext.engines.sqlalchemy'
                   ':SQLAlchemyStorage')
 
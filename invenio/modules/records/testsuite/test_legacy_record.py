@@ -22,6 +22,7 @@ The BibRecord test suite.
 """
 import os
 import pkg_resources
+from six import StringIO
 
 from invenio.base.wrappers import lazy_import
 from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
@@ -112,6 +113,26 @@ class BibRecordSuccessTest(InvenioTestCase):
         record1 = bibrecord.create_records(xmltext)[0]
         self.assertEqual(record1, record)
 
+    def test_iter_records(self):
+        """ bibrecord - iter_records() streams the same records as create_records()"""
+        xmlstream = pkg_resources.resource_stream('invenio.testsuite',
+                os.path.join('data', 'demo_record_marc_data.xml'))
+        try:
+            recs = [rec[0] for rec in bibrecord.iter_records(xmlstream)]
+        finally:
+            xmlstream.close()
+        self.assertEqual(self.recs, recs)
+
+    def test_iter_records_bad_input(self):
+        """ bibrecord - iter_records() reports a broken input"""
+        xmltext = """<collection><record>
+        <controlfield tag="001">33</controlfield>
+        </record><record>"""
+        recs = bibrecord.iter_records(StringIO(xmltext))
+        self.assertEqual(next(recs)[0], {'001': [([], ' ', ' ', '33', 1)]})
+        self.assertRaises(bibrecord_config.InvenioBibRecordParserError,
+                          list, recs)
+
 class BibRecordParsersTest(InvenioTestCase):
     """ bibrecord - testing the creation of records with different parsers"""
 
@@ -29,7 +29,7 @@ from flask_registry import (
 from invenio.base.wrappers import lazy_import
 from invenio.ext.registry import ModuleAutoDiscoverySubRegistry
 from invenio.testsuite import (
-    InvenioTestCase, make_test_suite, nottest, run_test_suite
+    InvenioTestCase, make_test_suite, run_test_suite
 )
 
 from mock import patch
@@ -85,14 +85,13 @@ class TestRecord(InvenioTestCase):
         del self.app.extensions['registry']['testsuite.models']
         del self.app.extensions['registry']['testsuite.functions']
 
-    @nottest
     def test_records_created(self):
         """Record - demo file how many records are created."""
         xmltext = pkg_resources.resource_string(
             'invenio.testsuite',
             os.path.join('data', 'demo_record_marc_data.xml'))
         recs = [record for record in Record.create_many(xmltext, master_format='marc')]
-        self.assertEqual(141, len(recs))
+        self.assertEqual(142, len(recs))
 
     def test_accented_unicode_letterst_test(self):
         """Record - accented Unicode letters."""
@@ -112,6 +111,21 @@ class TestRecord(InvenioTestCase):
         self.assertEquals(rec['authors[0].full_name'], 'Döè1, John')
         self.assertEquals(rec['title.title'], 'Пушкин')
 
+    def test_create_many(self):
+        """Record - create many records from one or several blobs."""
+        blobs = ['<record><datafield tag="245" ind1=" " ind2=" ">'
+                 '<subfield code="a">Title %d</subfield></datafield>'
+                 '</record>' % (i, ) for i in range(3)]
+        recs = Record.create_many('<collection>%s</collection>' %
+                                  ('\n'.join(blobs), ),
+                                  master_format='marc', namespace='testsuite')
+        self.assertEquals([rec['title.title'] for rec in recs],
+                          ['Title 0', 'Title 1', 'Title 2'])
+        recs = Record.create_many(blobs[1:], master_format='marc',
+                                  namespace='testsuite')
+        self.assertEquals([rec['title.title'] for rec in recs],
+                          ['Title 1', 'Title 2'])
+
     def test_create_empty_record(self):
         """Record - Create empty record."""
         rec = Record(master_format='marc', namespace='testsuite')
@@ -634,11 +648,84 @@ class TestRecordDocuments(InvenioTestCase):
         self.assertEquals(d.is_authorized(user_info)[0], 0)
 
 
+class TestRecordsBulk(InvenioTestCase):
+    """Record - storing and getting many records at once."""
+
+    recids = [1, 2, 3]
+
+    def _dump(self, record):
+        return None if record is None else \
+            (record['recid'], record.get('title'))
+
+    def test_get_records(self):
+        """Record - get many records in the given order."""
+        records = Record.get_records([3, 99999999, 1, '2', 3])
+        self.assertEqual([record and record['recid'] for record in records],
+                         [3, None, 1, 2, 3])
+        self.assertEqual([self._dump(record) for record in records],
+                         [self._dump(Record.get_record(recid))
+                          if recid != 99999999 else None
+                          for recid in [3, 99999999, 1, 2, 3]])
+
+    def test_get_records_from_blobs(self):
+        """Record - get many records rebuilt from their master format."""
+        expected = [self._dump(Record.get_record(recid))
+                    for recid in self.recids]
+        with patch.object(Record, 'get_blobs',
+                          wraps=Record.get_blobs) as get_blobs:
+            records = Record.get_records(self.recids + [99999999],
+                                         reset_cache=True)
+            self.assertEqual(get_blobs.call_count, 1)
+        self.assertEqual([self._dump(record) for record in records],
+                         expected + [None])
+        # the rebuilt records are stored again
+        for recid in self.recids:
+            self.assertEqual(Record.storage_engine.get_one(recid)['recid'],
+                             recid)
+
+    def test_create_many_save(self):
+        """Record - create and store many records in one transaction."""
+        blobs = [Record.get_blob(recid) for recid in reversed(self.recids)]
+        records = Record.create_many(blobs, master_format='marc', save=True)
+        self.assertEqual([record['recid'] for record in records],
+                         list(reversed(self.recids)))
+        self.assertEqual([self._dump(record) for record in records],
+                         [self._dump(record) for record in
+                          Record.get_records(reversed(self.recids))])
+
+    def test_save_many_unknown_record(self):
+        """Record - no row is created for unknown records."""
+        from sqlalchemy.orm.exc import NoResultFound
+        from invenio.modules.records.models import Record as RecordModel
+        records = Record.create_many([Record.get_blob(1)],
+                                     master_format='marc')
+        records[0]['recid'] = 99999999
+        with patch.object(Record.storage_engine, 'update_many') as update:
+            self.assertRaises(NoResultFound, Record._save_many, records)
+            self.assertFalse(update.called)
+        self.assertEqual(RecordModel.query.get(99999999), None)
+
+    def test_save_many_rollback(self):
+        """Record - rows are rolled back when the records can't be stored."""
+        from datetime import datetime
+        from invenio.modules.records.models import Record as RecordModel
+        modification_date = RecordModel.query.get(1).modification_date
+        records = Record.create_many([Record.get_blob(1)],
+                                     master_format='marc')
+        records[0]['modification_date'] = datetime(2000, 1, 1)
+        with patch.object(Record.storage_engine, 'update_many',
+                          side_effect=RuntimeError):
+            self.assertRaises(RuntimeError, Record._save_many, records)
+        self.assertEqual(RecordModel.query.get(1).modification_date,
+                         modification_date)
+
+
 TEST_SUITE = make_test_suite(
     TestLegacyExport,
     TestMarcRecordCreation,
     TestRecord,
     TestRecordDocuments,
+    TestRecordsBulk,
 )
 
 if __name__ == '__main__':
@@ -72,6 +72,19 @@ class SchTASK(db.Model):
                            db.ForeignKey(SeqSTORE.id))
 
 
+class SchTASKRECORD(db.Model):
+
+    """Represent a record lock declared by a SchTASK."""
+
+    __tablename__ = 'schTASKRECORD'
+
+    id_schTASK = db.Column(db.Integer(15, unsigned=True),
+                           db.ForeignKey(SchTASK.id), nullable=False,
+                           primary_key=True)
+    record = db.Column(db.String(255), nullable=False, primary_key=True,
+                       index=True)
+
+
 # FIXME To be moved to redis when available
 class SchSTATUS(db.Model):
 
@@ -85,5 +98,6 @@ class SchSTATUS(db.Model):
 
 __all__ = ['HstTASK',
            'SchTASK',
+           'SchTASKRECORD',
            'SchSTATUS',
            ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""schTASKRECORD table addition."""
+
+from invenio.ext.sqlalchemy import db
+from invenio.modules.upgrader.api import op
+
+depends_on = [u'scheduler_2014_03_18_sequenceid_increase']
+
+
+def info():
+    """Short description of upgrade displayed to end-user."""
+    return "schTASKRECORD table addition"
+
+
+def do_upgrade():
+    """Implement your upgrades here."""
+    op.create_table('schTASKRECORD',
+                    db.Column('id_schTASK',
+                              db.Integer(display_width=15, unsigned=True),
+                              nullable=False),
+                    db.Column('record', db.String(length=255),
+                              nullable=False),
+                    db.ForeignKeyConstraint(['id_schTASK'],
+                                            ['schTASK.id'], ),
+                    db.PrimaryKeyConstraint('id_schTASK', 'record'),
+                    mysql_charset='utf8',
+                    mysql_engine='MyISAM'
+                    )
+    op.create_index(op.f('ix_schTASKRECORD_record'), 'schTASKRECORD',
+                    ['record'])
+
+
+def estimate():
+    """Estimate the time needed to apply upgrades."""
+    return 1
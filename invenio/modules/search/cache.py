@@ -19,12 +19,17 @@
 
 """Implementation of search results caching."""
 
+from functools import partial
 from intbitset import intbitset
 from flask import current_app
 
 from invenio.base.globals import cfg
 from invenio.ext.cache import cache
-from invenio.legacy.miscutil.data_cacher import DataCacher, DataCacherProxy
+from invenio.legacy.miscutil.data_cacher import (
+    DataCacher,
+    DataCacherProxy,
+    get_data_generation,
+)
 from invenio.utils.hash import md5
 
 from .models import Field, Fieldname
@@ -124,7 +129,8 @@ class FieldI18nNameDataCacher(DataCacher):
             from invenio.legacy.dbquery import get_table_update_time
             return get_table_update_time('fieldname')
 
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            ('fieldname', ))
 
 field_i18nname_cache = DataCacherProxy(FieldI18nNameDataCacher)
 
@@ -149,3 +155,164 @@ def get_field_i18nname(f, ln=None, verify_cache_timestamp=True):
     except KeyError:
         pass  # translation in LN does not exist
     return out
+
+
+class FacetIndexDataCacher(DataCacher):
+
+    """Provide cache for the records having each value of a facet field.
+
+    The cache holds under 'recids' a dictionary of every value of the MARC
+    tags of the field to the intbitset of records having it, and under
+    'values' the list of values by decreasing number of records, and under
+    'lowercase' the dictionary of every lowercased value to the values
+    having it.  Once built, it is refreshed incrementally: only the records
+    modified since the previous refresh are reloaded.  The uploads leaving
+    the modification date of the records untouched (bibupload
+    --notimechange) publish a 'bibrec_notimechange' change, after which the
+    index is rebuilt from scratch.
+
+    This class is not to be used directly; use function get_facet_index()
+    instead.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.tags = [tag for tag in Field.get_field_tags(field)
+                     if tag[0:2].isdigit()]
+
+        def cache_filler():
+            from invenio.legacy.dbquery import run_sql
+            ret = {}
+            max_recid = run_sql("SELECT MAX(id) FROM bibrec")[0][0] or 0
+            chunk = cfg['CFG_WEBSEARCH_FACET_INDEX_CHUNK_SIZE']
+            for low in xrange(1, max_recid + 1, chunk):
+                self._load_values(ret, "BETWEEN %s AND %s",
+                                  (low, low + chunk - 1))
+            return _make_facet_index(ret)
+
+        def timestamp_verifier():
+            from invenio.legacy.dbquery import get_table_update_time
+            return max([get_table_update_time('bibrec')] +
+                       [get_table_update_time('bibrec_bib%sx' % tag[0:2])
+                        for tag in self.tags])
+
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            ('bibrec', ))
+
+    def _load_values(self, index, recids_condition, params):
+        """Add to INDEX the values of the records matching the condition."""
+        from invenio.legacy.dbquery import run_sql
+        for tag in self.tags:
+            query = "SELECT bx.value, bibx.id_bibrec " \
+                    "FROM bib%(digits)sx AS bx, bibrec_bib%(digits)sx AS bibx " \
+                    "WHERE bx.id=bibx.id_bibxxx AND bx.tag LIKE %%s " \
+                    "AND bibx.id_bibrec %(condition)s" % {
+                        'digits': tag[0:2], 'condition': recids_condition}
+            for value, recid in run_sql(query, (tag, ) + tuple(params)):
+                index.setdefault(value, intbitset()).add(recid)
+
+    def create_cache(self):
+        """Create the cache, remembering when it started being built."""
+        self.rebuild_generation = get_data_generation(
+            ('bibrec_notimechange', ))
+        self.refresh_date = _get_database_time()
+        DataCacher.create_cache(self)
+
+    def recreate_cache_if_needed(self):
+        """Reload the records modified since the last refresh, if any.
+
+        The index being read by concurrent requests, a new one is built,
+        sharing the intbitsets of the unaffected values, and then swapped in.
+        """
+        from invenio.legacy.dbquery import run_sql
+        if get_data_generation(('bibrec_notimechange', )) != \
+                self.rebuild_generation:
+            self.create_cache()
+            return
+        if not self.outdated_p():
+            return
+        self.mark_up_to_date()
+        # modification dates are set by the database clock
+        refresh_date = _get_database_time()
+        modified = intbitset(run_sql(
+            "SELECT id FROM bibrec WHERE modification_date>=%s",
+            (self.refresh_date, )))
+        if modified:
+            index = {}
+            for value, recids in self.cache['recids'].iteritems():
+                if recids & modified:
+                    recids = recids - modified
+                if recids:
+                    index[value] = recids
+            reloaded = {}
+            modified = modified.tolist()
+            for i in xrange(0, len(modified), 1000):
+                recids = modified[i:i + 1000]
+                self._load_values(reloaded,
+                                  "IN (%s)" % ','.join(['%s'] * len(recids)),
+                                  recids)
+            for value, recids in reloaded.iteritems():
+                index[value] = index[value] | recids if value in index \
+                    else recids
+            self.cache = _make_facet_index(index)
+        self.refresh_date = refresh_date
+        self.timestamp = refresh_date
+
+
+def _get_database_time():
+    """Return the current time of the database server."""
+    from invenio.legacy.dbquery import run_sql
+    return str(run_sql("SELECT NOW()")[0][0])
+
+
+def _lower_facet_value(value):
+    """Return the lowercased VALUE, an UTF-8 string, to compare it."""
+    return value.decode('utf-8', 'replace').lower()
+
+
+def _make_facet_index(recids):
+    """Return the facet index of the RECIDS of every value."""
+    lowercase = {}
+    for value in recids:
+        lowercase.setdefault(_lower_facet_value(value), []).append(value)
+    return {'recids': recids,
+            'values': sorted(recids, key=lambda value: len(recids[value]),
+                             reverse=True),
+            'lowercase': lowercase}
+
+
+_facet_index_caches = {}
+
+
+def get_facet_index(field, recreate_cache_if_needed=True):
+    """Return the facet index of FIELD.
+
+    The facet index is a dictionary holding under 'recids' the dictionary of
+    every value of FIELD to the intbitset of records having it, and under
+    'values' the list of values by decreasing number of records, and under
+    'lowercase' the dictionary of every lowercased value to the values having
+    it.  The values are the ones of the MARC tags of the field, as stored in
+    bibxxx tables.
+    """
+    if field not in _facet_index_caches:
+        _facet_index_caches[field] = DataCacherProxy(
+            partial(FacetIndexDataCacher, field))
+    facet_index_cache = _facet_index_caches[field]
+    if recreate_cache_if_needed:
+        facet_index_cache.recreate_cache_if_needed()
+    return facet_index_cache.cache
+
+
+def get_facet_value_recids(field, value):
+    """Return the intbitset of records having VALUE in FIELD.
+
+    As in exact searches, the case of the values is ignored; the accents
+    are however not, unlike in the case insensitive collation of the
+    bibxxx tables.  Return None if no value of the facet index matches.
+    """
+    index = get_facet_index(field)
+    values = index['lowercase'].get(_lower_facet_value(value))
+    if not values:
+        return None
+    return reduce(lambda x, y: x | y,
+                  [index['recids'][v] for v in values], intbitset())
@@ -42,6 +42,16 @@ CFG_WEBSEARCH_IDXPAIRS_FIELDS = ['global','abstract','title','caption']
 # title search, but True for report number search.
 CFG_WEBSEARCH_IDXPAIRS_EXACT_SEARCH = False
 
+# CFG_WEBSEARCH_IDXPAIRS_EXACT_SEARCH_CHUNK_SIZE -- number of candidate
+# records whose phrase termlists are fetched with one query when the
+# false positives of a word pair search are eliminated.
+CFG_WEBSEARCH_IDXPAIRS_EXACT_SEARCH_CHUNK_SIZE = 1000
+
+# CFG_WEBSEARCH_FACET_INDEX_CHUNK_SIZE -- number of records whose field
+# values are loaded with one query when building or refreshing the value to
+# records maps used by facets.
+CFG_WEBSEARCH_FACET_INDEX_CHUNK_SIZE = 100000
+
 # Maximum number of collections to be displayed on the search results
 # page. All the rest of the collections will be hidden by a
 # "See more collections" link.
@@ -31,12 +31,12 @@ from invenio.modules.collections.cache import get_collection_reclist
 from invenio.modules.collections.models import Collection
 
 from .cache import (
+    get_facet_value_recids,
     get_search_results_cache_key_from_qid,
     search_results_cache,
 )
-from .models import Field
 from .utils import (
-    get_most_popular_field_values,
+    get_most_popular_facet_values,
     get_records_that_can_be_displayed,
 )
 
@@ -108,8 +108,8 @@ class FacetBuilder(object):
 
     """Facet builder helper class.
 
-    Implement a general facet builder using function
-    `get_most_popular_field_values`.
+    Implement a general facet builder using the precomputed facet index of
+    the field, see `get_most_popular_facet_values`.
     """
 
     def __init__(self, name):
@@ -143,15 +143,18 @@ class FacetBuilder(object):
 
     def get_facets_for_query(self, qid, limit=20, parent=None):
         """Return facet data."""
-        return get_most_popular_field_values(
-            self.get_recids(qid), Field.get_field_tags(self.name)
-        )[0:limit]
+        return get_most_popular_facet_values(
+            self.name, self.get_recids_intbitset(qid), limit=limit)
 
     def get_value_recids(self, value):
         """Return record ids in intbitset for given field value."""
         from .searchext.engines.native import search_unit
         if isinstance(value, unicode):
             value = value.encode('utf8')
+        recids = get_facet_value_recids(self.name, value)
+        if recids is not None:
+            return recids
+        # not a value of the facet index, e.g. typed by the user
         return search_unit(p=value, f=self.name, m='e')
 
     def get_facet_recids(self, values):
@@ -195,3 +198,14 @@ class CollectionFacetBuilder(FacetBuilder):
             if num_records:
                 facet.append((c.name, num_records, c.name_ln))
         return sorted(facet, key=lambda x: x[1], reverse=True)[0:limit]
+
+    def get_value_recids(self, value):
+        """Return record ids in intbitset for given collection.
+
+        The collections are not values of MARC tags, so they are searched
+        with the collection search unit instead of the facet index.
+        """
+        from .searchext.engines.native import search_unit
+        if isinstance(value, unicode):
+            value = value.encode('utf8')
+        return search_unit(p=value, f=self.name, m='e')
@@ -365,24 +365,37 @@ def search_unit_in_idxpairs(p, f, m, wl=0):
 
     # check if we need to eliminate the false positives
     if cfg['CFG_WEBSEARCH_IDXPAIRS_EXACT_SEARCH'] and do_exact_search:
-        # we need to eliminate the false positives
-        model = IdxINDEX.idxPHRASER(f)
-        not_exact_search = intbitset()
-        for recid in result_set:
-            res = model.query.filter(model.id_bibrec == recid).value(
-                model.termlist)
-            if res:
-                termlist = deserialize_via_marshal(res)
-                if not [term for term in termlist
-                        if term.lower().find(p.lower()) > -1]:
-                    not_exact_search.add(recid)
-            else:
-                not_exact_search.add(recid)
         # remove the recs that are false positives from the final result
-        result_set.difference_update(not_exact_search)
+        result_set.intersection_update(
+            get_exact_phrase_matches(result_set, p, f))
     return result_set or intbitset()
 
 
+def get_exact_phrase_matches(recids, p, f):
+    """Return the records among RECIDS having a phrase of F containing P.
+
+    The current phrase termlists of the records are read
+    CFG_WEBSEARCH_IDXPAIRS_EXACT_SEARCH_CHUNK_SIZE records at a time; the
+    records without termlist never match.
+    """
+    model = IdxINDEX.idxPHRASER(f)
+    p_lower = p.lower()
+    chunk_size = cfg['CFG_WEBSEARCH_IDXPAIRS_EXACT_SEARCH_CHUNK_SIZE']
+    candidates = intbitset(recids).tolist()
+    exact_search = intbitset()
+    for i in range(0, len(candidates), chunk_size):
+        res = model.query.filter(
+            model.id_bibrec.in_(candidates[i:i + chunk_size]),
+            model.type == 'CURRENT'
+        ).values(model.id_bibrec, model.termlist)
+        exact_search |= intbitset([
+            recid for recid, termlist in res
+            if termlist and any(
+                term.lower().find(p_lower) > -1
+                for term in deserialize_via_marshal(termlist))])
+    return exact_search
+
+
 def search_unit_in_idxphrases(p, f, m, wl=0):
     """Searche for phrase 'p' inside idxPHRASE*F table for field 'f'.
 
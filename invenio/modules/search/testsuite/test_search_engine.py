@@ -22,6 +22,8 @@
 __revision__ = \
     "$Id$"
 
+from intbitset import intbitset
+
 from invenio.base.wrappers import lazy_import
 from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
 
@@ -77,8 +79,42 @@ class TestSearchUnitFunction(InvenioTestCase):
             search_engine.search_unit('BOOK', '980'))
 
 
+class TestExactPhraseMatches(InvenioTestCase):
+    """Test the elimination of the false positives of pair searches."""
+
+    def test_only_current_termlists(self):
+        """search unit - exact phrase matching reads current termlists"""
+        from invenio.ext.sqlalchemy import db
+        from invenio.modules.indexer.models import IdxINDEX
+        from invenio.modules.search.searchext.engines.native import \
+            get_exact_phrase_matches
+        from invenio.utils.serializers import deserialize_via_marshal, \
+            serialize_via_marshal
+
+        model = IdxINDEX.idxPHRASER('title')
+        phrase = 'an unlikely phrase being indexed'
+        db.session.add(model(id_bibrec=1, type='FUTURE',
+                             termlist=serialize_via_marshal([phrase])))
+        db.session.commit()
+        try:
+            self.assertEqual(
+                intbitset(),
+                get_exact_phrase_matches(intbitset([1]), 'unlikely phrase',
+                                         'title'))
+        finally:
+            model.query.filter_by(id_bibrec=1, type='FUTURE').delete()
+            db.session.commit()
+
+        current = model.query.filter_by(id_bibrec=1, type='CURRENT').one()
+        term = deserialize_via_marshal(current.termlist)[0]
+        self.assertEqual(
+            intbitset([1]),
+            get_exact_phrase_matches(intbitset([1, 99999]), term, 'title'))
+
+
 TEST_SUITE = make_test_suite(TestWashQueryParameters,
-                             TestSearchUnitFunction)
+                             TestSearchUnitFunction,
+                             TestExactPhraseMatches)
 
 if __name__ == "__main__":
     run_test_suite(TEST_SUITE)
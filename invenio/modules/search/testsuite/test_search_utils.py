@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the search engine utilities."""
+
+from intbitset import intbitset
+from mock import patch
+
+from invenio.base.wrappers import lazy_import
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+search_utils = lazy_import('invenio.modules.search.utils')
+data_cacher = lazy_import('invenio.legacy.miscutil.data_cacher')
+
+
+class TestMostPopularFacetValues(InvenioTestCase):
+
+    """Test counting of facet values with the facet index."""
+
+    def setUp(self):
+        """Prepare a facet index."""
+        recids = {
+            'Ellis, J': intbitset([1, 2, 3, 4, 5]),
+            'Ellis, N': intbitset([1, 2, 6]),
+            'Aaron, A': intbitset([2, 6]),
+            'Zhang, Z': intbitset([7]),
+        }
+        from invenio.modules.search.cache import _make_facet_index
+        self.index = _make_facet_index(recids)
+
+    def test_counts(self):
+        """search utils - counting facet values among found records"""
+        with patch('invenio.modules.search.cache.get_facet_index',
+                   return_value=self.index):
+            self.assertEqual(
+                [('Aaron, A', 2), ('Ellis, J', 2), ('Ellis, N', 2)],
+                search_utils.get_most_popular_facet_values(
+                    'author', intbitset([2, 5, 6])))
+
+    def test_limit(self):
+        """search utils - counting only the most popular facet values"""
+        with patch('invenio.modules.search.cache.get_facet_index',
+                   return_value=self.index):
+            self.assertEqual(
+                [('Ellis, J', 3), ('Ellis, N', 2)],
+                search_utils.get_most_popular_facet_values(
+                    'author', [1, 2, 3, 7], limit=2))
+
+
+class TestFacetIndexRefresh(InvenioTestCase):
+
+    """Test the incremental refresh of the facet index."""
+
+    def test_refresh(self):
+        """search utils - refreshing the facet index swaps a new index in"""
+        from invenio.modules.search.cache import FacetIndexDataCacher
+
+        def run_sql(query, params=None):
+            if query == "SELECT NOW()":
+                return [('2015-01-01 00:00:00', )]
+            if query.startswith("SELECT id FROM bibrec"):
+                self.assertEqual(('1970-01-01 00:00:00', ), params)
+                return [(2, ), (3, )]
+            return [('Ellis, J', 3), ('Aaron, A', 2)]
+
+        cacher = FacetIndexDataCacher.__new__(FacetIndexDataCacher)
+        cacher.tags = ['100__a']
+        cacher.refresh_date = '1970-01-01 00:00:00'
+        cacher.rebuild_generation = data_cacher.get_data_generation(
+            ('bibrec_notimechange', ))
+        cacher.outdated_p = lambda: True
+        cacher.mark_up_to_date = lambda: None
+        ellis = intbitset([1, 2, 3])
+        zhang = intbitset([7])
+        old_cache = cacher.cache = {
+            'recids': {'Ellis, J': ellis, 'Ellis, N': intbitset([2]),
+                       'Zhang, Z': zhang},
+            'values': ['Ellis, J', 'Ellis, N', 'Zhang, Z'],
+        }
+        with patch('invenio.legacy.dbquery.run_sql', side_effect=run_sql):
+            cacher.recreate_cache_if_needed()
+
+        self.assertEqual(
+            {'Ellis, J': intbitset([1, 3]), 'Aaron, A': intbitset([2]),
+             'Zhang, Z': intbitset([7])},
+            cacher.cache['recids'])
+        self.assertEqual('Ellis, J', cacher.cache['values'][0])
+        # the index being read is left untouched
+        self.assertTrue(cacher.cache is not old_cache)
+        self.assertEqual(intbitset([1, 2, 3]), ellis)
+        self.assertEqual(intbitset([2]), old_cache['recids']['Ellis, N'])
+        self.assertEqual(['Ellis, J', 'Ellis, N', 'Zhang, Z'],
+                         old_cache['values'])
+        self.assertTrue(cacher.cache['recids']['Zhang, Z'] is zhang)
+        self.assertEqual(['Aaron, A'], cacher.cache['lowercase']['aaron, a'])
+        # the next refresh starts from the time of the database
+        self.assertEqual('2015-01-01 00:00:00', cacher.refresh_date)
+
+    def _new_request(self):
+        """Forget the generations read during the current request."""
+        from flask import g
+        if hasattr(g, 'data_cacher_generations'):
+            del g.data_cacher_generations
+
+    def test_notimechange(self):
+        """search utils - uploads without time change rebuild facet index"""
+        from invenio.modules.search.cache import FacetIndexDataCacher
+
+        self._new_request()
+        cacher = FacetIndexDataCacher.__new__(FacetIndexDataCacher)
+        cacher.rebuild_generation = data_cacher.get_data_generation(
+            ('bibrec_notimechange', ))
+        cacher.outdated_p = lambda: False
+        with patch.object(FacetIndexDataCacher, 'create_cache') as create:
+            cacher.recreate_cache_if_needed()
+            self.assertFalse(create.called)
+            data_cacher.publish_data_change('bibrec_notimechange')
+            self._new_request()
+            cacher.recreate_cache_if_needed()
+            self.assertTrue(create.called)
+
+
+class TestFacetValueRecids(InvenioTestCase):
+
+    """Test the search of the records having a facet value."""
+
+    def test_case_insensitive(self):
+        """search utils - facet values are matched ignoring their case"""
+        from invenio.modules.search.cache import (
+            _make_facet_index, get_facet_value_recids
+        )
+        index = _make_facet_index({
+            'Ellis, J': intbitset([1, 2]),
+            'ELLIS, J': intbitset([3]),
+            '\xc3\x89lie, J': intbitset([4]),
+        })
+        with patch('invenio.modules.search.cache.get_facet_index',
+                   return_value=index):
+            self.assertEqual(intbitset([1, 2, 3]),
+                             get_facet_value_recids('author', 'ellis, j'))
+            self.assertEqual(intbitset([4]),
+                             get_facet_value_recids('author',
+                                                    '\xc3\xa9lie, j'))
+            self.assertEqual(None,
+                             get_facet_value_recids('author', 'Elie, J'))
+
+
+TEST_SUITE = make_test_suite(TestMostPopularFacetValues,
+                             TestFacetIndexRefresh,
+                             TestFacetValueRecids)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
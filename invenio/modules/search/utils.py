@@ -115,6 +115,39 @@ def get_most_popular_field_values(recids, tags, exclude_values=None,
     return [(n[i], -1 * f[i]) for i in numpy.lexsort([ln, f])]
 
 
+def get_most_popular_facet_values(field, recids, limit=20):
+    """Return the LIMIT most popular values of FIELD among RECIDS.
+
+    Unlike :func:`get_most_popular_field_values`, the values are counted
+    once per record, using the precomputed facet index of the field: the
+    values are visited by decreasing number of records, so that the search
+    stops as soon as no other value can enter the top LIMIT.
+
+    :return: list of tuples containing value and its frequency
+    """
+    from .cache import get_facet_index
+
+    index = get_facet_index(field)
+    if not isinstance(recids, intbitset):
+        recids = intbitset(recids)
+    counts = []
+    threshold = 0
+    for value in index['values']:
+        value_recids = index['recids'][value]
+        if len(value_recids) < threshold:
+            break
+        freq = len(value_recids & recids)
+        if freq:
+            counts.append((-freq, value.lower(), value))
+            if len(counts) >= limit:
+                counts.sort()
+                del counts[limit:]
+                threshold = -counts[-1][0]
+    # sort by frequency (desc) and then by lowercased name.
+    counts.sort()
+    return [(value, -freq) for freq, dummy, value in counts[:limit]]
+
+
 def get_records_that_can_be_displayed(permitted_restricted_collections,
                                       hitset_in_any_collection,
                                       current_coll=None, colls=None):
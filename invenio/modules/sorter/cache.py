@@ -43,7 +43,8 @@ class BibSortDataCacher(DataCacher):
             return BsrMETHOD.timestamp_verifier(self.method_name).strftime(
                 "%Y-%m-%d %H:%M:%S")
 
-        DataCacher.__init__(self, cache_filler, timestamp_verifier)
+        DataCacher.__init__(self, cache_filler, timestamp_verifier,
+                            ('bsrMETHODDATA', ))
 
 
 SORTING_METHODS = LazyDict(BsrMETHOD.get_sorting_methods)
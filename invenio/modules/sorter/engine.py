@@ -20,6 +20,7 @@
 """Implementation of sorting engine."""
 
 from intbitset import intbitset
+from numpy import argsort, array, concatenate, int64, zeros
 
 from invenio.base.globals import cfg
 from invenio.legacy.bibrank.record_sorter import rank_records
@@ -30,6 +31,7 @@ from invenio.utils.text import strip_accents
 from invenio.modules.search.models import Field
 
 from .cache import SORTING_METHODS, CACHE_SORTED_DATA
+from .ranks import get_sort_ranks
 
 
 def get_tags_from_sort_fields(sort_fields):
@@ -146,6 +148,11 @@ def sort_records_bibsort(recIDs, sort_method, sort_field='', sort_order='d',
             return sort_records_bibxxx(recIDs, None, sort_field, sort_order,
                                        '', rg, jrec)
 
+    ranks = get_sort_ranks(sort_method)
+    if ranks is not None:
+        return sort_records_ranks(recIDs, ranks, sort_method, sort_order,
+                                  rg, jrec, sort_or_rank)
+
     # we should return sorted records up to irec_max(exclusive)
     dummy, irec_max = get_interval_for_records_to_sort(len(recIDs), jrec, rg)
     solution = intbitset()
@@ -211,6 +218,55 @@ def sort_records_bibsort(recIDs, sort_method, sort_field='', sort_order='d',
         return solution
 
 
+def sort_records_ranks(recIDs, ranks, sort_method, sort_order='d', rg=None,
+                       jrec=1, sort_or_rank='s'):
+    """Order the list based on the ranks published by BibSort.
+
+    Gives the same result as the buckets, with a vectorised sort of the
+    weights of the records.
+    """
+    # we should return sorted records up to irec_max(exclusive)
+    dummy, irec_max = get_interval_for_records_to_sort(len(recIDs), jrec, rg)
+    recids = array(intbitset(recIDs).tolist(), int64)
+    # recids are sorted, so the known ones come first
+    known = recids[recids < len(ranks.present)]
+    in_ranks = zeros(len(recids), bool)
+    in_ranks[:len(known)] = ranks.present[known]
+    sorted_recids = recids[in_ranks]
+    weights = ranks.weights[sorted_recids]
+
+    reverse = sort_order == 'd'
+    # a stable sort keeps the records with equal weights in recid order
+    order = argsort(-weights if reverse else weights, kind='mergesort')
+    sorted_recids = sorted_recids[order]
+    weights = weights[order]
+
+    if len(sorted_recids) < irec_max:
+        # some records have not been yet inserted in the bibsort structures
+        # or, some records have no value for the sort_method
+        missing_records = recids[~in_ranks]
+        missing_weights = zeros(len(missing_records), weights.dtype)
+        if sort_method.strip().lower() == \
+                cfg['CFG_BIBSORT_DEFAULT_FIELD'] and reverse:
+            # If we want to sort the records on their insertion date, add
+            # the missing records at the top.
+            sorted_recids = concatenate((missing_records[::-1],
+                                         sorted_recids))
+            weights = concatenate((missing_weights, weights))
+        else:
+            sorted_recids = concatenate((sorted_recids, missing_records))
+            weights = concatenate((weights, missing_weights))
+
+    # Only keep records, we are going to display
+    solution = slice_records(sorted_recids, jrec, rg).tolist()
+
+    if sort_or_rank == 'r':
+        # We need the recids, with their ranking score
+        return solution, slice_records(weights, jrec, rg).tolist()
+    else:
+        return solution
+
+
 def sort_records_bibxxx(recIDs, tags, sort_field='', sort_order='d',
                         sort_pattern='', rg=None, jrec=None):
     """Sort record list according sort field in given order.
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Memory-mapped ranks of the sorting methods.
+
+For every sorting method, BibSort publishes the ordered weights of the
+records as a dense array indexed by recid, together with an array
+telling which records have a weight.  The arrays are mapped read-only
+by the search processes, so that their pages are shared by all the
+processes of the host.
+"""
+
+import binascii
+import os
+import time
+
+from numpy import array, load, save, zeros, uint8
+
+from invenio.base.globals import cfg
+
+RANKS_ARRAYS = ('weights', 'present')
+
+
+class SortRanks(object):
+
+    """Read-only view of the ranks of one sorting method."""
+
+    def __init__(self, prefix, generation):
+        """Map the arrays of the given generation."""
+        self.generation = generation
+        for name in RANKS_ARRAYS:
+            setattr(self, name, load(
+                '%s.%s.%s.npy' % (prefix, generation, name), mmap_mode='r'))
+
+
+_sort_ranks = {}
+
+
+def get_ranks_prefix(method_name, directory=None):
+    """Return the common path prefix of the files of a sorting method."""
+    directory = directory or os.path.join(cfg['CFG_CACHEDIR'], 'bibsort')
+    return os.path.join(directory, binascii.hexlify(method_name))
+
+
+def get_sort_ranks(method_name, directory=None):
+    """Return the current ranks of the sorting method, or None if BibSort
+    has not published them."""
+    prefix = get_ranks_prefix(method_name, directory)
+    try:
+        with open(prefix + '.current') as current:
+            generation = current.read().strip()
+    except IOError:
+        return None
+    ranks = _sort_ranks.get(prefix)
+    if ranks is None or ranks.generation != generation:
+        try:
+            ranks = _sort_ranks[prefix] = SortRanks(prefix, generation)
+        except IOError:
+            # BibSort is switching to newer ranks
+            return None
+    return ranks
+
+
+def store_sort_ranks(method_name, data_dict_ordered, directory=None):
+    """Publish the {recid: weight} ranks of a sorting method."""
+    prefix = get_ranks_prefix(method_name, directory)
+    if not os.path.isdir(os.path.dirname(prefix)):
+        os.makedirs(os.path.dirname(prefix))
+    recids = array(list(data_dict_ordered.keys()), int)
+    values = array([data_dict_ordered[recid] for recid in recids])
+    size = int(recids.max()) + 1 if len(recids) else 0
+    arrays = {'weights': zeros(size, values.dtype),
+              'present': zeros(size, uint8)}
+    arrays['weights'][recids] = values
+    arrays['present'][recids] = 1
+
+    generation = '%d-%d' % (time.time(), os.getpid())
+    for name in RANKS_ARRAYS:
+        save('%s.%s.%s.npy' % (prefix, generation, name), arrays[name])
+    current = '%s.current.%s' % (prefix, generation)
+    with open(current, 'w') as current_file:
+        current_file.write(generation)
+    os.rename(current, prefix + '.current')
+    _remove_old_generations(prefix, generation)
+
+
+def delete_sort_ranks(method_name, directory=None):
+    """Withdraw the ranks of a sorting method."""
+    prefix = get_ranks_prefix(method_name, directory)
+    if os.path.exists(prefix + '.current'):
+        os.remove(prefix + '.current')
+        _remove_old_generations(prefix)
+
+
+def _remove_old_generations(prefix, generation=None):
+    """Remove the arrays of a sorting method other than GENERATION.
+
+    Processes still using older arrays keep their mappings until they
+    switch to the current ones.
+    """
+    directory, name = os.path.split(prefix)
+    for filename in os.listdir(directory):
+        parts = filename.split('.')
+        if parts[0] == name and parts[-1] == 'npy' and \
+                parts[1] != generation:
+            os.remove(os.path.join(directory, filename))
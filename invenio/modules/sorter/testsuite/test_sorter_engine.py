@@ -19,6 +19,8 @@
 
 """Testing module for BibSort Engine"""
 
+import shutil
+import tempfile
 
 from invenio.base.wrappers import lazy_import
 from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
@@ -27,6 +29,8 @@ binary_search = lazy_import('invenio.legacy.bibsort.engine:binary_search')
 perform_delete_record = lazy_import('invenio.legacy.bibsort.engine:perform_delete_record')
 perform_insert_record = lazy_import('invenio.legacy.bibsort.engine:perform_insert_record')
 perform_modify_record = lazy_import('invenio.legacy.bibsort.engine:perform_modify_record')
+sort_records_ranks = lazy_import('invenio.modules.sorter.engine:sort_records_ranks')
+sorter_ranks = lazy_import('invenio.modules.sorter.ranks')
 
 class TestBibSort(InvenioTestCase):
     """Test BibSort."""
@@ -161,7 +165,51 @@ class TestBibSort(InvenioTestCase):
         #testinsertion at the end
         self.assertEqual(0, binary_search(sorted_list, 'a', data_dict))
 
+
+class TestSortRanks(InvenioTestCase):
+    """Test sorting with the ranks published by BibSort."""
+
+    def setUp(self):
+        """Publish the ranks of a sorting method."""
+        self.directory = tempfile.mkdtemp()
+        sorter_ranks.store_sort_ranks(
+            'title', {2: 24, 3: 8, 5: 16, 7: 16}, self.directory)
+        self.ranks = sorter_ranks.get_sort_ranks('title', self.directory)
+
+    def tearDown(self):
+        """Remove the ranks."""
+        shutil.rmtree(self.directory)
+
+    def test_get_sort_ranks(self):
+        """bibsort - publishing and withdrawing ranks"""
+        self.assertEqual(None, sorter_ranks.get_sort_ranks('year',
+                                                           self.directory))
+        sorter_ranks.delete_sort_ranks('title', self.directory)
+        self.assertEqual(None, sorter_ranks.get_sort_ranks('title',
+                                                           self.directory))
+
+    def test_sort_ascending(self):
+        """bibsort - sorting with ranks, ascending order"""
+        self.assertEqual([3, 5, 7, 2, 1, 4, 9],
+                         sort_records_ranks([1, 2, 3, 4, 5, 7, 9], self.ranks,
+                                            'title', 'a'))
+
+    def test_sort_descending(self):
+        """bibsort - sorting with ranks, descending order"""
+        self.assertEqual([2, 5, 7, 3, 4],
+                         sort_records_ranks([2, 3, 4, 5, 7], self.ranks,
+                                            'title', 'd'))
+
+    def test_sort_range(self):
+        """bibsort - sorting with ranks, only records to display"""
+        self.assertEqual(([5, 7], [16, 16]),
+                         sort_records_ranks([1, 2, 3, 5, 7], self.ranks,
+                                            'title', 'a', rg=2, jrec=2,
+                                            sort_or_rank='r'))
+
+
 TEST_SUITE = make_test_suite(TestBibSort,
+                             TestSortRanks,
                              )
 
 if __name__ == "__main__":
@@ -21,12 +21,14 @@
 
 from __future__ import absolute_import
 
-import base64
 import sys
 import traceback
 
+from collections import deque
+from multiprocessing import Pool, cpu_count, current_process
 from uuid import uuid1 as new_uuid
 
+from invenio.base.globals import cfg
 from invenio.ext.sqlalchemy import db
 
 from six import iteritems, reraise
@@ -55,6 +57,8 @@ from .models import (
     BibWorkflowObject,
     ObjectVersion,
     Workflow,
+    dumps_data,
+    loads_data,
 )
 from .signals import (workflow_finished,
                       workflow_halted,
@@ -114,6 +118,9 @@ class BibWorkflowEngine(GenericWorkflowEngine):
         """
         super(BibWorkflowEngine, self).__init__()
 
+        # Positions of the objects processed in parallel after a halted or
+        # failed object, not to be processed again when restarting.
+        self._processed_ahead = set()
         self.db_obj = None
         if isinstance(workflow_object, Workflow):
             self.db_obj = workflow_object
@@ -142,16 +149,17 @@ class BibWorkflowEngine(GenericWorkflowEngine):
 
     def get_extra_data(self):
         """Main method to retrieve data saved to the object."""
-        return cPickle.loads(base64.b64decode(self.db_obj._extra_data))
+        return self.db_obj.get_column_value('_extra_data')
 
     def set_extra_data(self, value):
         """Main method to update data saved to the object."""
-        self.db_obj._extra_data = base64.b64encode(cPickle.dumps(value))
+        self.db_obj.set_column_value('_extra_data', value)
 
     def reset_extra_data(self):
         """Reset extra data to defaults."""
-        from .models import get_default_extra_data
-        self.db_obj._extra_data = get_default_extra_data()
+        from .models import get_default_extra_data, loads_data
+        self.db_obj.set_column_value('_extra_data',
+                                     loads_data(get_default_extra_data()))
 
     def extra_data_get(self, key):
         """Get a key value in extra data."""
@@ -295,6 +303,7 @@ BibWorkflowEngine
     def after_processing(objects, self):
         """Action after process to update status."""
         self._i = [-1, [0]]
+        self._processed_ahead = set()
         if self.has_completed():
             self.save(WorkflowStatus.COMPLETED)
             workflow_finished.send(self)
@@ -327,6 +336,8 @@ BibWorkflowEngine
 
         :param objects: objects to process.
         """
+        if objects is not self._objects:
+            self._processed_ahead = set()
         super(BibWorkflowEngine, self).process(objects)
 
     def restart(self, obj, task):
@@ -416,12 +427,20 @@ BibWorkflowEngine
         The number there points to the task that is currently executed;
         when error happens, it will be there unchanged. The pointer is
         updated after the task finished running.
+
+        Workflows declaring their objects as independent (``parallel``
+        attribute of the workflow definition) are run by
+        :meth:`parallel_processing_factory` instead.
         """
+        if self.get_parallel_workers(objects) > 1:
+            return self.parallel_processing_factory(objects, self)
         self.before_processing(objects, self)
         i = self._i
         # negative index not allowed, -1 is special
         while len(objects) - 1 > i[0] >= -1:
             i[0] += 1
+            if i[0] in self._processed_ahead:
+                continue
             obj = objects[i[0]]
             obj.reset_error_message()
             obj.save(version=ObjectVersion.RUNNING,
@@ -520,11 +539,143 @@ BibWorkflowEngine
             i[1] = [0]  # reset the callbacks pointer
         self.after_processing(objects, self)
 
+    def get_parallel_workers(self, objects):
+        """Return the number of processes to run the remaining objects with.
+
+        Objects are only run in parallel when the workflow definition sets
+        ``parallel = True``, when there are several objects left and when no
+        task can jump between objects. Daemonic processes, such as the
+        Celery workers, cannot start a pool and always run the objects
+        serially. The number of processes is given by the
+        ``parallel_workers`` attribute of the workflow definition,
+        ``CFG_BIBWORKFLOW_PARALLEL_WORKERS`` or the number of CPUs.
+        """
+        definition = getattr(self, "workflow_definition", None)
+        if not getattr(definition, "parallel", False) or \
+                current_process().daemon:
+            return 1
+        remaining = len([index for index in range(self._i[0] + 1,
+                                                  len(objects))
+                         if index not in self._processed_ahead])
+        if remaining < 2 or uses_jump_tokens(self.getCallbacks()):
+            return 1
+        workers = getattr(definition, "parallel_workers", None) or \
+            cfg.get('CFG_BIBWORKFLOW_PARALLEL_WORKERS') or cpu_count()
+        return min(workers, remaining)
+
+    @staticmethod
+    def parallel_processing_factory(objects, self):
+        """Processing factory running the objects in a pool of processes.
+
+        The tasks of each object are run in a worker process, which sends
+        back the resulting object data. The tasks may read, but not change,
+        the engine extra_data. The results are then applied, saved and
+        counted in the order of the objects, exactly as
+        :meth:`processing_factory` does.
+
+        When an object halts or fails, the objects already sent to the
+        workers are still run to their end. The completed ones are saved
+        and skipped when the workflow is restarted, so that their tasks are
+        not run twice. The halted or failed ones are run again.
+        """
+        global _parallel_processing
+        self.before_processing(objects, self)
+        i = self._i
+        workers = self.get_parallel_workers(objects)
+        extra_data = dumps_data(self.get_extra_data())
+        for obj in objects[i[0] + 1:]:
+            obj.flush_column_values()
+        # The worker processes must not share the database connections.
+        db.session.commit()
+        db.engine.dispose()
+        _parallel_processing = (self, objects, extra_data)
+        pool = Pool(workers)
+        pending = deque()
+        indexes = (index for index in range(i[0] + 1, len(objects))
+                   if index not in self._processed_ahead)
+        task_position = i[1]
+        interruption = None
+        try:
+            for index in indexes:
+                pending.append((index, pool.apply_async(
+                    _process_object_in_worker, (index, task_position))))
+                task_position = [0]
+                if len(pending) == 2 * workers:
+                    break
+            while pending:
+                index, result = pending.popleft()
+                outcome, details, task_position, columns = result.get()
+                self.setPosition(index, task_position)
+                obj = objects[index]
+                _apply_worker_columns(obj, columns)
+                if outcome == "skipped":
+                    msg = "Skipped running this object: %s" % (repr(obj),)
+                    self.log.debug(msg)
+                    obj.log.debug(msg)
+                elif outcome == "aborted":
+                    msg = "Processing was aborted: %s" % (repr(obj),)
+                    self.log.debug(msg)
+                    obj.log.debug(msg)
+                    break
+                elif outcome == "halted":
+                    self.increase_counter_halted()
+                    workflow_halted.send(obj)
+                    message, action, payload = details
+                    interruption = WorkflowHalt(message, action=action,
+                                                **payload)
+                    break
+                elif outcome == "error":
+                    self.increase_counter_error()
+                    message, payload = details
+                    interruption = WorkflowErrorClient(message=message,
+                                                       id_workflow=self.uuid,
+                                                       id_object=index,
+                                                       payload=payload)
+                    break
+                else:
+                    obj.save(version=ObjectVersion.COMPLETED)
+                    self.increase_counter_finished()
+                    i[1] = [0]  # reset the callbacks pointer
+                    if outcome == "stopped":
+                        msg = "Processing was stopped: %s" % (repr(obj),)
+                        self.log.debug(msg)
+                        obj.log.debug(msg)
+                        break
+                index = next(indexes, None)
+                if index is not None:
+                    pending.append((index, pool.apply_async(
+                        _process_object_in_worker, (index, [0]))))
+        finally:
+            # Let the workers finish the objects they were sent, terminating
+            # them could interrupt tasks with side effects.
+            pool.close()
+            pool.join()
+            _parallel_processing = None
+        for index, result in pending:
+            try:
+                outcome, dummy_details, dummy_position, columns = \
+                    result.get()
+            except Exception:
+                continue
+            if outcome in ("completed", "stopped", "skipped"):
+                obj = objects[index]
+                _apply_worker_columns(obj, columns)
+                if outcome != "skipped":
+                    obj.save(version=ObjectVersion.COMPLETED)
+                    self.increase_counter_finished()
+                self._processed_ahead.add(index)
+        if interruption is not None:
+            raise interruption
+        self.after_processing(objects, self)
+
     def execute_callback(self, callback, obj):
         """Execute the callback (workflow tasks)."""
-        obj.data = obj.get_data()
-        obj.extra_data = obj.get_extra_data()
-        self.extra_data = self.get_extra_data()
+        # The values are set back below, so the ones changed by the
+        # previous tasks are taken as they are, without a copy.
+        obj.data = obj.get_column_value('_data', copy=False)
+        obj.extra_data = obj.get_column_value('_extra_data', copy=False)
+        self.extra_data = self.db_obj.get_column_value('_extra_data',
+                                                       copy=False)
         self.log.debug("Executing callback %s" % (repr(callback),))
         try:
             callback(obj, self)
@@ -645,3 +796,115 @@ BibWorkflowEngine
     def skipToken(self):
         """Skip current workflow object without saving it."""
         raise SkipToken
+
+
+# Names used by the tasks jumping between objects.
+JUMP_TOKEN_NAMES = frozenset(["jumpTokenBack", "jumpTokenForward",
+                              "JumpTokenBack", "JumpTokenForward"])
+
+# Columns of the objects sent back by the worker processes, when changed.
+OBJECT_COLUMNS = ("_data", "_extra_data", "status", "data_type", "uri")
+
+# Engine, objects and serialized engine extra_data of the parallel
+# processing, inherited by the worker processes.
+_parallel_processing = None
+
+
+def uses_jump_tokens(callbacks, seen=None):
+    """Tell whether some of the (nested) callbacks may jump between objects.
+
+    The code of the callbacks, of their nested functions and of the
+    functions they close over is searched for the jump tokens names.
+    """
+    if seen is None:
+        seen = set()
+    if id(callbacks) in seen:
+        return False
+    seen.add(id(callbacks))
+    if isinstance(callbacks, (list, tuple)):
+        return any(uses_jump_tokens(callback, seen) for callback in callbacks)
+    function = getattr(callbacks, "func", callbacks)
+    code = getattr(function, "__code__", None) or \
+        getattr(getattr(function, "__call__", None), "__code__", None)
+    if code is not None and _code_uses_jump_tokens(code):
+        return True
+    for cell in getattr(function, "__closure__", None) or ():
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            continue
+        if callable(value) or isinstance(value, (list, tuple)):
+            if uses_jump_tokens(value, seen):
+                return True
+    return False
+
+
+def _code_uses_jump_tokens(code):
+    """Tell whether a code object, or a nested one, uses the jump tokens."""
+    if JUMP_TOKEN_NAMES.intersection(code.co_names):
+        return True
+    return any(_code_uses_jump_tokens(const) for const in code.co_consts
+               if hasattr(const, "co_names"))
+
+
+def _apply_worker_columns(obj, columns):
+    """Set the object columns sent back by a worker process."""
+    for column, value in iteritems(columns):
+        setattr(obj, column, value)
+    obj.reset_column_values()
+
+
+def _process_object_in_worker(index, task_position):
+    """Run the tasks on the object at INDEX, in a worker process.
+
+    Nothing but the running state of the object is saved here: the outcome
+    and the object columns are returned to
+    BibWorkflowEngine.parallel_processing_factory().
+
+    The objects run concurrently, so the tasks may not change the engine
+    extra_data: the object is failed when they do.
+    """
+    self, objects, extra_data = _parallel_processing
+    initial_extra_data = loads_data(extra_data)
+    self.set_extra_data(loads_data(extra_data))
+    self.setPosition(index, task_position)
+    obj = objects[index]
+    initial_columns = dict((column, getattr(obj, column))
+                           for column in OBJECT_COLUMNS)
+    obj.reset_error_message()
+    obj.save(version=ObjectVersion.RUNNING, id_workflow=self.db_obj.uuid)
+    outcome, details = "completed", None
+    callbacks = self.callback_chooser(obj, self)
+    if callbacks:
+        try:
+            self.run_callbacks(callbacks, objects, obj)
+        except SkipToken:
+            outcome = "skipped"
+        except AbortProcessing:
+            outcome = "aborted"
+        except StopProcessing:
+            outcome = "stopped"
+        except ContinueNextToken:
+            self.log.debug('Stop processing for this object, '
+                           'continue with next')
+        except (HaltProcessing, WorkflowHalt) as e:
+            outcome = "halted"
+            if isinstance(e, WorkflowHalt):
+                details = (e.message, e.action, e.payload)
+            else:
+                details = (str(e), None, {})
+        except (WorkflowErrorClient, WorkflowError, Exception) as e:
+            outcome = "error"
+            if isinstance(e, WorkflowErrorClient):
+                details = (e.message, e.payload)
+            else:
+                details = ("Error: %r\n%s" % (e, traceback.format_exc()), [])
+    if outcome != "error" and self.get_extra_data() != initial_extra_data:
+        outcome = "error"
+        details = ("Error: the tasks of workflows processing their objects "
+                   "in parallel can't change the engine extra_data", [])
+    obj.flush_column_values()
+    columns = dict((column, getattr(obj, column))
+                   for column in OBJECT_COLUMNS
+                   if getattr(obj, column) != initial_columns[column])
+    return outcome, details, self.getCurrTaskId(), columns
@@ -22,6 +22,7 @@ import base64
 import logging
 import os
 import tempfile
+import zlib
 
 from datetime import datetime
 
@@ -34,7 +35,7 @@ from invenio.ext.sqlalchemy.utils import session_manager
 from six import callable, iteritems
 from six.moves import cPickle
 
-from sqlalchemy import desc
+from sqlalchemy import desc, event
 from sqlalchemy.orm.exc import NoResultFound
 
 from .logger import BibWorkflowLogHandler, get_logger
@@ -67,14 +68,59 @@ class ObjectVersion(object):
             return None
 
 
+# Prefixes of the data columns values, telling how the pickle is stored.
+DATA_FORMAT_PICKLE = b"\x00"
+DATA_FORMAT_ZLIB = b"\x01"
+
+
+def encode_payload(payload, compression_threshold=None):
+    """Return the column value of a pickle.
+
+    The pickle is compressed when it is longer than the threshold, which
+    defaults to ``CFG_BIBWORKFLOW_DATA_COMPRESSION_THRESHOLD``. A threshold
+    of 0 disables the compression.
+    """
+    if compression_threshold is None:
+        compression_threshold = \
+            cfg['CFG_BIBWORKFLOW_DATA_COMPRESSION_THRESHOLD']
+    if compression_threshold and len(payload) > compression_threshold:
+        return DATA_FORMAT_ZLIB + zlib.compress(payload)
+    return DATA_FORMAT_PICKLE + payload
+
+
+def decode_payload(value):
+    """Return the pickle stored in a column value.
+
+    Values written before the binary format was introduced are base64
+    encoded pickles, which never start with one of the format prefixes.
+    """
+    prefix = value[:1]
+    if prefix == DATA_FORMAT_PICKLE:
+        return value[1:]
+    if prefix == DATA_FORMAT_ZLIB:
+        return zlib.decompress(value[1:])
+    return base64.b64decode(value)
+
+
+def dumps_data(data, compression_threshold=None):
+    """Serialize data for a data column."""
+    return encode_payload(cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL),
+                          compression_threshold)
+
+
+def loads_data(value):
+    """Deserialize the value of a data column."""
+    return cPickle.loads(decode_payload(value))
+
+
 def get_default_data():
-    """Return the base64 representation of the data default value."""
+    """Return the serialized representation of the data default value."""
     data_default = {}
-    return base64.b64encode(cPickle.dumps(data_default))
+    return dumps_data(data_default, compression_threshold=0)
 
 
 def get_default_extra_data():
-    """Return the base64 representation of the extra_data default value."""
+    """Return the serialized representation of the extra_data default value."""
     extra_data_default = {"_tasks_results": {},
                           "owner": {},
                           "_task_counter": {},
@@ -85,10 +131,113 @@ def get_default_extra_data():
                           "redis_search": {},
                           "source": "",
                           "_task_history": []}
-    return base64.b64encode(cPickle.dumps(extra_data_default))
+    return dumps_data(extra_data_default, compression_threshold=0)
+
+
+class _ColumnValue(object):
+
+    """Stored pickle of a data column, and the value set since the save."""
+
+    _not_loaded = object()
 
+    def __init__(self, raw, payload=None):
+        """Keep the pickle PAYLOAD stored in the column value RAW."""
+        self.raw = raw
+        if payload is None and raw is not None:
+            payload = decode_payload(raw)
+        self.payload = payload
+        self._stored = self._not_loaded
+        self.value = None
+        self.pending = False
 
-class Workflow(db.Model):
+    def load(self):
+        """Return a new deserialized copy of the stored value."""
+        return cPickle.loads(self.payload)
+
+    @property
+    def stored(self):
+        """Return the stored value, deserialized once, not to be changed."""
+        if self._stored is self._not_loaded:
+            self._stored = self.load()
+        return self._stored
+
+
+class DataColumnsMixin(object):
+
+    """Lazy serialization of the pickled data columns of a model.
+
+    Every read returns a new deserialized copy of the value, which the
+    caller may change freely: the changes are kept only once the value is
+    set again.  A value set with :meth:`set_column_value` is compared to
+    the stored one and, if it differs, serialized when the object is saved.
+    The column is written only if the pickle changed.
+
+    The values are compared with ``==``, so that setting back an unchanged
+    value does not serialize it.  Values equal but of different types, such
+    as ``1`` and ``True`` or ``'a'`` and ``u'a'``, are thus not written.
+    """
+
+    _column_values = None
+
+    def _get_column(self, column):
+        """Return the stored pickle and pending value of a data column."""
+        if self._column_values is None:
+            self._column_values = {}
+        cached = self._column_values.get(column)
+        if cached is not None and cached.pending:
+            return cached
+        raw = getattr(self, column)
+        if cached is None or cached.raw != raw:
+            cached = _ColumnValue(raw)
+            self._column_values[column] = cached
+        return cached
+
+    def get_column_value(self, column, copy=True):
+        """Return the deserialized value of a data column.
+
+        :param copy: when False, a value set since the last save is
+            returned itself rather than a copy, for the callers setting it
+            back once they changed it.
+        """
+        cached = self._get_column(column)
+        if cached.pending:
+            if not copy:
+                return cached.value
+            self.flush_column_values()
+            cached = self._get_column(column)
+        return cached.load()
+
+    def set_column_value(self, column, value):
+        """Set the value of a data column, serialized on save if changed."""
+        cached = self._get_column(column)
+        cached.pending = cached.raw is None or value != cached.stored
+        cached.value = value if cached.pending else None
+
+    def flush_column_values(self):
+        """Serialize the values set since the last save."""
+        for column, cached in iteritems(self._column_values or {}):
+            if not cached.pending:
+                continue
+            payload = cPickle.dumps(cached.value, cPickle.HIGHEST_PROTOCOL)
+            if payload != cached.payload:
+                raw = encode_payload(payload)
+                setattr(self, column, raw)
+                self._column_values[column] = _ColumnValue(raw, payload)
+            else:
+                cached.value = None
+                cached.pending = False
+
+    def reset_column_values(self):
+        """Forget the deserialized values, including the unsaved ones."""
+        self._column_values = None
+
+    @staticmethod
+    def flush_column_values_listener(mapper, connection, target):
+        """Serialize the values set on objects flushed without save()."""
+        target.flush_column_values()
+
+
+class Workflow(db.Model, DataColumnsMixin):
 
     """Represents a workflow instance.
 
@@ -149,7 +298,8 @@ class Workflow(db.Model):
                              str(self.current_object),
                              str(self.counter_initial),
                              str(self.counter_halted), str(self.counter_error),
-                             str(self.counter_finished), str(self._extra_data))
+                             str(self.counter_finished),
+                             str(self.get_column_value('_extra_data')))
 
     @classmethod
     def get(cls, *criteria, **filters):
@@ -206,10 +356,9 @@ class Workflow(db.Model):
         :param key: the key to access the desirable value
         :param getter: a callable that takes a dict as param and returns a value
         """
-        extra_data = Workflow.get(Workflow.id_user == self.id_user,
-                                  Workflow.uuid == self.uuid).one()._extra_data
-
-        extra_data = cPickle.loads(base64.b64decode(extra_data))
+        extra_data = Workflow.get(
+            Workflow.id_user == self.id_user, Workflow.uuid == self.uuid
+        ).one().get_column_value('_extra_data')
         if key:
             return extra_data[key]
         elif callable(getter):
@@ -231,15 +380,16 @@ class Workflow(db.Model):
         """
         extra_data = Workflow.get(Workflow.id_user == user_id,
                                   Workflow.uuid == uuid).one()._extra_data
-        extra_data = cPickle.loads(base64.b64decode(extra_data))
+        extra_data = loads_data(extra_data)
         if key is not None and value is not None:
             extra_data[key] = value
         elif callable(setter):
             setter(extra_data)
 
         Workflow.get(Workflow.uuid == self.uuid).update(
-            {'_extra_data': base64.b64encode(cPickle.dumps(extra_data))}
+            {'_extra_data': dumps_data(extra_data)}
         )
+        self.reset_column_values()
 
     @classmethod
     @session_manager
@@ -250,13 +400,14 @@ class Workflow(db.Model):
     @session_manager
     def save(self, status):
         """Save object to persistent storage."""
+        self.flush_column_values()
         self.modified = datetime.now()
         if status is not None:
             self.status = status
         db.session.add(self)
 
 
-class BibWorkflowObject(db.Model):
+class BibWorkflowObject(db.Model, DataColumnsMixin):
 
     """Data model for wrapping data being run in the workflows.
 
@@ -352,16 +503,16 @@ class BibWorkflowObject(db.Model):
         return self._log
 
     def get_data(self):
-        """Get data saved in the object."""
-        return cPickle.loads(base64.b64decode(self._data))
+        """Get a copy of the data saved in the object."""
+        return self.get_column_value('_data')
 
     def set_data(self, value):
         """Save data to the object."""
-        self._data = base64.b64encode(cPickle.dumps(value))
+        self.set_column_value('_data', value)
 
     def get_extra_data(self):
-        """Get extra data saved to the object."""
-        return cPickle.loads(base64.b64decode(self._extra_data))
+        """Get a copy of the extra data saved to the object."""
+        return self.get_column_value('_extra_data')
 
     def set_extra_data(self, value):
         """Save extra data to the object.
@@ -369,7 +520,7 @@ class BibWorkflowObject(db.Model):
         :param value: what you want to replace extra_data with.
         :type value: dict
         """
-        self._extra_data = base64.b64encode(cPickle.dumps(value))
+        self.set_column_value('_extra_data', value)
 
     def get_workflow_name(self):
         """Return the workflow name for this object."""
@@ -423,6 +574,8 @@ class BibWorkflowObject(db.Model):
     def __eq__(self, other):
         """Enable equal operators on BibWorkflowObjects."""
         if isinstance(other, BibWorkflowObject):
+            self.flush_column_values()
+            other.flush_column_values()
             if self._data == other._data and \
                     self._extra_data == other._extra_data and \
                     self.id_workflow == other.id_workflow and \
@@ -734,8 +887,11 @@ class BibWorkflowObject(db.Model):
         return res.all()
 
     def __getstate__(self):
-        """Return internal dict."""
-        return self.__dict__
+        """Return internal dict, without the deserialized data."""
+        self.flush_column_values()
+        state = dict(self.__dict__)
+        state.pop('_column_values', None)
+        return state
 
     def __setstate__(self, state):
         """Update interal dict with given state."""
@@ -743,6 +899,8 @@ class BibWorkflowObject(db.Model):
 
     def copy(self, other):
         """Copy data and metadata except id and id_workflow."""
+        other.flush_column_values()
+        self.reset_column_values()
         self._data = other._data
         self._extra_data = other._extra_data
         self.version = other.version
@@ -771,6 +929,7 @@ class BibWorkflowObject(db.Model):
             self.version = version
         if id_workflow is not None:
             self.id_workflow = id_workflow
+        self.flush_column_values()
         db.session.add(self)
         if self.id is not None:
             self.log.debug("Saving object: %s" % (self.id or "new",))
@@ -957,5 +1116,22 @@ class BibWorkflowEngineLog(db.Model):
         db.session.commit()
 
 
+# Connect Alchemy event listeners to serialize the data on INSERT and UPDATE
+event.listen(
+    Workflow, 'before_insert', Workflow.flush_column_values_listener
+)
+event.listen(
+    Workflow, 'before_update', Workflow.flush_column_values_listener
+)
+event.listen(
+    BibWorkflowObject, 'before_insert',
+    BibWorkflowObject.flush_column_values_listener
+)
+event.listen(
+    BibWorkflowObject, 'before_update',
+    BibWorkflowObject.flush_column_values_listener
+)
+
+
 __all__ = ('Workflow', 'BibWorkflowObject',
            'BibWorkflowObjectLog', 'BibWorkflowEngineLog')
@@ -20,6 +20,10 @@
 
 from six import callable
 from functools import wraps
+from itertools import islice
+
+# The iterators of the running foreach_iterator loops, by engine and step
+_live_iterators = {}
 
 
 def foreach(get_list_function=None, savename=None, cache_data=False, order="ASC"):
@@ -99,6 +103,64 @@ def foreach(get_list_function=None, savename=None, cache_data=False, order="ASC"
     return _foreach
 
 
+def foreach_iterator(get_iterator_function, savename=None):
+    """For each over an iterator, without materialising it.
+
+    Only the position in the iterator is stored in the engine, so that
+    big sequences (e.g. the records of a harvested file) are produced
+    one item at a time and never end up in the engine extra_data.  The
+    iterator is kept in memory between two iterations.  If it is lost,
+    e.g. when the workflow is continued by another process, it is
+    created again from the object data at the start of the loop and
+    fast-forwarded to the stored position.
+
+    :param get_iterator_function: function returning the iterable on
+    which we should iterate.
+    :param savename: name of variable to save the current loop state in the
+    extra_data in case you want to reuse the value somewhere in a task.
+    """
+    @wraps(foreach_iterator)
+    def _foreach_iterator(obj, eng):
+        step = str(eng.getCurrTaskId())
+        if "_Iterators" not in eng.extra_data:
+            eng.extra_data["_Iterators"] = {}
+        key = (eng.uuid, step)
+
+        if step not in eng.extra_data["_Iterators"]:
+            eng.extra_data["_Iterators"][step] = {"value": 0,
+                                                  "previous_data": obj.data}
+            _live_iterators.pop(key, None)
+        state = eng.extra_data["_Iterators"][step]
+
+        if key not in _live_iterators:
+            current_data = obj.data
+            obj.data = state["previous_data"]
+            try:
+                iterator = iter(get_iterator_function(obj, eng))
+            finally:
+                obj.data = current_data
+            _live_iterators[key] = islice(iterator, state["value"], None)
+
+        try:
+            obj.data = next(_live_iterators[key])
+        except StopIteration:
+            obj.data = state["previous_data"]
+            del eng.extra_data["_Iterators"][step]
+            del _live_iterators[key]
+            coordonatex = len(eng.getCurrTaskId()) - 1
+            coordonatey = eng.getCurrTaskId()[coordonatex]
+            new_vector = eng.getCurrTaskId()
+            new_vector[coordonatex] = coordonatey + 2
+            eng.setPosition(eng.getCurrObjId(), new_vector)
+        else:
+            if savename is not None:
+                obj.extra_data[savename] = obj.data
+            state["value"] += 1
+
+    _foreach_iterator.hide = True
+    return _foreach_iterator
+
+
 def simple_for(inita, enda, incrementa, variable_name=None):
     """Simple for going from inita to enda by step of incrementa.
 
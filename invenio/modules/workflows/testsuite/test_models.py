@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the serialization of the workflows data."""
+
+from __future__ import absolute_import
+
+import base64
+
+from mock import patch
+from six.moves import cPickle
+
+from invenio.testsuite import InvenioTestCase, make_test_suite, run_test_suite
+
+
+class DataSerializationTest(InvenioTestCase):
+
+    """Test the storage format of the data columns."""
+
+    def test_round_trip(self):
+        """workflows - data is stored as a plain or compressed pickle"""
+        from invenio.modules.workflows.models import dumps_data, loads_data, \
+            DATA_FORMAT_PICKLE, DATA_FORMAT_ZLIB
+        data = {"record": "<record>%s</record>" % ("x" * 10000, )}
+        value = dumps_data(data, compression_threshold=0)
+        self.assertEqual(value[:1], DATA_FORMAT_PICKLE)
+        self.assertEqual(loads_data(value), data)
+        compressed = dumps_data(data, compression_threshold=1024)
+        self.assertEqual(compressed[:1], DATA_FORMAT_ZLIB)
+        self.assertTrue(len(compressed) < len(value))
+        self.assertEqual(loads_data(compressed), data)
+
+    def test_legacy_format(self):
+        """workflows - base64 encoded data is still read"""
+        from invenio.modules.workflows.models import loads_data
+        data = {"_tasks_results": {}, "_task_history": []}
+        self.assertEqual(loads_data(base64.b64encode(cPickle.dumps(data))),
+                         data)
+
+
+class DataColumnsTest(InvenioTestCase):
+
+    """Test the lazy access to the data columns."""
+
+    def _holder(self, data):
+        from invenio.modules.workflows.models import DataColumnsMixin, \
+            dumps_data
+
+        class Holder(DataColumnsMixin):
+            _data = dumps_data(data, compression_threshold=0)
+
+        return Holder()
+
+    def test_copies(self):
+        """workflows - data is read as copies, changed only when set"""
+        holder = self._holder({"a": {"b": 1}})
+        data = holder.get_column_value("_data")
+        self.assertEqual(data, {"a": {"b": 1}})
+        data["a"]["b"] = 2
+        self.assertEqual(holder.get_column_value("_data"), {"a": {"b": 1}})
+        self.assertFalse(holder.get_column_value("_data") is
+                         holder.get_column_value("_data"))
+
+        holder.set_column_value("_data", data)
+        self.assertEqual(holder.get_column_value("_data"), {"a": {"b": 2}})
+        self.assertFalse(holder.get_column_value("_data") is data)
+        # the callers setting the value back may take it without a copy
+        data = holder.get_column_value("_data")
+        data["c"] = 3
+        holder.set_column_value("_data", data)
+        self.assertTrue(holder.get_column_value("_data", copy=False) is data)
+
+    def test_written_on_change(self):
+        """workflows - data is serialized on flush, only when changed"""
+        from invenio.modules.workflows.models import loads_data
+        holder = self._holder({"a": 1})
+        raw = holder._data
+        with patch("invenio.modules.workflows.models.cPickle.dumps",
+                   wraps=cPickle.dumps) as dumps:
+            holder.set_column_value("_data", {"a": 1})
+            holder.flush_column_values()
+            self.assertTrue(holder._data is raw)
+            # unchanged values are not even serialized
+            self.assertEqual(dumps.call_count, 0)
+
+            data = holder.get_column_value("_data")
+            data["b"] = 2
+            holder.set_column_value("_data", data)
+            self.assertTrue(holder._data is raw)
+            holder.flush_column_values()
+            self.assertEqual(dumps.call_count, 1)
+        self.assertEqual(loads_data(holder._data), {"a": 1, "b": 2})
+
+    def test_column_changed(self):
+        """workflows - data changed in the column is deserialized again"""
+        from invenio.modules.workflows.models import dumps_data
+        holder = self._holder({"a": 1})
+        holder.get_column_value("_data")
+        holder._data = dumps_data({"a": 2}, compression_threshold=0)
+        self.assertEqual(holder.get_column_value("_data"), {"a": 2})
+
+
+TEST_SUITE = make_test_suite(DataSerializationTest, DataColumnsTest)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -352,6 +352,100 @@ distances from it.
             self.assertTrue(obj.get_data() in final_data)
             self.assertTrue(obj.child_objects[0].get_data() in self.test_data)
 
+    def test_workflow_parallel_run(self):
+        """Test running workflow with objects processed in parallel."""
+        from invenio.modules.workflows.models import (BibWorkflowObject,
+                                                      ObjectVersion)
+        from invenio.modules.workflows.api import start
+        from invenio.modules.workflows.engine import WorkflowStatus
+
+        self.test_data = [10, 11, 12, 13, 14]
+
+        workflow = start(workflow_name="test_workflow_parallel",
+                         data=self.test_data,
+                         module_name="unit_tests")
+
+        objects = BibWorkflowObject.query.filter(
+            BibWorkflowObject.id_workflow == workflow.uuid,
+            BibWorkflowObject.id_parent == None  # noqa E711
+        ).order_by(BibWorkflowObject.id).all()
+
+        self.assertEqual(WorkflowStatus.COMPLETED, workflow.status)
+        self.assertEqual(5, workflow.db_obj.counter_finished)
+        self.assertEqual([28, 29, 30, 31, 32],
+                         [obj.get_data() for obj in objects])
+        for obj in objects:
+            self.assertEqual(ObjectVersion.COMPLETED, obj.version)
+
+    def test_workflow_parallel_halt(self):
+        """Test halting an object processed in parallel."""
+        from invenio.modules.workflows.models import (BibWorkflowObject,
+                                                      ObjectVersion)
+        from invenio.modules.workflows.api import start
+        from invenio.modules.workflows.engine import WorkflowStatus
+
+        self.test_data = [10, 1, 12, 13]
+
+        workflow = start(workflow_name="test_workflow_parallel",
+                         data=self.test_data,
+                         module_name="unit_tests")
+
+        objects = BibWorkflowObject.query.filter(
+            BibWorkflowObject.id_workflow == workflow.uuid,
+            BibWorkflowObject.id_parent == None  # noqa E711
+        ).order_by(BibWorkflowObject.id).all()
+
+        # The objects following the halted one are processed on restart
+        self.assertEqual(WorkflowStatus.HALTED, workflow.status)
+        self.assertEqual([28, 1, 30, 31],
+                         [obj.get_data() for obj in objects])
+        self.assertEqual([ObjectVersion.COMPLETED, ObjectVersion.WAITING,
+                          ObjectVersion.COMPLETED, ObjectVersion.COMPLETED],
+                         [obj.version for obj in objects])
+
+    def test_workflow_parallel_halt_no_rerun(self):
+        """Test not running again the objects run after a halted one."""
+        import os
+        from invenio.modules.workflows.models import (BibWorkflowObject,
+                                                      ObjectVersion)
+        from invenio.modules.workflows.api import start
+        from invenio.modules.workflows.testsuite.workflows.\
+            test_workflow_parallel_runs import get_runs_path
+
+        if os.path.exists(get_runs_path()):
+            os.remove(get_runs_path())
+        self.test_data = [10, 1, 12, 13, 14, 15]
+
+        workflow = start(workflow_name="test_workflow_parallel_runs",
+                         data=self.test_data,
+                         module_name="unit_tests")
+
+        objects = BibWorkflowObject.query.filter(
+            BibWorkflowObject.id_workflow == workflow.uuid,
+            BibWorkflowObject.id_parent == None  # noqa E711
+        ).order_by(BibWorkflowObject.id).all()
+
+        with open(get_runs_path()) as runs:
+            self.assertEqual(['10', '12', '13', '14', '15'],
+                             sorted(runs.read().split()))
+        os.remove(get_runs_path())
+        self.assertEqual([30, 1, 32, 33, 34, 35],
+                         [obj.get_data() for obj in objects])
+        self.assertEqual([ObjectVersion.COMPLETED, ObjectVersion.WAITING,
+                          ObjectVersion.COMPLETED, ObjectVersion.COMPLETED,
+                          ObjectVersion.COMPLETED, ObjectVersion.COMPLETED],
+                         [obj.version for obj in objects])
+
+    def test_workflow_parallel_extra_data(self):
+        """Test rejecting engine extra_data changes of parallel objects."""
+        from invenio.modules.workflows.api import start
+        from invenio.modules.workflows.errors import WorkflowError
+
+        self.assertRaises(WorkflowError, start,
+                          workflow_name="test_workflow_parallel_extra_data",
+                          data=[10, 11, 12],
+                          module_name="unit_tests")
+
     def test_workflow_marcxml(self):
         """Test runnning a record ingestion workflow with a action step."""
         from invenio.modules.workflows.models import (BibWorkflowObject,
@@ -720,6 +814,23 @@ class TestWorkflowTasks(WorkflowTasksTestCase):
         start_by_wid(workflow.uuid)
         test_object.delete(test_object.id)
 
+    def test_jump_tokens_detection(self):
+        """Test the detection of the tasks jumping between objects."""
+        from invenio.modules.workflows.engine import uses_jump_tokens
+        from invenio.modules.workflows.tasks.logic_tasks import workflow_if
+        from invenio.modules.workflows.tasks.sample_tasks import add_data
+
+        def jump_if(value):
+            def _jump_if(obj, eng):
+                if obj.data == value:
+                    eng.jumpTokenForward(1)
+            return _jump_if
+
+        self.assertFalse(uses_jump_tokens([add_data(1), [add_data(2)]]))
+        self.assertTrue(uses_jump_tokens([add_data(1), [jump_if(2)]]))
+        self.assertTrue(uses_jump_tokens([workflow_if(jump_if(2)),
+                                          [add_data(1)]]))
+
     def test_workflow_task_results(self):
         """Test the setting and getting of task results."""
         from invenio.modules.workflows.models import BibWorkflowObject
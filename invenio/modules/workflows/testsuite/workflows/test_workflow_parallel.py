@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+""" Implements a workflow running its objects in parallel, for testing."""
+
+from ...tasks.sample_tasks import (add_data, halt_if_data_less_than,
+                                   reduce_data_by_one)
+
+
+class test_workflow_parallel(object):
+
+    """A test workflow for the testsuite, with independent objects."""
+
+    parallel = True
+    parallel_workers = 2
+
+    workflow = [halt_if_data_less_than(5),
+                add_data(20),
+                reduce_data_by_one(2)]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+""" Implements a parallel workflow recording the runs of its tasks."""
+
+import os
+
+from invenio.base.globals import cfg
+
+from ...tasks.sample_tasks import add_data, halt_if_data_less_than
+
+
+def get_runs_path():
+    """Return the file where the runs of the tasks are recorded."""
+    return os.path.join(cfg['CFG_TMPDIR'], 'test_workflow_parallel_runs')
+
+
+def record_run(obj, eng):
+    """Record in a file that the task ran on the object."""
+    with open(get_runs_path(), 'a') as runs:
+        runs.write('%s\n' % (obj.data,))
+
+
+class test_workflow_parallel_runs(object):
+
+    """A test workflow for the testsuite, with a side effect."""
+
+    parallel = True
+    parallel_workers = 2
+
+    workflow = [halt_if_data_less_than(5),
+                record_run,
+                add_data(20)]
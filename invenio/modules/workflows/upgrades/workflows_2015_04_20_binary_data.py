@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Upgrade script converting the workflows data to the binary format."""
+
+from invenio.legacy.dbquery import run_sql, run_sql_many
+
+depends_on = ["workflows_2014_08_12_task_results_to_dict"]
+
+# Number of rows converted at once.
+BATCH_SIZE = 500
+
+
+def info():
+    """Display info."""
+    return "Will store the workflows data as binary, compressed pickles"
+
+
+def do_upgrade():
+    """Convert the base64 encoded pickles of the workflows tables."""
+    convert_table("bwlWORKFLOW", "uuid", ["_extra_data"])
+    convert_table("bwlOBJECT", "id", ["_data", "_extra_data"])
+
+
+def estimate():
+    """Estimate running time of upgrade in seconds (optional)."""
+    count = run_sql("SELECT COUNT(*) FROM bwlOBJECT")[0][0]
+    return 1 + count // 5000
+
+
+def convert_table(table, key, columns):
+    """Convert the given data columns of a table, BATCH_SIZE rows at once.
+
+    The pickles themselves are kept as they are, so that no class has to be
+    importable for the conversion.
+    """
+    from invenio.modules.workflows.models import decode_payload, \
+        encode_payload, DATA_FORMAT_PICKLE, DATA_FORMAT_ZLIB
+
+    query = "SELECT %s, %s FROM %s WHERE %s>%%s ORDER BY %s LIMIT %%s" % \
+        (key, ", ".join(columns), table, key, key)
+    update = "UPDATE %s SET %s WHERE %s=%%s" % \
+        (table, ", ".join("%s=%%s" % column for column in columns), key)
+    last_key = ""
+    while True:
+        rows = run_sql(query, (last_key, BATCH_SIZE))
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            values = row[1:]
+            if all(value[:1] in (DATA_FORMAT_PICKLE, DATA_FORMAT_ZLIB)
+                   for value in values):
+                continue
+            params.append(
+                tuple(encode_payload(decode_payload(value))
+                      for value in values) + (row[0], )
+            )
+        if params:
+            run_sql_many(update, params)
+        last_key = rows[-1][0]
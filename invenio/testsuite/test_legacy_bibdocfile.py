@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the bibdocfile library."""
+
+import os
+import shutil
+import stat
+from tempfile import mkdtemp
+
+from mock import patch
+
+from invenio.base.wrappers import lazy_import
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+bibdocfile = lazy_import('invenio.legacy.bibdocfile.api')
+
+
+class Md5FolderVerificationTest(InvenioTestCase):
+
+    """Test the verification of the checksums of document folders."""
+
+    def setUp(self):
+        """Create a folder with two files and their checksums."""
+        self.tmpdir = mkdtemp()
+        self.folder = self._create_folder('1', {'a.txt': 'aaa',
+                                                'b.txt': 'bbb'})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _create_folder(self, name, files):
+        """Create a folder holding `files` and its .md5 file."""
+        folder = os.path.join(self.tmpdir, name)
+        os.mkdir(folder)
+        for filename, content in files.items():
+            self._write(os.path.join(folder, filename), content)
+        bibdocfile.Md5Folder(folder)
+        return folder
+
+    def _write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_correct_folder(self):
+        """bibdocfile - md5 verification of a correct folder"""
+        self.assertEqual(bibdocfile.verify_md5_folder(self.folder), [])
+
+    def test_mismatch(self):
+        """bibdocfile - md5 verification reports modified files"""
+        expected = bibdocfile.Md5Folder(self.folder).md5s['a.txt']
+        self._write(os.path.join(self.folder, 'a.txt'), 'modified')
+        self.assertEqual(
+            bibdocfile.verify_md5_folder(self.folder),
+            [('a.txt', expected, bibdocfile.calculate_md5(
+                os.path.join(self.folder, 'a.txt')))])
+        self.assertFalse(bibdocfile.Md5Folder(self.folder).check('a.txt'))
+
+    def test_missing_file(self):
+        """bibdocfile - md5 verification reports missing files"""
+        expected = bibdocfile.Md5Folder(self.folder).md5s['b.txt']
+        os.remove(os.path.join(self.folder, 'b.txt'))
+        self.assertEqual(bibdocfile.verify_md5_folder(self.folder),
+                         [('b.txt', expected, None)])
+
+    def test_new_file(self):
+        """bibdocfile - md5 verification records the checksum of new files"""
+        self._write(os.path.join(self.folder, 'c.txt'), 'ccc')
+        self.assertEqual(bibdocfile.verify_md5_folder(self.folder), [])
+        self.assertEqual(bibdocfile.Md5Folder(self.folder).md5s['c.txt'],
+                         bibdocfile.calculate_md5(
+                             os.path.join(self.folder, 'c.txt')))
+
+    def test_incremental(self):
+        """bibdocfile - incremental md5 verification skips unchanged files"""
+        bibdocfile.verify_md5_folder(self.folder)
+        with patch('invenio.legacy.bibdocfile.api.calculate_md5',
+                   wraps=bibdocfile.calculate_md5) as calculate_md5:
+            self.assertEqual(
+                bibdocfile.verify_md5_folder(self.folder, incremental=True),
+                [])
+            self.assertEqual(calculate_md5.call_count, 0)
+
+            self._write(os.path.join(self.folder, 'a.txt'), 'modified')
+            failures = bibdocfile.verify_md5_folder(self.folder,
+                                                    incremental=True)
+            self.assertEqual([failure[0] for failure in failures], ['a.txt'])
+            self.assertEqual(calculate_md5.call_count, 1)
+
+            bibdocfile.verify_md5_folder(self.folder)
+            self.assertEqual(calculate_md5.call_count, 3)
+
+    def test_check_file_mode(self):
+        """bibdocfile - md5 files are readable whatever the umask"""
+        os.remove(os.path.join(self.folder, '.md5'))
+        old_umask = os.umask(0o077)
+        try:
+            bibdocfile.verify_md5_folder(self.folder)
+            self.assertEqual(os.umask(0o077), 0o077)
+        finally:
+            os.umask(old_umask)
+        for filename in ('.md5', bibdocfile.CFG_BIBDOCFILE_MD5_CHECK_FILENAME):
+            mode = os.stat(os.path.join(self.folder, filename)).st_mode
+            self.assertEqual(stat.S_IMODE(mode), 0o644)
+
+    def test_many_folders(self):
+        """bibdocfile - md5 verification of many folders"""
+        folder = self._create_folder('2', {'c.txt': 'ccc'})
+        os.remove(os.path.join(folder, 'c.txt'))
+        results = dict(
+            (name, (failures, error)) for name, failures, error in
+            bibdocfile.verify_md5_folders([self.folder, folder], workers=2))
+        self.assertEqual(results[self.folder], ([], None))
+        self.assertEqual([failure[0] for failure in results[folder][0]],
+                         ['c.txt'])
+        self.assertEqual(results[folder][1], None)
+
+    def test_resume(self):
+        """bibdocfile - interrupted md5 verification is resumed"""
+        folders = [self.folder,
+                   self._create_folder('2', {'c.txt': 'ccc'}),
+                   self._create_folder('3', {'d.txt': 'ddd'})]
+        progress_path = os.path.join(self.tmpdir, 'progress')
+
+        verification = bibdocfile.verify_md5_folders(
+            folders, workers=1, progress_path=progress_path)
+        first = next(verification)[0]
+        verification.close()
+        self.assertEqual(open(progress_path).read(), first + '\n')
+
+        verified = [folder for folder, dummy_failures, dummy_error in
+                    bibdocfile.verify_md5_folders(
+                        folders, workers=1, progress_path=progress_path)]
+        self.assertEqual(sorted(verified + [first]), sorted(folders))
+        self.assertEqual(sorted(open(progress_path).read().split()),
+                         sorted(folders))
+
+
+class BibRecDocsBulkLoadTest(InvenioTestCase):
+
+    """Test the loading of the documents of many records at once."""
+
+    def setUp(self):
+        """Attach a deleted document to a record."""
+        from invenio.legacy.dbquery import run_sql
+        self.tmpdir = mkdtemp()
+        path = os.path.join(self.tmpdir, 'test_get_bibrecdocs.txt')
+        with open(path, 'w') as f:
+            f.write('test')
+        self.deleted = bibdocfile.BibRecDocs(1).add_new_file(
+            path, docname='test_get_bibrecdocs')
+        self.deleted.delete()
+        self.recids = sorted(set(
+            [1] + [row[0] for row in run_sql(
+                "SELECT DISTINCT id_bibrec FROM bibrec_bibdoc")]))
+
+    def tearDown(self):
+        self.deleted.expunge()
+        shutil.rmtree(self.tmpdir)
+
+    def _summary(self, recdocs):
+        """Return a comparable description of the documents of a record."""
+        return sorted(
+            (docname, attachment_type, sorted(str(bibdoc).splitlines()),
+             bibdoc.more_info.get_cache(), sorted(bibdoc.bibrec_types))
+            for docname, (bibdoc, attachment_type) in
+            recdocs.bibdocs.items())
+
+    def _check(self, deleted_too, scan_filesystem):
+        bibrecdocs = bibdocfile.get_bibrecdocs(
+            self.recids, deleted_too=deleted_too,
+            scan_filesystem=scan_filesystem)
+        self.assertEqual(sorted(bibrecdocs), self.recids)
+        for recid in self.recids:
+            self.assertEqual(
+                self._summary(bibrecdocs[recid]),
+                self._summary(bibdocfile.BibRecDocs(
+                    recid, deleted_too=deleted_too)))
+        docids = [bibdoc.id for bibdoc, dummy_type in
+                  bibrecdocs[1].bibdocs.values()]
+        self.assertEqual(self.deleted.id in docids, deleted_too)
+
+    def test_scan_filesystem(self):
+        """bibdocfile - bulk loaded documents listed from the disk"""
+        self._check(deleted_too=False, scan_filesystem=True)
+
+    def test_fsinfo(self):
+        """bibdocfile - bulk loaded documents listed from bibdocfsinfo"""
+        self._check(deleted_too=False, scan_filesystem=False)
+
+    def test_deleted_too(self):
+        """bibdocfile - bulk loaded documents including deleted ones"""
+        self._check(deleted_too=True, scan_filesystem=True)
+        self._check(deleted_too=True, scan_filesystem=False)
+
+
+TEST_SUITE = make_test_suite(Md5FolderVerificationTest,
+                             BibRecDocsBulkLoadTest)
+
+if __name__ == '__main__':
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the bibsched daemon."""
+
+import os
+import shutil
+import time
+from multiprocessing import Process
+from tempfile import mkdtemp
+
+from mock import patch
+
+from invenio.base.wrappers import lazy_import
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+cli = lazy_import('invenio.legacy.bibsched.cli')
+
+
+class NotificationTest(InvenioTestCase):
+
+    """Test the wake up of bibsched on the changes of the task queue."""
+
+    def setUp(self):
+        """Listen for notifications on a temporary socket."""
+        self.tmpdir = mkdtemp()
+        self.patcher = patch('invenio.legacy.bibsched.cli.CFG_BIBSCHED_SOCKET',
+                             os.path.join(self.tmpdir, 'bibsched.sock'))
+        self.patcher.start()
+        # the notifications do not need the rest of the daemon state
+        self.sched = cli.BibSched.__new__(cli.BibSched)
+        self.sched.notifications = self.sched.listen_for_notifications()
+
+    def tearDown(self):
+        self.sched.close_notifications()
+        self.patcher.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def _notify_from_another_process(self):
+        process = Process(target=cli.bibsched_notify)
+        process.start()
+        process.join()
+
+    def test_listen(self):
+        """bibsched - notifications are received on the socket"""
+        self.assertNotEqual(self.sched.notifications, None)
+        self.sched.close_notifications()
+        self.assertFalse(os.path.exists(cli.CFG_BIBSCHED_SOCKET))
+
+    def test_woken_up(self):
+        """bibsched - a change of the queue wakes up the scheduler loop"""
+        self._notify_from_another_process()
+        start = time.time()
+        self.sched.wait_for_changes(timeout=60)
+        self.assertTrue(time.time() - start < 10)
+
+    def test_set_status_wakes_up(self):
+        """bibsched - a status set by another process wakes up bibsched"""
+        with patch('invenio.legacy.bibsched.cli.run_sql'):
+            process = Process(target=cli.bibsched_set_status,
+                              args=(1, 'ABOUT TO STOP'))
+            process.start()
+            process.join()
+        start = time.time()
+        self.sched.wait_for_changes(timeout=60)
+        self.assertTrue(time.time() - start < 10)
+
+    def test_own_notifications_ignored(self):
+        """bibsched - the changes made by bibsched itself are ignored"""
+        cli.bibsched_notify()
+        start = time.time()
+        self.sched.wait_for_changes(timeout=0.5)
+        self.assertTrue(time.time() - start >= 0.5)
+
+    def test_timeout(self):
+        """bibsched - the queue is still polled without notifications"""
+        start = time.time()
+        self.sched.wait_for_changes(timeout=0.5)
+        self.assertTrue(time.time() - start >= 0.5)
+
+    def test_no_listener(self):
+        """bibsched - notifying without a bibsched daemon is harmless"""
+        self.sched.close_notifications()
+        cli.bibsched_notify()
+
+
+TEST_SUITE = make_test_suite(NotificationTest)
+
+if __name__ == '__main__':
+    run_test_suite(TEST_SUITE)
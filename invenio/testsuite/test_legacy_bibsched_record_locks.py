@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the record locks of the bibupload tasks."""
+
+from mock import Mock, patch
+
+from invenio.base.wrappers import lazy_import
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+cli = lazy_import('invenio.legacy.bibsched.cli')
+record_locks = lazy_import('invenio.legacy.bibsched.record_locks')
+
+
+class GetRunnableBibuploadsTest(InvenioTestCase):
+    """Test the choice of the bibupload tasks allowed to run."""
+
+    def test_disjoint_tasks_run_concurrently(self):
+        """bibsched - bibuploads on disjoint records can run together"""
+        locks = {1: frozenset(['recid:1']),
+                 2: frozenset(['recid:2']),
+                 3: frozenset(['recid:3', 'oai:a'])}
+        self.assertEqual(record_locks.get_runnable_bibuploads(
+            [(1, True), (2, False), (3, False)], locks), set([1, 2, 3]))
+
+    def test_conflicting_tasks_keep_their_order(self):
+        """bibsched - bibuploads sharing a record run in order"""
+        locks = {1: frozenset(['recid:1']),
+                 2: frozenset(['recid:1', 'recid:2']),
+                 3: frozenset(['recid:2']),
+                 4: frozenset(['recid:4'])}
+        self.assertEqual(record_locks.get_runnable_bibuploads(
+            [(1, True), (2, False), (3, False), (4, False)], locks),
+            set([1, 4]))
+        self.assertEqual(record_locks.get_runnable_bibuploads(
+            [(2, False), (3, False), (4, False)], locks), set([2, 4]))
+
+    def test_undeclared_tasks_run_alone(self):
+        """bibsched - bibuploads without declared records run alone"""
+        locks = {1: frozenset(['recid:1']),
+                 3: frozenset(['recid:3'])}
+        self.assertEqual(record_locks.get_runnable_bibuploads(
+            [(1, True), (2, False), (3, False)], locks), set([1]))
+        self.assertEqual(record_locks.get_runnable_bibuploads(
+            [(2, False), (3, False)], locks), set([2]))
+        self.assertEqual(record_locks.get_runnable_bibuploads(
+            [(2, True), (3, False)], locks), set([2]))
+
+    def test_new_records_do_not_conflict(self):
+        """bibsched - bibuploads of new records only never conflict"""
+        locks = {1: frozenset(),
+                 2: frozenset()}
+        self.assertEqual(record_locks.get_runnable_bibuploads(
+            [(1, True), (2, False)], locks), set([1, 2]))
+        self.assertTrue(record_locks.are_locks_disjoint(locks[1], locks[2]))
+        self.assertFalse(record_locks.are_locks_disjoint(locks[1], None))
+
+
+class BibSchedTickTest(InvenioTestCase):
+    """Test the handling of the waiting bibupload tasks."""
+
+    def test_bibuploads_handled_once_per_cycle(self):
+        """bibsched - waiting bibuploads handled once per cycle"""
+        bibsched = cli.BibSched.__new__(cli.BibSched)
+        bibsched.cycles_count = 0
+        bibsched.debug = False
+        bibsched.node_active_tasks = []
+        bibsched.node_relevant_waiting_tasks = [
+            Mock(proc=proc) for proc in ('bibupload', 'bibindex',
+                                         'bibupload', 'bibupload')]
+        with patch.multiple(cli.BibSched,
+                            check_debug_mode=Mock(),
+                            check_errors=Mock(),
+                            calculate_rows=Mock(),
+                            wait_for_changes=Mock(),
+                            handle_task=Mock(return_value=False),
+                            handle_bibupload_tasks=Mock(return_value=False)):
+            bibsched.tick()
+            self.assertEqual(bibsched.handle_bibupload_tasks.call_count, 1)
+            self.assertEqual(bibsched.handle_task.call_count, 1)
+            self.assertEqual(bibsched.wait_for_changes.call_count, 1)
+
+
+TEST_SUITE = make_test_suite(GetRunnableBibuploadsTest, BibSchedTickTest)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the progress and status of the bibtasks."""
+
+import os
+import signal
+import time
+from socket import gethostname
+
+from mock import call, patch
+
+from invenio.base.wrappers import lazy_import
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+bibtask = lazy_import('invenio.legacy.bibsched.bibtask')
+cli = lazy_import('invenio.legacy.bibsched.cli')
+
+
+class TaskProgressTest(InvenioTestCase):
+
+    """Test the buffering of the progress of a task."""
+
+    def setUp(self):
+        """Pretend to run task #1, whose progress was just written."""
+        self.patchers = [
+            patch.dict(bibtask._TASK_PARAMS, {'task_id': 1}),
+            patch.dict(bibtask._TASK_PROGRESS, {'pending': None,
+                                                'written': time.time()}),
+            patch('invenio.legacy.bibsched.bibtask.bibsched_notify'),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.patchers.append(patch('invenio.legacy.bibsched.bibtask.run_sql'))
+        self.run_sql = self.patchers[-1].start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+
+    def test_buffered(self):
+        """bibtask - progress is written at most once per interval"""
+        bibtask.task_update_progress('first')
+        bibtask.task_update_progress('second')
+        self.assertEqual(self.run_sql.call_count, 0)
+        bibtask._TASK_PROGRESS['written'] -= \
+            bibtask.CFG_BIBTASK_PROGRESS_UPDATE_INTERVAL
+        bibtask.task_update_progress('third')
+        self.assertEqual(self.run_sql.call_args_list, [
+            call("UPDATE schTASK SET progress=%s where id=%s", ('third', 1))])
+
+    def test_flushed_on_status_change(self):
+        """bibtask - buffered progress is written on a status change"""
+        bibtask.task_update_progress('half way')
+        self.assertEqual(self.run_sql.call_count, 0)
+        bibtask.task_update_status('DONE')
+        self.assertEqual(self.run_sql.call_args_list, [
+            call("UPDATE schTASK SET progress=%s where id=%s",
+                 ('half way', 1)),
+            call("UPDATE schTASK SET status=%s where id=%s", ('DONE', 1))])
+
+        # nothing is left to write afterwards
+        bibtask.task_flush_progress()
+        self.assertEqual(self.run_sql.call_count, 2)
+
+
+class TaskStatusSignalTest(InvenioTestCase):
+
+    """Test the status changes signalled to a running task."""
+
+    def setUp(self):
+        """Run as task #1 on this host, whose status was just read."""
+        self.handlers = dict((signum, signal.getsignal(signum))
+                             for signum in (signal.SIGUSR1, signal.SIGTSTP))
+        signal.signal(signal.SIGUSR1, bibtask.cb_task_sig_status)
+        self.patchers = [
+            patch.dict(bibtask._TASK_STATUS_CHECK, {'signalled': False,
+                                                    'read': time.time()}),
+            patch('invenio.legacy.bibsched.cli.run_sql', return_value=1),
+            patch('invenio.legacy.bibsched.cli.bibsched_get_host',
+                  return_value=gethostname()),
+            patch('invenio.legacy.bibsched.cli.get_task_pid',
+                  return_value=os.getpid()),
+            patch('invenio.legacy.bibsched.cli.bibsched_notify'),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.patchers.append(
+            patch('invenio.legacy.bibsched.bibtask.task_update_status'))
+        self.task_update_status = self.patchers[-1].start()
+        self.patchers.append(
+            patch('invenio.legacy.bibsched.bibtask.task_read_status'))
+        self.task_read_status = self.patchers[-1].start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        for signum, handler in self.handlers.items():
+            signal.signal(signum, handler)
+
+    def test_not_polled(self):
+        """bibtask - the status is not read again without a signal"""
+        bibtask.task_sleep_now_if_required(can_stop_too=True)
+        self.assertEqual(self.task_read_status.call_count, 0)
+
+    def test_stop(self):
+        """bibtask - a stop request is acted on without polling"""
+        self.task_read_status.return_value = 'ABOUT TO STOP'
+        cli.bibsched_set_status(1, 'ABOUT TO STOP', 'RUNNING')
+        self.assertRaises(SystemExit, bibtask.task_sleep_now_if_required,
+                          can_stop_too=True)
+        self.task_update_status.assert_called_with('STOPPED')
+
+    def test_sleep(self):
+        """bibtask - a sleep request is acted on without polling"""
+        self.task_read_status.side_effect = ['ABOUT TO SLEEP', 'CONTINUING']
+        cli.bibsched_set_status(1, 'ABOUT TO SLEEP', 'RUNNING')
+        with patch('invenio.legacy.bibsched.bibtask.os') as mock_os, \
+                patch('invenio.legacy.bibsched.bibtask.time.sleep'):
+            bibtask.task_sleep_now_if_required()
+        mock_os.kill.assert_called_with(mock_os.getpid(), signal.SIGSTOP)
+        self.assertEqual(self.task_update_status.call_args_list,
+                         [call('SLEEPING'), call('CONTINUING')])
+
+
+TEST_SUITE = make_test_suite(TaskProgressTest, TaskStatusSignalTest)
+
+if __name__ == '__main__':
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the bibupload engine."""
+
+import os
+import shutil
+from tempfile import mkdtemp
+
+import pkg_resources
+from mock import patch
+
+from invenio.base.wrappers import lazy_import
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+engine = lazy_import('invenio.legacy.bibupload.engine')
+dbquery = lazy_import('invenio.legacy.dbquery')
+bibtask = lazy_import('invenio.legacy.bibsched.bibtask')
+
+
+class BibxxxBulkInsertionTest(InvenioTestCase):
+
+    """Test the insertion of the bibxxx rows of a record at once."""
+
+    # records without metadata
+    recids = (99999998, 99999999)
+    tables = {'bib99x': '999T1%', 'bib98x': '989T1%'}
+
+    def setUp(self):
+        """Store a value before the bulk insertion."""
+        self._clean()
+        self.existing = engine.insert_record_bibxxx('999T1a', 'existing')
+
+    def tearDown(self):
+        self._clean()
+
+    def _clean(self):
+        for table_name, tag in self.tables.items():
+            dbquery.run_sql("""DELETE FROM bibrec_%s
+                               WHERE id_bibrec IN (%%s, %%s)""" % table_name,
+                            self.recids)
+            dbquery.run_sql("DELETE FROM %s WHERE tag LIKE %%s" % table_name,
+                            (tag, ))
+
+    def _bibxxx_rows(self):
+        return dict((table_name, sorted(dbquery.run_sql(
+            "SELECT id, tag, value FROM %s WHERE tag LIKE %%s" % table_name,
+            (tag, )))) for table_name, tag in self.tables.items())
+
+    def test_same_rows(self):
+        """bibupload - bulk insertion of bibxxx as one by one insertion"""
+        tag_values = [('999T1a', 'existing'),
+                      ('999T1a', 'Existing'),
+                      ('999T1b', 'existing'),
+                      ('999T1a', 'new'),
+                      ('999t1a', 'new'),
+                      ('989T1a', 'new'),
+                      ('999T1a', 'existing'),
+                      ('999T1a', 'new')]
+        ids = engine.insert_record_bibxxx_many(tag_values)
+        self.assertEqual(ids[('999T1a', 'existing')], self.existing)
+        self.assertEqual(ids[('999T1a', 'new')], ids[('999t1a', 'new')])
+        self.assertEqual(len(set(ids.values())), 5)
+
+        # one by one insertion finds every row written by the bulk insertion
+        rows = self._bibxxx_rows()
+        for tag, value in tag_values:
+            self.assertEqual(engine.insert_record_bibxxx(tag, value),
+                             ids[(tag, value)])
+        self.assertEqual(self._bibxxx_rows(), rows)
+        self.assertEqual(len(rows['bib99x']), 4)
+        self.assertEqual(len(rows['bib98x']), 1)
+
+        entries = [(table_name, id_bibxxx, field_number)
+                   for field_number, (table_name, id_bibxxx) in
+                   enumerate(ids[pair] for pair in tag_values)]
+        single, bulk = self.recids
+        bulk_rows = {}
+        for table_name, id_bibxxx, field_number in entries:
+            engine.insert_record_bibrec_bibxxx(table_name, id_bibxxx,
+                                               field_number, single)
+            bulk_rows.setdefault(table_name, []).append(
+                (bulk, id_bibxxx, field_number))
+        for table_name, rows in bulk_rows.items():
+            engine.insert_record_bibrec_bibxxx_many(table_name, rows)
+        for table_name in self.tables:
+            query = """SELECT id_bibxxx, field_number FROM bibrec_%s
+                       WHERE id_bibrec=%%s""" % table_name
+            self.assertEqual(sorted(dbquery.run_sql(query, (bulk, ))),
+                             sorted(dbquery.run_sql(query, (single, ))))
+
+
+class MarcStreamTest(InvenioTestCase):
+
+    """Test the reading of the MARCXML input files."""
+
+    marcxml = """<collection>
+<record><controlfield tag="001">1</controlfield></record>
+<record><controlfield tag="001">2</controlfield></record>
+<record><controlfield tag="001">3</controlfield>
+<datafield tag="245" ind1=" " ind2=" "><subfield code="a">Tit"""
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _open(self, marcxml):
+        path = os.path.join(self.tmpdir, 'input.xml')
+        with open(path, 'w') as f:
+            f.write(marcxml)
+        return engine.open_marc_stream(path)
+
+    def test_truncated_file(self):
+        """bibupload - truncated MARCXML files are rejected"""
+        for workers in (1, 2):
+            marc_stream = self._open(self.marcxml)
+            try:
+                self.assertRaises(bibtask.RecoverableError,
+                                  engine.iter_marc_stream_records,
+                                  marc_stream, workers)
+            finally:
+                marc_stream.close()
+
+    def test_complete_file(self):
+        """bibupload - records of a complete MARCXML file"""
+        marc_stream = self._open(self.marcxml + '</subfield>'
+                                 '</datafield></record></collection>')
+        try:
+            records = list(engine.iter_marc_stream_records(marc_stream))
+        finally:
+            marc_stream.close()
+        self.assertEqual([record['001'][0][3] for record in records],
+                         ['1', '2', '3'])
+        self.assertEqual(records[2]['245'][0][0], [('a', 'Tit')])
+
+    def test_workers(self):
+        """bibupload - records parsed by workers as by a single process"""
+        path = pkg_resources.resource_filename(
+            'invenio.testsuite', os.path.join('data',
+                                              'demo_record_marc_data.xml'))
+        records = {}
+        for workers in (1, 3):
+            marc_stream = engine.open_marc_stream(path)
+            try:
+                with patch('invenio.legacy.bibupload.engine.'
+                           'CFG_BIBUPLOAD_WORKERS_CHUNK_SIZE', 7):
+                    records[workers] = list(engine.iter_marc_stream_records(
+                        marc_stream, workers))
+            finally:
+                marc_stream.close()
+        self.assertEqual(len(records[1]), 142)
+        self.assertEqual(records[3], records[1])
+
+
+TEST_SUITE = make_test_suite(BibxxxBulkInsertionTest, MarcStreamTest)
+
+if __name__ == '__main__':
+    run_test_suite(TEST_SUITE)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Unit tests for the data cacher."""
+
+from invenio.base.wrappers import lazy_import
+from invenio.testsuite import make_test_suite, run_test_suite, InvenioTestCase
+
+data_cacher = lazy_import('invenio.legacy.miscutil.data_cacher')
+
+
+class DataCacherInvalidationTest(InvenioTestCase):
+
+    """Test the invalidation of the data cachers."""
+
+    def setUp(self):
+        """Create a data cacher counting its fillings and verifications."""
+        self.fillings = []
+        self.verifications = []
+
+        def cache_filler():
+            self.fillings.append(1)
+            return {'fillings': len(self.fillings)}
+
+        def timestamp_verifier():
+            self.verifications.append(1)
+            return "0000-00-00 00:00:00"
+
+        self.cacher = data_cacher.DataCacher(
+            cache_filler, timestamp_verifier, ('test_data_cacher', ))
+
+    def _new_request(self):
+        """Forget the generations read during the current request."""
+        from flask import g
+        if hasattr(g, 'data_cacher_generations'):
+            del g.data_cacher_generations
+
+    def test_published_change(self):
+        """data cacher - cache recreated when a change is published"""
+        self._new_request()
+        self.cacher.recreate_cache_if_needed()
+        self.assertEqual(self.cacher.cache, {'fillings': 1})
+        self.assertEqual(self.verifications, [])
+
+        data_cacher.publish_data_change('test_data_cacher')
+        self._new_request()
+        self.cacher.recreate_cache_if_needed()
+        self.assertEqual(self.cacher.cache, {'fillings': 2})
+        self.cacher.recreate_cache_if_needed()
+        self.assertEqual(self.cacher.cache, {'fillings': 2})
+
+    def test_generation_read_once_per_request(self):
+        """data cacher - published changes are seen by the next request"""
+        self._new_request()
+        self.cacher.recreate_cache_if_needed()
+        data_cacher.publish_data_change('test_data_cacher')
+        self.cacher.recreate_cache_if_needed()
+        self.assertEqual(self.cacher.cache, {'fillings': 1})
+        self._new_request()
+        self.cacher.recreate_cache_if_needed()
+        self.assertEqual(self.cacher.cache, {'fillings': 2})
+
+    def test_periodic_verification(self):
+        """data cacher - timestamp still verified from time to time"""
+        self._new_request()
+        self.cacher.verified_at -= \
+            data_cacher.CFG_DATACACHER_VERIFY_INTERVAL + 1
+        self.cacher.recreate_cache_if_needed()
+        self.assertEqual(self.verifications, [1])
+        self.cacher.recreate_cache_if_needed()
+        self.assertEqual(self.verifications, [1])
+
+
+TEST_SUITE = make_test_suite(DataCacherInvalidationTest)
+
+if __name__ == "__main__":
+    run_test_suite(TEST_SUITE)